@@ -4,22 +4,64 @@ Beehiiv Newsletter Analytics
 Puxa dados da API do Beehiiv e gera um dashboard interativo HTML.
 
 Uso:
-    python beehiiv_analytics.py
+    python beehiiv_analytics.py                              # uma publicação (BEEHIIV_PUB_ID)
+    python beehiiv_analytics.py --pubs pub_a,pub_b           # lote: várias publicações em paralelo
+    python beehiiv_analytics.py --config publicacoes.json    # lote a partir de um arquivo
 
 Requisitos:
     - Python 3.7+
     - Nenhuma dependência externa (usa apenas bibliotecas padrão)
+    - Opcional: NumPy, para agregar bases grandes de subscribers mais rápido
 
 Autor: Gerado para Rony via Claude
 """
 
-import urllib.request
+import argparse
+import calendar
+import contextvars
+import cProfile
+import gzip
+import hashlib
+import heapq
+import http.client
 import json
 import os
+import pstats
+import random
+import re
+import shutil
+import sqlite3
 import sys
+import threading
 import time
+import tracemalloc
+import urllib.parse
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from html import escape
+from collections import Counter, defaultdict, deque
+from itertools import accumulate, islice
+from operator import attrgetter, itemgetter
+
+try:
+    import numpy as np  # opcional: acelera as agregações de subscribers
+except ImportError:
+    np = None
+
+try:
+    import orjson  # opcional: serialização/parsing de JSON mais rápidos
+except ImportError:
+    orjson = None
+
+try:
+    import resource  # só em Unix: pico de memória (RSS) no relatório de execução
+except ImportError:
+    resource = None
 
 # ============================================================
 # CONFIGURAÇÃO — Edite aqui se necessário
@@ -30,53 +72,632 @@ OUTPUT_FILE = "newsletter_dashboard.html"
 # Se a API não retornar total_results, usa este valor como fallback.
 # Atualize com o número real do seu painel do Beehiiv.
 TOTAL_SUBSCRIBERS_OVERRIDE = 2_000_000
+# Nº de páginas buscadas em paralelo (1 = sequencial, como antes).
+FETCH_WORKERS = int(os.environ.get("BEEHIIV_FETCH_WORKERS", "4"))
+# Limite de requisições por minuto (a API do Beehiiv aceita ~180/min) e
+# teto de requisições por execução (0 = sem teto).
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("BEEHIIV_RATE_LIMIT", "150"))
+MAX_REQUESTS_PER_RUN = int(os.environ.get("BEEHIIV_MAX_REQUESTS", "2000"))
+# Cache local de posts: posts publicados há mais de STATS_FREEZE_DAYS dias
+# têm stats praticamente congeladas e vêm do cache em vez da API.
+# BEEHIIV_FULL_SYNC=1 ignora o cache e baixa o histórico inteiro.
+POST_CACHE_FILE = "newsletter_posts_cache.jsonl"
+STATS_FREEZE_DAYS = int(os.environ.get("BEEHIIV_STATS_FREEZE_DAYS", "21"))
+FULL_SYNC = os.environ.get("BEEHIIV_FULL_SYNC") == "1"
+# Export completo de subscribers (opt-in): percorre toda a base via cursor,
+# grava NDJSON comprimido em disco e retoma de onde parou se interrompido
+# (inclusive ao esgotar BEEHIIV_MAX_REQUESTS — a execução seguinte continua).
+# O export para SUBSCRIBER_EXPORT_RESERVE requisições antes do teto, que
+# ficam para a amostragem de que a execução depende enquanto ele não termina.
+SUBSCRIBERS_FULL_EXPORT = os.environ.get("BEEHIIV_SUBSCRIBERS_FULL_EXPORT") == "1"
+SUBSCRIBER_EXPORT_RESERVE = int(os.environ.get("BEEHIIV_SUBSCRIBER_EXPORT_RESERVE", "300"))
+SUBSCRIBER_EXPORT_DIR = "subscribers_export"
+SUBSCRIBER_EXPORT_MAX_AGE_DAYS = int(os.environ.get("BEEHIIV_SUBSCRIBER_EXPORT_MAX_AGE_DAYS", "7"))
+EXPORT_PART_RECORDS = 100_000
+# Crescimento mensal exato (opt-in): acha, por busca binária nas páginas da
+# listagem order_by=created, quantos subscribers existiam no início de cada
+# mês. Os limites de mês já calculados ficam em GROWTH_CACHE_FILE.
+EXACT_GROWTH = os.environ.get("BEEHIIV_EXACT_GROWTH") == "1"
+GROWTH_CACHE_FILE = "subscriber_growth_cache.json"
+# Taxa de ativos por amostragem estratificada de páginas aleatórias: sorteia
+# páginas em STATUS_STRATA faixas da base até a margem (IC 95%) ficar abaixo
+# de STATUS_TARGET_MARGIN pontos percentuais ou atingir STATUS_MAX_PAGES
+# páginas (0 = desativa e usa só a amostra de recentes/antigos).
+STATUS_STRATA = int(os.environ.get("BEEHIIV_STATUS_STRATA", "8"))
+STATUS_TARGET_MARGIN = float(os.environ.get("BEEHIIV_STATUS_MARGIN", "2.0"))
+STATUS_MAX_PAGES = int(os.environ.get("BEEHIIV_STATUS_MAX_PAGES", "48"))
+# Fração mínima da base ao alcance da paginação por offset para estimar
+# (abaixo disso fica a amostra de recentes/antigos).
+STATUS_MIN_COVERAGE = float(os.environ.get("BEEHIIV_STATUS_MIN_COVERAGE", "0.8"))
+# Relatório de execução (JSON ao lado do dashboard) e profiling opcional:
+# BEEHIIV_PROFILE=cprofile (salva .prof + top funções) ou tracemalloc (pico por etapa).
+PROFILE_MODE = os.environ.get("BEEHIIV_PROFILE", "").lower()
+# "inline": dados embutidos no HTML (arquivo único). "split": HTML estático +
+# payload JSON separado (e pré-comprimido .gz), cacheável pelo navegador.
+OUTPUT_MODE = os.environ.get("BEEHIIV_OUTPUT_MODE", "inline").lower()
+# Histórico de snapshots diários (stats por post + totais de subscribers) em
+# SQLite, só acrescentado a cada execução ("" desativa). Com
+# BEEHIIV_HISTORY_COMPACT=1 a execução também compacta o histórico: remove
+# snapshots repetidos e, além de HISTORY_DAILY_DAYS, guarda um por semana.
+HISTORY_DB = os.environ.get("BEEHIIV_HISTORY_DB", "newsletter_history.sqlite")
+HISTORY_COMPACT = os.environ.get("BEEHIIV_HISTORY_COMPACT") == "1"
+HISTORY_DAILY_DAYS = int(os.environ.get("BEEHIIV_HISTORY_DAILY_DAYS", "90"))
+# Cache em disco das respostas da API (ETag/Last-Modified + TTL por rota,
+# ver HTTP_CACHE_TTLS); "" desativa. BEEHIIV_OFFLINE=1 responde do cache,
+# sem rede (útil em desenvolvimento) — subscribers não são guardados e ficam
+# indisponíveis offline.
+HTTP_CACHE_DIR = os.environ.get("BEEHIIV_HTTP_CACHE", "http_cache")
+HTTP_CACHE_MAX_MB = int(os.environ.get("BEEHIIV_HTTP_CACHE_MB", "200"))
+OFFLINE = os.environ.get("BEEHIIV_OFFLINE") == "1"
+# Máximo de pontos por série nos gráficos por edição (open/click/CTOR/unsub);
+# acima disso a série é reduzida com LTTB. ~1 ponto a cada 4px num gráfico de 800px
+CHART_MAX_POINTS = int(os.environ.get("BEEHIIV_CHART_POINTS", "200"))
+# Quantos links entram no ranking de cada período
+LINK_TOP_K = int(os.environ.get("BEEHIIV_LINK_TOP_K", "15"))
+# Períodos do filtro do dashboard (dias ou "all"), na ordem do seletor.
+# Os agregados de cada período são pré-calculados na geração. Entradas
+# inválidas (nem "all" nem um nº de dias > 0) são ignoradas com um aviso.
+def _parse_periods(raw):
+    periods, invalid = [], []
+    for item in (p.strip() for p in raw.split(",")):
+        if not item:
+            continue
+        if item.lower() == "all":
+            period = "all"
+        elif item.isdigit() and int(item) > 0:
+            period = str(int(item))
+        else:
+            invalid.append(item)
+            continue
+        if period not in periods:
+            periods.append(period)
+    if invalid:
+        print(f"⚠️  BEEHIIV_PERIODS: ignorando {', '.join(map(repr, invalid))} (use nº de dias, ex. 30, ou all)")
+    return periods or ["all"]
+
+
+PERIODS = _parse_periods(os.environ.get("BEEHIIV_PERIODS", "all,30,90,180,365"))
+PERIOD_LABELS = {"all": "Todo o período", "30": "Últimos 30 dias", "90": "Últimos 90 dias",
+                 "180": "Últimos 6 meses", "365": "Último ano"}
+# Debug: guarda o stats cru do primeiro post e mostra no dashboard
+# ("Ver campos brutos da API"). Desligado, nenhum payload cru é retido.
+DEBUG_RAW_STATS = os.environ.get("BEEHIIV_DEBUG_RAW_STATS") == "1"
 # ============================================================
 
-BASE_URL = "https://api.beehiiv.com/v2"
+BASE_URL = os.environ.get("BEEHIIV_BASE_URL", "https://api.beehiiv.com/v2")
 HEADERS = {
     "Authorization": f"Bearer {API_KEY}",
     "Content-Type": "application/json",
 }
 
+# Publicação em processamento ({"id", "name", "dir"}); sem valor, PUB_ID e a
+# pasta do script. No modo lote cada thread define a sua, e as threads de
+# iter_pages herdam o contexto (copy_context), como o CURRENT_REPORT.
+CURRENT_PUB = contextvars.ContextVar("beehiiv_publication", default=None)
+
+
+def _pub_id():
+    pub = CURRENT_PUB.get()
+    return pub["id"] if pub else PUB_ID
+
+
+class HTTPConnectionPool:
+    """Pool de conexões keep-alive (http.client) reaproveitadas entre chamadas.
+
+    Seguro para várias threads: cada requisição pega uma conexão ociosa (ou
+    abre uma nova) e a devolve ao final, então o handshake TCP+TLS é pago uma
+    vez por conexão e não por página. Respostas gzip são descomprimidas.
+    """
+
+    def __init__(self, base_url, max_idle=8, timeout=60):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.connections_opened += 1
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout), False
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, headers=None):
+        """Executa a requisição e retorna (status, headers, corpo em bytes)."""
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip")
+        headers.setdefault("Connection", "keep-alive")
+
+        while True:
+            conn, reused = self._connect()
+            try:
+                conn.request(method, self.base_path + path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine):
+                conn.close()
+                if reused:
+                    # Conexão ociosa fechada pelo servidor: tenta outra
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return resp.status, resp.headers, body
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+HTTP_POOL = HTTPConnectionPool(BASE_URL, max_idle=max(FETCH_WORKERS, 4))
+
+
+def _header_seconds(headers, *names):
+    """Lê um header numérico (segundos, epoch ou data HTTP) como float."""
+    for name in names:
+        raw = headers.get(name) if headers is not None else None
+        if raw is None:
+            continue
+        try:
+            # Números podem vir em lista ("10, 60;w=60"): vale o primeiro
+            return float(raw.split(",")[0].split(";")[0])
+        except ValueError:
+            pass
+        try:
+            # Data HTTP ("Wed, 21 Oct 2015 07:28:00 GMT") tem vírgula: usa o valor inteiro
+            return parsedate_to_datetime(raw.strip()).timestamp() - time.time()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class RateLimiter:
+    """Token bucket compartilhado por todas as threads que chamam api_get.
+
+    Libera `rate_per_minute` requisições por minuto com rajadas de até
+    `burst`, respeita RateLimit-Remaining/RateLimit-Reset/Retry-After quando
+    a API os envia e corta a execução ao atingir `budget` requisições.
+    """
+
+    def __init__(self, rate_per_minute, burst=10, budget=0):
+        self.rate = max(rate_per_minute, 1) / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.budget = budget
+        self.used = 0
+        self.blocked_until = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Espera por um token; retorna False se o orçamento da execução acabou."""
+        while True:
+            with self._lock:
+                if self.budget and self.used >= self.budget:
+                    return False
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+                self._last = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.used += 1
+                        return True
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, headers):
+        """Ajusta o bucket pelos headers de rate limit da resposta."""
+        remaining = _header_seconds(headers, "RateLimit-Remaining", "X-RateLimit-Remaining")
+        reset = _header_seconds(headers, "RateLimit-Reset", "X-RateLimit-Reset")
+        retry_after = _header_seconds(headers, "Retry-After")
+        with self._lock:
+            now = time.monotonic()
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and reset is not None:
+                    # Reset pode vir em segundos ou como epoch
+                    delay = reset - time.time() if reset > 1e9 else reset
+                    self.blocked_until = max(self.blocked_until, now + max(delay, 0))
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + max(retry_after, 0))
+
+    def backoff(self, attempt, headers=None):
+        """Tempo de espera antes de uma nova tentativa (Retry-After ou exponencial com jitter).
+
+        Se a resposta trouxe Retry-After, é ele que decide, mesmo 0 ou uma
+        data já passada; a pausa exponencial só entra quando o header não
+        veio. A pausa vale para todas as threads, não só a que recebeu o erro.
+        """
+        retry_after = _header_seconds(headers, "Retry-After")
+        self.observe(headers)
+        if retry_after is not None:
+            return max(retry_after, 0.0)
+        with self._lock:
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            if wait <= 0:
+                wait = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.blocked_until = now + wait
+            return wait
+
+
+RATE_LIMITER = RateLimiter(RATE_LIMIT_PER_MINUTE, burst=max(FETCH_WORKERS, 10), budget=MAX_REQUESTS_PER_RUN)
+
+
+# ============================================================
+# INSTRUMENTAÇÃO — tempo, requisições e memória por etapa
+# ============================================================
+def _endpoint_key(endpoint):
+    """Endpoint sem query e sem ids (agrupa as métricas por rota)."""
+    return re.sub(r"\b(pub|post|sub)_[0-9A-Za-z-]+", r"{\1_id}", endpoint.split("?")[0])
+
+
+def _peak_rss_mb():
+    """Pico de memória residente do processo até agora (MB), se disponível."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RunReport:
+    """Métricas de uma execução, por etapa e por endpoint.
+
+    api_get registra cada requisição no relatório ativo (CURRENT_REPORT),
+    inclusive quando chamado das threads de iter_pages; stage() mede tempo,
+    requisições, bytes e retries de cada etapa do main. ru_maxrss é o pico
+    do processo inteiro até ali (process_peak_rss_mb); o que cabe à etapa é
+    quanto ela elevou esse pico (peak_rss_growth_mb).
+    """
+
+    COUNTERS = ("requests", "bytes", "retries", "errors", "cache_hits", "revalidated")
+
+    def __init__(self, profile=""):
+        self.started_at = datetime.now(timezone.utc)
+        self.profile = profile
+        self.stages = []
+        self.totals = dict.fromkeys(self.COUNTERS, 0)
+        self.endpoints = defaultdict(lambda: dict(dict.fromkeys(self.COUNTERS, 0), seconds=0.0))
+        self.extra = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds=0.0, **counts):
+        with self._lock:
+            entry = self.endpoints[_endpoint_key(endpoint)]
+            entry["seconds"] += seconds
+            for key, value in counts.items():
+                entry[key] += value
+                self.totals[key] += value
+
+    @contextmanager
+    def stage(self, name):
+        before = dict(self.totals)
+        rss_before = _peak_rss_mb()
+        tracing = tracemalloc.is_tracing()
+        if tracing and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {"stage": name, "seconds": round(time.perf_counter() - t0, 3)}
+            entry.update((key, self.totals[key] - before[key]) for key in self.COUNTERS)
+            rss = _peak_rss_mb()
+            entry["process_peak_rss_mb"] = rss
+            entry["peak_rss_growth_mb"] = round(rss - rss_before, 1) if rss is not None else None
+            if tracing:
+                entry["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            self.stages.append(entry)
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "profile": self.profile or None,
+            "totals": dict(self.totals, seconds=round(sum(s["seconds"] for s in self.stages), 3),
+                           process_peak_rss_mb=_peak_rss_mb()),
+            "stages": self.stages,
+            "endpoints": {k: dict(v, seconds=round(v["seconds"], 3)) for k, v in sorted(self.endpoints.items())},
+            **self.extra,
+        }
+
+    def print_summary(self):
+        print("\n⏱️  Tempo por etapa:")
+        for s in self.stages:
+            rss = (f"   pico do processo {s['process_peak_rss_mb']} MB (+{s['peak_rss_growth_mb']})"
+                   if s["process_peak_rss_mb"] is not None else "")
+            cache = f"   cache {s['cache_hits']}+{s['revalidated']} (304)" if s["cache_hits"] or s["revalidated"] else ""
+            print(f"    {s['stage']:<22}{s['seconds']:>8.2f}s {s['requests']:>6} req "
+                  f"{s['bytes'] / 2**20:>8.2f} MB {s['retries']:>3} retries{rss}{cache}")
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+CURRENT_REPORT = contextvars.ContextVar("beehiiv_run_report", default=None)
+
+
+def _report_request(endpoint, seconds=0.0, **counts):
+    """Registra uma requisição no relatório ativo (se houver)."""
+    report = CURRENT_REPORT.get()
+    if report is not None:
+        report.record(endpoint, seconds, **counts)
+
+
+# ============================================================
+# CACHE DE RESPOSTAS — requisições condicionais e replay offline
+# ============================================================
+# TTL (segundos) por rota, primeira regra que casar com o caminho + query:
+# dentro do TTL a resposta sai do cache sem requisição; depois dele (ou com
+# TTL 0) a requisição leva If-None-Match/If-Modified-Since e um 304 reaproveita
+# o corpo guardado. None = não guarda: as listagens de subscribers trazem
+# emails/PII (o diretório do cache vai para o cache do Actions) e, por offset,
+# mudam a cada dia — quase nunca dariam 304.
+HTTP_CACHE_TTLS = [
+    (r"/subscriptions", None),
+    (r"/posts", 0),
+]
+
+
+class ResponseCache:
+    """Respostas da API em disco, um arquivo gzip por URL+params.
+
+    Cada arquivo tem uma linha JSON de metadados (URL, quando foi guardado,
+    ETag, Last-Modified) seguida do corpo. Arquivos usados são "tocados"
+    (mtime), e evict() remove os menos usados até caber em `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes, ttls):
+        base = os.path.dirname(os.path.abspath(__file__))
+        self.directory = os.path.join(base, directory)
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+
+    def ttl(self, path):
+        """TTL da rota (None = não guardar)."""
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return 0
+
+    def _file(self, path):
+        digest = hashlib.sha256((BASE_URL + path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".gz")
+
+    def get(self, path):
+        file_path = self._file(path)
+        try:
+            with gzip.open(file_path, "rb") as f:
+                meta = json.loads(f.readline())
+                meta["body"] = f.read()
+        except (OSError, ValueError, EOFError):
+            return None
+        try:
+            os.utime(file_path)
+        except OSError:
+            pass
+        return meta
+
+    def put(self, path, headers, body, validators=None):
+        """Guarda o corpo com os validadores da resposta (ou os de `validators`)."""
+        validators = validators or {}
+        meta = {
+            "url": path,
+            "stored_at": time.time(),
+            "etag": headers.get("ETag") or validators.get("etag"),
+            "last_modified": headers.get("Last-Modified") or validators.get("last_modified"),
+        }
+        file_path = self._file(path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=5) as f:
+            f.write(json.dumps(meta).encode("utf-8") + b"\n")
+            f.write(body)
+        os.replace(tmp_path, file_path)
+
+    def evict(self):
+        """Remove os arquivos menos usados até o cache caber no limite. Retorna quantos."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, file_path))
+        size = sum(e[1] for e in entries)
+        removed = 0
+        for _, file_size, file_path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            size -= file_size
+            removed += 1
+        return removed
+
+
+RESPONSE_CACHE = ResponseCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_MB * 2**20, HTTP_CACHE_TTLS) if HTTP_CACHE_DIR else None
+
 
 def api_get(endpoint, params=None, retries=3):
-    """Faz GET na API do Beehiiv com retry e backoff exponencial."""
-    url = f"{BASE_URL}{endpoint}"
+    """Faz GET na API do Beehiiv com rate limit, retry e backoff com jitter.
+
+    Com RESPONSE_CACHE, respostas dentro do TTL não geram requisição e as
+    demais são revalidadas (304 reaproveita o corpo guardado); em modo
+    OFFLINE só o cache é consultado.
+    """
+    path = endpoint
     if params:
         query = "&".join(f"{k}={v}" for k, v in params.items() if v is not None)
         if query:
-            url += f"?{query}"
+            path += f"?{query}"
+
+    ttl = RESPONSE_CACHE.ttl(path) if RESPONSE_CACHE else None
+    cached = RESPONSE_CACHE.get(path) if ttl is not None else None
+    if cached and (OFFLINE or time.time() - cached["stored_at"] < ttl):
+        _report_request(endpoint, cache_hits=1)
+        return json_loads(cached["body"])
+    if OFFLINE:
+        print(f"  OFFLINE: sem resposta em cache para {path}")
+        _report_request(endpoint, errors=1)
+        return None
+    headers = HEADERS
+    if cached:
+        headers = dict(HEADERS)
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
 
     for attempt in range(1, retries + 1):
-        req = urllib.request.Request(url, headers=HEADERS)
-        try:
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                return json.loads(resp.read())
-        except urllib.error.HTTPError as e:
-            body = e.read().decode()
-            if e.code in (429, 500, 502, 503, 504) and attempt < retries:
-                wait = 2 ** attempt
-                print(f"  ⚠️  API [{e.code}] tentativa {attempt}/{retries}, aguardando {wait}s...", flush=True)
-                time.sleep(wait)
-                continue
-            print(f"  ERRO API [{e.code}]: {body[:300]}")
+        if not RATE_LIMITER.acquire():
+            print(f"  ERRO: orçamento de {RATE_LIMITER.budget} requisições por execução esgotado")
+            _report_request(endpoint, errors=1)
             return None
-        except (urllib.error.URLError, TimeoutError, OSError) as e:
+        t0 = time.perf_counter()
+        try:
+            status, resp_headers, body = HTTP_POOL.request("GET", path, headers=headers)
+        except (http.client.HTTPException, OSError) as e:
+            _report_request(endpoint, time.perf_counter() - t0, requests=1)
             if attempt < retries:
-                wait = 2 ** attempt
-                print(f"  ⚠️  Erro de rede tentativa {attempt}/{retries}, aguardando {wait}s...", flush=True)
+                _report_request(endpoint, retries=1)
+                wait = RATE_LIMITER.backoff(attempt)
+                print(f"  ⚠️  Erro de rede tentativa {attempt}/{retries}, aguardando {wait:.1f}s...", flush=True)
                 time.sleep(wait)
                 continue
             print(f"  ERRO: {e}")
+            _report_request(endpoint, errors=1)
+            return None
+
+        wire_bytes = int(resp_headers.get("Content-Length") or len(body))
+        _report_request(endpoint, time.perf_counter() - t0, requests=1, bytes=wire_bytes)
+        if status in (429, 500, 502, 503, 504) and attempt < retries:
+            _report_request(endpoint, retries=1)
+            wait = RATE_LIMITER.backoff(attempt, resp_headers)
+            print(f"  ⚠️  API [{status}] tentativa {attempt}/{retries}, aguardando {wait:.1f}s...", flush=True)
+            time.sleep(wait)
+            continue
+        RATE_LIMITER.observe(resp_headers)
+        if status == 304 and cached:
+            # Não mudou: devolve o corpo guardado. Com TTL 0 o arquivo fica como
+            # está (get() já atualizou o mtime); com TTL > 0 é regravado para
+            # renovar stored_at
+            if ttl:
+                RESPONSE_CACHE.put(path, resp_headers, cached["body"], validators=cached)
+            _report_request(endpoint, revalidated=1)
+            return json_loads(cached["body"])
+        if status >= 400:
+            print(f"  ERRO API [{status}]: {body.decode(errors='replace')[:300]}")
+            _report_request(endpoint, errors=1)
             return None
-        except Exception as e:
+        try:
+            data = json_loads(body)
+        except ValueError as e:
             print(f"  ERRO: {e}")
+            _report_request(endpoint, errors=1)
             return None
+        if ttl is not None:
+            RESPONSE_CACHE.put(path, resp_headers, body)
+        return data
 
 
-def fetch_all_pages(endpoint, params=None, label="items"):
-    """Busca todas as páginas de um endpoint paginado (offset + cursor)."""
-    all_data = []
+def _page_result(endpoint, params, page):
+    """Busca uma única página (usado pelas threads de iter_pages)."""
+    page_params = dict(params)
+    page_params.pop("cursor", None)
+    page_params["page"] = str(page)
+    return api_get(endpoint, page_params)
+
+
+def iter_pages(endpoint, params, pages, workers=None, label="items"):
+    """Busca páginas com números conhecidos em paralelo, em ordem.
+
+    Mantém até `workers` requisições em voo (janela deslizante) e entrega
+    (página, resultado, lote) na ordem das páginas, independente da ordem
+    de chegada. Para na primeira página vazia ou curta, ou quando quem
+    consome para no meio: o que ainda está na fila é cancelado, mas as
+    requisições já em voo (até `workers`) terminam antes de retornar e
+    contam no orçamento do RATE_LIMITER; só o resultado é descartado.
+    """
+    workers = max(1, workers or FETCH_WORKERS)
+    limit = int(params.get("limit", "50"))
+    pages = iter(pages)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+
+        def submit_next():
+            page = next(pages, None)
+            if page is not None:
+                in_flight.append((page, pool.submit(contextvars.copy_context().run, _page_result, endpoint, params, page)))
+
+        for _ in range(workers):
+            submit_next()
+
+        try:
+            while in_flight:
+                page, future = in_flight.popleft()
+                result = future.result()
+                batch = result.get("data") if result else None
+                if not batch:
+                    print(f"  Página {page}: {'vazio' if result else 'sem dados'}")
+                    break
+                print(f"  Página {page}: {len(batch)} {label}")
+                yield page, result, batch
+                if len(batch) < limit:
+                    break
+                submit_next()
+        finally:
+            # Também no break de quem consome (GeneratorExit no yield)
+            for _, future in in_flight:
+                future.cancel()
+
+
+def iter_all_pages(endpoint, params=None, label="items"):
+    """Gera os lotes de todas as páginas de um endpoint paginado (offset + cursor).
+
+    Com FETCH_WORKERS > 1 e sem cursor na resposta, as páginas 2..99 são
+    buscadas em paralelo (o total de páginas, quando informado pela API,
+    evita requisições especulativas além do fim). Quem consome pode parar
+    no meio (break): as páginas já em voo terminam (e contam no orçamento),
+    mas o resultado é descartado.
+    """
+    fetched = 0
     page = 1
     cursor = None
     use_cursor = False
@@ -105,8 +726,9 @@ def fetch_all_pages(endpoint, params=None, label="items"):
             print("vazio")
             break
 
-        all_data.extend(batch)
+        fetched += len(batch)
         print(f"{len(batch)} {label}")
+        yield batch
 
         limit = int(params.get("limit", "50"))
 
@@ -119,13 +741,36 @@ def fetch_all_pages(endpoint, params=None, label="items"):
         if next_cursor:
             cursor = next_cursor
             use_cursor = True
+        elif use_cursor:
+            # Já em cursor e a resposta não traz o próximo: fim da lista
+            # (repetir o cursor anterior buscaria a mesma página para sempre)
+            break
         elif page >= 99:
             # Muda para cursor-based antes de bater o limite de 100
             # Usa o último item como referência
             use_cursor = True
             if not cursor:
                 # Sem cursor disponível, para aqui
-                print(f"  ⚠️  Limite de paginação atingido em {len(all_data)} {label}")
+                print(f"  ⚠️  Limite de paginação atingido em {fetched} {label}")
+                break
+        elif FETCH_WORKERS > 1 and not use_cursor:
+            # Paginação por offset: as próximas páginas já são conhecidas
+            total_pages = result.get("total_pages") or 99
+            last_page = min(int(total_pages), 99)
+            if last_page <= page:
+                break
+            print(f"  Buscando páginas {page + 1}-{last_page} em paralelo ({FETCH_WORKERS} workers)...")
+            last_batch = batch
+            for page, result, last_batch in iter_pages(endpoint, params, range(page + 1, last_page + 1), label=label):
+                fetched += len(last_batch)
+                yield last_batch
+            if len(last_batch) < limit or page < 99:
+                break
+            # Chegou na página 99 com página cheia: segue o fluxo de cursor
+            cursor = result.get("next_cursor") or result.get("cursor")
+            use_cursor = True
+            if not cursor:
+                print(f"  ⚠️  Limite de paginação atingido em {fetched} {label}")
                 break
         else:
             page += 1
@@ -133,28 +778,456 @@ def fetch_all_pages(endpoint, params=None, label="items"):
         if use_cursor and not cursor:
             break
 
-    return all_data
+
+def fetch_all_pages(endpoint, params=None, label="items"):
+    """Busca todas as páginas de um endpoint paginado (offset + cursor)."""
+    return [item for batch in iter_all_pages(endpoint, params, label) for item in batch]
+
+
+# ============================================================
+# JSON — serialização
+# ============================================================
+# Com orjson instalado, encode/decode vão por ele (várias vezes mais rápido
+# e sem string intermediária); sem ele, json da stdlib com a mesma saída
+# compacta. Datas ficam como str(), igual ao default=str da stdlib.
+def json_bytes(obj):
+    """Serializa `obj` em JSON compacto (UTF-8, sem espaços)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+
+# ============================================================
+# DATAS — normalização para epoch (segundos, UTC)
+# ============================================================
+# A API devolve datas como epoch (s ou ms) ou strings ISO 8601. Em vez de
+# testar formato por formato em cada registro, DateNormalizer decide uma
+# vez por lote qual campo e qual parser usar; só os registros que não se
+# encaixam passam pela cadeia completa de to_epoch.
+POST_DATE_FIELDS = ["publish_date", "displayed_date", "created_at"]
+SUBSCRIBER_DATE_FIELDS = ["created_at", "created", "subscribed_at", "joined_at", "utm_created_at"]
+
+_DAY_EPOCH = {}  # "YYYY-MM-DD" -> epoch da meia-noite UTC
+
+
+def _epoch_number(value):
+    """Epoch numérico em segundos ou milissegundos -> segundos."""
+    return int(value / 1000 if value > 1e12 else value)
+
+
+def _iso_to_epoch(text):
+    """Parser rápido de ISO 8601 ('YYYY-MM-DD[THH:MM[:SS[.fff]]][Z|±HH:MM|±HHMM]').
+
+    Fatia a string em vez de usar strptime; a meia-noite de cada dia é
+    calculada (e validada) uma vez e cacheada. Sem fuso, assume UTC.
+    Qualquer outra forma (ex.: fuso só com horas, '±HH') ou data impossível
+    levanta ValueError, e quem chama cai no datetime.fromisoformat.
+    """
+    day = _DAY_EPOCH.get(text[:10])
+    if day is None:
+        if len(text) < 10 or text[4] != "-" or text[7] != "-":
+            raise ValueError(f"data ISO inválida: {text!r}")
+        year, month, mday = int(text[0:4]), int(text[5:7]), int(text[8:10])
+        if not (1 <= month <= 12 and 1 <= mday <= calendar.monthrange(year, month)[1]):
+            raise ValueError(f"data ISO inválida: {text!r}")
+        day = _DAY_EPOCH[text[:10]] = calendar.timegm((year, month, mday, 0, 0, 0))
+    if len(text) == 10:
+        return day
+    if text[10] not in "T " or text[13] != ":":
+        raise ValueError(f"data ISO inválida: {text!r}")
+
+    seconds = int(text[11:13]) * 3600 + int(text[14:16]) * 60
+    rest = text[16:]
+    if rest[:1] == ":":
+        seconds += int(rest[1:3])
+        rest = rest[3:]
+    if rest[:1] == ".":
+        i = 1
+        while i < len(rest) and rest[i].isdigit():
+            i += 1
+        rest = rest[i:]
+    if rest in ("", "Z", "z"):
+        return day + seconds
+    # Só ±HH:MM e ±HHMM; o resto (±HH, ±HH:MM:SS...) vai para o caminho lento
+    if (rest[0] not in "+-" or len(rest) not in (5, 6) or (len(rest) == 6 and rest[3] != ":")
+            or not (rest[1:3].isdigit() and rest[-2:].isdigit())):
+        raise ValueError(f"data ISO inválida: {text!r}")
+    offset = int(rest[1:3]) * 3600 + int(rest[-2:]) * 60
+    return day + seconds - offset if rest[0] == "+" else day + seconds + offset
+
+
+def to_epoch(value):
+    """Converte uma data em qualquer formato aceito para epoch (0 se inválida).
+
+    Caminho lento e tolerante: usado na detecção e como fallback.
+    """
+    if isinstance(value, bool) or value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return _epoch_number(value)
+    if not isinstance(value, str) or not value:
+        return 0
+    try:
+        return _iso_to_epoch(value)
+    except (ValueError, IndexError):
+        pass
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            return _epoch_number(float(value))
+        except ValueError:
+            return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _parser_for(value):
+    """Escolhe o parser rápido adequado ao formato de `value`."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _epoch_number
+    if isinstance(value, str):
+        try:
+            _iso_to_epoch(value)
+            return _iso_to_epoch
+        except (ValueError, IndexError):
+            pass
+    return to_epoch
+
+
+class DateNormalizer:
+    """Extrai a data de registros crus como epoch, decidindo o formato uma vez.
+
+    O primeiro registro com data define o campo (na ordem de `fields`) e o
+    parser; a decisão fica cacheada para o resto do lote. Registros sem o
+    campo detectado ou fora do formato caem em to_epoch, e datas ausentes ou
+    inválidas viram 0.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.field = None
+        self.parse = None
+
+    def _detect(self, record):
+        for field in self.fields:
+            value = record.get(field)
+            if value:
+                self.field, self.parse = field, _parser_for(value)
+                return
+
+    def _slow(self, record):
+        return to_epoch(next((record[f] for f in self.fields if record.get(f)), None))
+
+    def __call__(self, record):
+        if self.field is None:
+            self._detect(record)
+            if self.field is None:
+                return 0
+        value = record.get(self.field)
+        if value:
+            try:
+                return self.parse(value)
+            except (TypeError, ValueError, IndexError):
+                pass
+        return self._slow(record)
+
+    def column(self, records):
+        """Converte um lote inteiro em array('q') de epoch (vetorizado quando possível)."""
+        records = records if isinstance(records, list) else list(records)
+        if self.field is None:
+            for record in records:
+                self._detect(record)
+                if self.field is not None:
+                    break
+            else:
+                return array("q", bytes(8 * len(records)))
+        field = self.field
+        values = [r.get(field) for r in records]
+        if np is not None and self.parse is _epoch_number:
+            try:
+                nums = np.array([v if v else 0 for v in values], dtype=np.float64)
+            except (TypeError, ValueError):
+                nums = None
+            if nums is not None:
+                nums = np.where(nums > 1e12, nums / 1000, nums).astype(np.int64)
+                out = array("q", nums.tobytes())
+                for i, v in enumerate(values):
+                    if not v:
+                        out[i] = self._slow(records[i])
+                return out
+        out = array("q")
+        append, parse, slow = out.append, self.parse, self._slow
+        for record, value in zip(records, values):
+            if value:
+                try:
+                    append(parse(value))
+                    continue
+                except (TypeError, ValueError, IndexError):
+                    pass
+            append(slow(record))
+        return out
+
+
+_POST_DATES = DateNormalizer(POST_DATE_FIELDS)
+
+
+def _publish_ts(post):
+    """Data de publicação de um post cru como epoch (0 se ausente/inválida)."""
+    return _POST_DATES(post)
 
 
 # ============================================================
 # 1. BUSCAR DADOS
 # ============================================================
-def fetch_posts():
-    """Busca todos os posts com stats expandidas."""
+def _data_path(filename):
+    """Caminho de um arquivo de dados ao lado do dashboard da publicação atual.
+
+    Fora do modo lote é a pasta do script; no lote, a pasta de cada publicação.
+    """
+    pub = CURRENT_PUB.get()
+    base = pub["dir"] if pub else os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, filename)
+
+
+def load_post_cache(path):
+    """Lê só o índice do cache de posts (id -> epoch de publicação).
+
+    Os payloads continuam no disco e são lidos em streaming por
+    iter_cached_posts, então a memória não cresce com o histórico.
+    """
+    index = {}
+    if not os.path.exists(path):
+        return index
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                post = json_loads(line)
+            except ValueError:
+                continue
+            if post.get("id"):
+                index[post["id"]] = _publish_ts(post)
+    return index
+
+
+def iter_cached_posts(path, skip_ids=()):
+    """Gera (linha, post) do cache (mais novo primeiro), pulando `skip_ids`.
+
+    A linha vem como está no arquivo (bytes), para ser regravada sem
+    codificar o post de novo.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                post = json_loads(line)
+            except ValueError:
+                continue
+            if post.get("id") and post["id"] not in skip_ids:
+                yield (line if line.endswith(b"\n") else line + b"\n"), post
+
+
+def iter_posts():
+    """Gera posts crus com stats expandidas, reaproveitando o cache local.
+
+    Pagina do mais novo para o mais antigo e entrega cada post assim que a
+    página chega; para assim que encontra um post já em cache publicado há
+    mais de STATS_FREEZE_DAYS dias e completa o histórico com o cache. O
+    cache é regravado em streaming, ao mesmo tempo em que os posts passam.
+    """
     print("\n📬 Buscando posts...")
-    posts = fetch_all_pages(
-        f"/publications/{PUB_ID}/posts",
-        params={
-            "expand[]": "stats",
-            "limit": "50",
-            "status": "confirmed",
-            "order_by": "publish_date",
-            "direction": "desc",
-        },
-        label="posts",
-    )
-    print(f"  Total: {len(posts)} posts encontrados")
-    return posts
+    cache_path = _data_path(POST_CACHE_FILE)
+    cache = {} if FULL_SYNC else load_post_cache(cache_path)
+    if cache:
+        print(f"  Cache: {len(cache)} posts (stats congeladas após {STATS_FREEZE_DAYS} dias)")
+    cutoff = time.time() - STATS_FREEZE_DAYS * 86400
+
+    seen = set()
+    from_cache = 0
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for batch in iter_all_pages(
+            f"/publications/{_pub_id()}/posts",
+            params={
+                "expand[]": "stats",
+                "limit": "50",
+                "status": "confirmed",
+                "order_by": "publish_date",
+                "direction": "desc",
+            },
+            label="posts",
+        ):
+            reached_frozen = False
+            for p in batch:
+                pid = p.get("id")
+                if pid in seen:
+                    continue
+                if pid:
+                    seen.add(pid)
+                    reached_frozen = reached_frozen or (pid in cache and 0 < _publish_ts(p) < cutoff)
+                    out.write(json_bytes(p) + b"\n")
+                yield p
+            if reached_frozen:
+                print("  Alcançou posts congelados já em cache, parando a paginação")
+                break
+
+        if cache:
+            for line, p in iter_cached_posts(cache_path, seen):
+                from_cache += 1
+                out.write(line)
+                yield p
+
+    if seen or from_cache:
+        os.replace(tmp_path, cache_path)
+    else:
+        os.remove(tmp_path)
+    print(f"  Total: {len(seen) + from_cache} posts ({len(seen)} da API, {from_cache} do cache)")
+
+
+def fetch_posts():
+    """Busca todos os posts crus (ver iter_posts)."""
+    return list(iter_posts())
+
+
+def _read_json(path):
+    """Lê um arquivo JSON auxiliar (None se não existir ou estiver corrompido)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    """Grava um arquivo JSON auxiliar de forma atômica (temporário + rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+def _export_record(s):
+    """Campos de um subscriber que o export guarda (sem email/PII)."""
+    created = next((s[f] for f in SUBSCRIBER_DATE_FIELDS if s.get(f)), None)
+    return {"id": s.get("id"), "status": s.get("status"), "created": created}
+
+
+def export_subscribers(export_dir):
+    """Exporta toda a base de subscribers para `export_dir` via cursor.
+
+    Os registros vão para partes NDJSON gzip (EXPORT_PART_RECORDS por parte)
+    em `export_dir`.partial; o checkpoint (cursor, parte, bytes gravados) é
+    salvo após cada página, então uma execução interrompida retoma do último
+    cursor. Ao terminar, o diretório parcial substitui o export anterior.
+    Com BEEHIIV_MAX_REQUESTS, pausa ao chegar a SUBSCRIBER_EXPORT_RESERVE
+    requisições do teto. Retorna True se o export foi concluído nesta execução.
+    """
+    partial_dir = export_dir + ".partial"
+    os.makedirs(partial_dir, exist_ok=True)
+    ckpt_path = os.path.join(partial_dir, "checkpoint.json")
+    ckpt = _read_json(ckpt_path) or {
+        "cursor": None, "part": 1, "part_records": 0, "part_bytes": 0, "records": 0,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if ckpt["records"]:
+        print(f"  Retomando export: {ckpt['records']:,} subscribers já gravados")
+
+    def part_path(n):
+        return os.path.join(partial_dir, f"part-{n:05d}.ndjson.gz")
+
+    # Descarta o que foi gravado depois do último checkpoint
+    path = part_path(ckpt["part"])
+    if os.path.exists(path):
+        with open(path, "r+b") as f:
+            f.truncate(ckpt["part_bytes"])
+
+    endpoint = f"/publications/{_pub_id()}/subscriptions"
+    export_budget = RATE_LIMITER.budget - SUBSCRIBER_EXPORT_RESERVE
+    pages = 0
+    while True:
+        if RATE_LIMITER.budget and RATE_LIMITER.used >= export_budget:
+            print(f"  ⏸️  Export pausado em {ckpt['records']:,} subscribers: as últimas "
+                  f"{SUBSCRIBER_EXPORT_RESERVE} requisições da execução ficam para a amostragem")
+            return False
+        params = {"limit": "100"}
+        if ckpt["cursor"]:
+            params["cursor"] = ckpt["cursor"]
+        result = api_get(endpoint, params)
+        if not result or "data" not in result:
+            print(f"  ⚠️  Export interrompido em {ckpt['records']:,} subscribers (retoma na próxima execução)")
+            return False
+
+        batch = result["data"]
+        if batch:
+            lines = b"".join(json_bytes(_export_record(s)) + b"\n" for s in batch)
+            with gzip.open(path, "ab") as f:
+                f.write(lines)
+            ckpt["records"] += len(batch)
+            ckpt["part_records"] += len(batch)
+            ckpt["part_bytes"] = os.path.getsize(path)
+
+        next_cursor = result.get("next_cursor")
+        if not batch or not next_cursor or result.get("has_more") is False:
+            break
+
+        ckpt["cursor"] = next_cursor
+        if ckpt["part_records"] >= EXPORT_PART_RECORDS:
+            ckpt["part"] += 1
+            ckpt["part_records"] = ckpt["part_bytes"] = 0
+            path = part_path(ckpt["part"])
+        _write_json_atomic(ckpt_path, ckpt)
+
+        pages += 1
+        if pages % 50 == 0:
+            print(f"  Export: {ckpt['records']:,} subscribers...", flush=True)
+
+    ckpt.update(cursor=None, complete=True, finished_at=datetime.now(timezone.utc).isoformat())
+    _write_json_atomic(ckpt_path, ckpt)
+    if os.path.exists(export_dir):
+        shutil.rmtree(export_dir)
+    os.replace(partial_dir, export_dir)
+    print(f"  Export concluído: {ckpt['records']:,} subscribers")
+    return True
+
+
+def iter_subscriber_export(export_dir):
+    """Lê o export de subscribers em streaming (um registro por vez)."""
+    for name in sorted(os.listdir(export_dir)):
+        if not name.endswith(".ndjson.gz"):
+            continue
+        with gzip.open(os.path.join(export_dir, name), "rb") as f:
+            for line in f:
+                yield json_loads(line)
+
+
+def fetch_full_subscribers():
+    """Modo export completo: usa (e atualiza) o export em disco.
+
+    Retorna None enquanto não houver um export completo — nesse caso quem
+    chama cai para a amostragem.
+    """
+    print("\n👥 Buscando subscribers (export completo)...")
+    export_dir = _data_path(SUBSCRIBER_EXPORT_DIR)
+    info = _read_json(os.path.join(export_dir, "checkpoint.json"))
+    stale = True
+    if info:
+        finished = datetime.fromisoformat(info["finished_at"])
+        stale = (datetime.now(timezone.utc) - finished).days >= SUBSCRIBER_EXPORT_MAX_AGE_DAYS
+    if stale or os.path.exists(export_dir + ".partial"):
+        export_subscribers(export_dir)
+        info = _read_json(os.path.join(export_dir, "checkpoint.json"))
+    if not info:
+        print("  Export ainda incompleto — usando amostragem nesta execução")
+        return None
+    print(f"  Export de {info['finished_at'][:10]}: {info['records']:,} subscribers")
+    # O total sai das linhas deduplicadas em process_subscribers; a contagem
+    # do checkpoint (com repetições) fica só como diagnóstico
+    return {"raw": iter_subscriber_export(export_dir), "export_records": info["records"], "is_full_export": True}
 
 
 def fetch_subscribers():
@@ -164,18 +1237,27 @@ def fetch_subscribers():
     - Pega a primeira página para saber o total
     - Busca as últimas 2000 (mais recentes) para calcular crescimento
     - Busca uma amostra das primeiras páginas para ter histórico antigo
+
+    Com BEEHIIV_SUBSCRIBERS_FULL_EXPORT=1 usa o export completo em disco.
+    Se a primeira página falhar, retorna "unavailable": o total é desconhecido
+    (não zero) e não deve ser publicado nem gravado no histórico.
     """
+    if SUBSCRIBERS_FULL_EXPORT:
+        full = fetch_full_subscribers()
+        if full:
+            return full
+
     print("\n👥 Buscando subscribers (modo otimizado para bases grandes)...")
 
     # 1. Primeira chamada para pegar total e estrutura
     first_page = api_get(
-        f"/publications/{PUB_ID}/subscriptions",
+        f"/publications/{_pub_id()}/subscriptions",
         params={"limit": "100", "order_by": "created", "direction": "desc"},
     )
 
     if not first_page or "data" not in first_page:
         print("  Sem dados de subscribers")
-        return {"raw": [], "total_from_api": 0}
+        return {"raw": [], "total_from_api": 0, "unavailable": True}
 
     # Debug: mostra campos do primeiro subscriber
     if first_page["data"]:
@@ -186,6 +1268,7 @@ def fetch_subscribers():
                 print(f"     {k} = {repr(sample[k])[:80]}")
 
     total_results = first_page.get("total_results", 0)
+    total_is_exact = bool(total_results)  # estimativa por páginas ou override não servem de base exata
     # Se total_results não estiver disponível, tenta pelo page info
     if not total_results:
         page_info = first_page.get("page", {})
@@ -204,34 +1287,27 @@ def fetch_subscribers():
     recent_subs = list(first_page["data"])
     MAX_RECENT_PAGES = 20
     print(f"  Buscando os {MAX_RECENT_PAGES * 100} mais recentes...")
-    for page in range(2, MAX_RECENT_PAGES + 1):
-        result = api_get(
-            f"/publications/{PUB_ID}/subscriptions",
-            params={"limit": "100", "page": str(page), "order_by": "created", "direction": "desc"},
-        )
-        if not result or not result.get("data"):
-            break
-        batch = result["data"]
-        recent_subs.extend(batch)
-        if len(batch) < 100:
-            break
+    if len(recent_subs) >= 100:
+        for _, _, batch in iter_pages(
+            f"/publications/{_pub_id()}/subscriptions",
+            {"limit": "100", "order_by": "created", "direction": "desc"},
+            range(2, MAX_RECENT_PAGES + 1),
+            label="subscribers",
+        ):
+            recent_subs.extend(batch)
 
     print(f"  Recentes coletados: {len(recent_subs)}")
 
     # 3. Busca os mais antigos (primeiras 10 páginas) para ter início do histórico
     print(f"  Buscando os mais antigos para histórico...")
     old_subs = []
-    for page in range(1, 11):
-        result = api_get(
-            f"/publications/{PUB_ID}/subscriptions",
-            params={"limit": "100", "page": str(page), "order_by": "created", "direction": "asc"},
-        )
-        if not result or not result.get("data"):
-            break
-        batch = result["data"]
+    for _, _, batch in iter_pages(
+        f"/publications/{_pub_id()}/subscriptions",
+        {"limit": "100", "order_by": "created", "direction": "asc"},
+        range(1, 11),
+        label="subscribers",
+    ):
         old_subs.extend(batch)
-        if len(batch) < 100:
-            break
 
     print(f"  Antigos coletados: {len(old_subs)}")
 
@@ -247,233 +1323,739 @@ def fetch_subscribers():
 
     print(f"  Amostra total (deduplicada): {len(unique_subs)}")
 
-    return {"raw": unique_subs, "total_from_api": total_results}
+    growth = None
+    if EXACT_GROWTH and total_is_exact:
+        growth = fetch_exact_growth(total_results)
+    elif EXACT_GROWTH:
+        print("\n📈 Crescimento exato: a API não informou total_results — ignorado nesta execução")
+    status_sample = sample_subscriber_status(total_results)
+    return {"raw": unique_subs, "total_from_api": total_results, "growth_exact": growth,
+            "status_sample": status_sample}
+
+
+def _fetch_page_set(endpoint, params, pages):
+    """Busca um conjunto arbitrário de páginas em paralelo: [(página, lote)]."""
+    with ThreadPoolExecutor(max_workers=max(1, FETCH_WORKERS)) as pool:
+        futures = [(page, pool.submit(contextvars.copy_context().run, _page_result, endpoint, params, page))
+                   for page in pages]
+        return [(page, (future.result() or {}).get("data") or []) for page, future in futures]
+
+
+# A listagem por offset só chega até esta página, nos dois sentidos (asc/desc)
+OFFSET_PAGE_LIMIT = 100
+
+
+def sample_subscriber_status(total, limit=100):
+    """Estima a taxa de ativos por amostragem estratificada de páginas.
+
+    A listagem (order_by=created) é dividida em STATUS_STRATA faixas
+    contíguas de páginas; cada rodada sorteia páginas em todas as faixas e
+    as busca em paralelo. Cada página é um conglomerado: a estimativa é a
+    média ponderada (pelo tamanho da faixa) das proporções de ativos por
+    faixa, com variância Σ W²·s²/n. Para quando a margem do IC 95% fica
+    abaixo de STATUS_TARGET_MARGIN ou ao atingir STATUS_MAX_PAGES.
+
+    Só dá para ler as OFFSET_PAGE_LIMIT primeiras páginas em cada sentido:
+    as do começo da base vêm da listagem asc, as do fim da desc. Bases acima
+    de 2 × OFFSET_PAGE_LIMIT páginas (~20 mil subscribers) não são amostradas
+    por inteiro: o meio não pode ser sorteado, cada faixa pesa só pela sua
+    parte alcançável e a estimativa (e o IC) vale para essa parte — a
+    fração coberta volta em "coverage". Retorna None (quem chama fica com a
+    amostra de recentes/antigos) se a cobertura ficar abaixo de
+    STATUS_MIN_COVERAGE (~25 mil subscribers no padrão), se alguma faixa não
+    tiver ao menos 2 páginas com dados ou se desativado.
+    """
+    total_pages = -(-total // limit)
+    if STATUS_MAX_PAGES <= 0 or total_pages < 2:
+        return None
+    strata_count = max(1, min(STATUS_STRATA, total_pages // 2))
+    bounds = [1 + total_pages * h // strata_count for h in range(strata_count + 1)]
+
+    def reachable(page):
+        return page <= OFFSET_PAGE_LIMIT or total_pages - page + 1 <= OFFSET_PAGE_LIMIT
+
+    strata = [[page for page in range(bounds[h], bounds[h + 1]) if reachable(page)] for h in range(strata_count)]
+    reach = [len(pages) for pages in strata]
+    coverage = sum(reach) / total_pages
+    if coverage < STATUS_MIN_COVERAGE or min(reach) < 2:
+        print(f"\n🎲 Amostragem estratificada de status: base grande demais para a paginação "
+              f"({total_pages:,} páginas, {coverage:.0%} alcançáveis) — usando a amostra")
+        return None
+    # Pesos pela parte alcançável de cada faixa (sem viés de faixas cortadas)
+    weights = [n / sum(reach) for n in reach]
+    for pages in strata:
+        random.shuffle(pages)  # ordem de sorteio sem reposição
+
+    print(f"\n🎲 Amostragem estratificada de status ({strata_count} faixas, até {STATUS_MAX_PAGES} páginas"
+          + (f", {coverage:.0%} da base ao alcance" if coverage < 1 else "") + ")...")
+    endpoint = f"/publications/{_pub_id()}/subscriptions"
+    props = [[] for _ in strata]
+    drawn, records, unreachable = 0, 0, 0
+    estimate = margin = None
+    per_round = 2  # 2 páginas por faixa na 1ª rodada: a variância já fica definida
+    while drawn < STATUS_MAX_PAGES:
+        batch = []
+        for h, pages in enumerate(strata):
+            for _ in range(per_round):
+                if pages and drawn + len(batch) < STATUS_MAX_PAGES:
+                    batch.append((h, pages.pop()))
+        if not batch:
+            break
+        drawn += len(batch)
+        # Página asc P = página desc (total_pages - P + 1), contando do fim
+        asc = {page: h for h, page in batch if page <= OFFSET_PAGE_LIMIT}
+        desc = {total_pages - page + 1: h for h, page in batch if page > OFFSET_PAGE_LIMIT}
+        fetched = []
+        for direction, pages in (("asc", asc), ("desc", desc)):
+            if pages:
+                params = {"limit": str(limit), "order_by": "created", "direction": direction}
+                fetched += [(pages[page], subs) for page, subs in _fetch_page_set(endpoint, params, list(pages))]
+        for h, subs in fetched:
+            if not subs:
+                unreachable += 1  # erro ou fora do alcance da paginação
+                continue
+            records += len(subs)
+            active = sum(1 for s in subs if (s.get("status") or "").lower() == "active")
+            props[h].append(active / len(subs))
+        per_round = 1
+
+        # Estimador estratificado: só quando toda faixa tem ao menos 2 páginas
+        if min(len(p) for p in props) < 2:
+            if any(not pages and len(p) < 2 for pages, p in zip(strata, props)):
+                break  # faixa esgotada sem dados suficientes: não adianta sortear mais
+            continue
+        estimate = sum(w * _mean(p) for w, p in zip(weights, props))
+        variance = 0.0
+        for w, p in zip(weights, props):
+            m = _mean(p)
+            variance += w ** 2 * sum((x - m) ** 2 for x in p) / (len(p) - 1) / len(p)
+        margin = 1.96 * variance ** 0.5 * 100
+        print(f"  {drawn} páginas, {records:,} subscribers: {estimate * 100:.1f}% ativos ± {margin:.1f}pp")
+        if margin <= STATUS_TARGET_MARGIN:
+            break
+
+    if unreachable:
+        print(f"  ⚠️ {unreachable} páginas sorteadas vieram vazias")
+    if estimate is None:
+        print("  Faixas sem páginas suficientes com dados — usando a amostra de recentes/antigos")
+        return None
+    return {
+        "active_rate": estimate,
+        "margin": margin,
+        "ci": [max(0.0, estimate * 100 - margin), min(100.0, estimate * 100 + margin)],
+        "pages": drawn,
+        "records": records,
+        "unreachable": unreachable,
+        "coverage": coverage,
+    }
+
+
+class _CreatedPages:
+    """Páginas da listagem de subscribers por data de criação, buscadas sob demanda.
+
+    Guarda só a coluna de datas (epoch) de cada página já vista, para que a
+    busca binária de um limite de mês reaproveite as sondagens dos outros.
+    Registros sem data válida ficam na coluna como 0: as posições continuam
+    batendo com a paginação, e só as comparações os ignoram.
+    """
+
+    def __init__(self, direction, limit=100):
+        self.direction = direction
+        self.limit = limit
+        self.requests = 0
+        self.errors = 0  # respostas que falharam (≠ página vazia fora do alcance)
+        self._dates = DateNormalizer(SUBSCRIBER_DATE_FIELDS)
+        self._pages = {}
+
+    def get(self, page):
+        if page not in self._pages:
+            self.requests += 1
+            data = api_get(
+                f"/publications/{_pub_id()}/subscriptions",
+                {"limit": str(self.limit), "page": str(page), "order_by": "created", "direction": self.direction},
+            )
+            if data is None:
+                self.errors += 1
+            records = (data or {}).get("data") or []
+            self._pages[page] = self._dates.column(records)
+        return self._pages[page]
+
+
+def _first_date(col):
+    """Primeira data válida (≠ 0) de uma página, ou None."""
+    return next((ts for ts in col if ts), None)
+
+
+def _prefix_length(pages, pred, total):
+    """Quantos registros do início da listagem satisfazem `pred` (um prefixo).
+
+    Busca binária pela última página cujo primeiro registro satisfaz `pred`
+    e conta dentro dela: O(log N) requisições. Retorna None se a resposta
+    cair além das páginas que a API deixa alcançar.
+    """
+    total_pages = -(-total // pages.limit)
+    head = _first_date(pages.get(1))
+    if head is None:
+        return None
+    if not pred(head):
+        return 0
+    lo, hi = 1, total_pages
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        head = _first_date(pages.get(mid))
+        if head is not None and pred(head):
+            lo = mid
+        else:
+            # Página vazia = fora do alcance da paginação; trata como "depois"
+            hi = mid - 1
+    col = pages.get(lo)
+    # Posição (não contagem) do primeiro registro datado que sai do prefixo
+    count = next((i for i, ts in enumerate(col) if ts and not pred(ts)), len(col))
+    if count == len(col) and lo < total_pages and not pages.get(lo + 1):
+        return None
+    return (lo - 1) * pages.limit + count
+
+
+def fetch_exact_growth(total):
+    """Novos subscribers por mês, exatos, sem baixar a base inteira.
+
+    Para cada início de mês, conta quantos subscribers foram criados antes
+    dele com _prefix_length na listagem crescente (ou, se o limite estiver
+    fora do alcance da paginação, na decrescente: N − criados depois). Cada
+    limite custa O(log N) requisições e, como limites passados não mudam,
+    fica em cache entre execuções — no dia a dia só o total é consultado.
+    Limites fora do alcance nos dois sentidos também (como null): a base só
+    cresce a partir do fim, então continuam inalcançáveis; limites que
+    falharam por erro de requisição são sondados de novo. `total` precisa ser o total_results exato da API: os limites vindos da
+    listagem decrescente dependem dele e vão para o cache.
+
+    Só devolve a sequência contígua de meses que termina no mês atual (meses
+    anteriores a um limite inalcançável ficam de fora); retorna None se nem
+    o mês atual puder ser calculado.
+    """
+    cache_path = _data_path(GROWTH_CACHE_FILE)
+    cache = ({} if FULL_SYNC else _read_json(cache_path)) or {}
+    boundaries = cache.get("boundaries", {})
+    asc, desc = _CreatedPages("asc"), _CreatedPages("desc")
+
+    first = _first_date(asc.get(1))
+    if not total or first is None:
+        return None
+    start = datetime.fromtimestamp(first, tz=timezone.utc)
+    now = datetime.now(timezone.utc)
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (now.year, now.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    print(f"\n📈 Crescimento exato: {len(months)} meses ({len(boundaries)} limites em cache)...")
+    offsets = [0]
+    for year, month in months[1:]:
+        key = f"{year:04d}-{month:02d}"
+        if key not in boundaries:
+            edge = calendar.timegm((year, month, 1, 0, 0, 0))
+            errors = asc.errors + desc.errors
+            before = _prefix_length(asc, lambda ts: ts < edge, total)
+            if before is None:
+                after = _prefix_length(desc, lambda ts: ts >= edge, total)
+                before = total - after if after is not None else None
+            if before is None and asc.errors + desc.errors > errors:
+                offsets.append(None)  # erro de requisição: tenta de novo na próxima execução
+                continue
+            boundaries[key] = before
+        offsets.append(boundaries[key])
+    offsets.append(total)
+
+    _write_json_atomic(cache_path, {"boundaries": boundaries, "limit": asc.limit})
+    timeline = []
+    for (year, month), lo, hi in reversed(list(zip(months, offsets, offsets[1:]))):
+        if lo is None:
+            break  # série com buraco: fica só o trecho contíguo até o mês atual
+        timeline.append({"month": f"{year:04d}-{month:02d}", "new": hi - lo, "cumulative": hi})
+    timeline.reverse()
+    missing = len(months) - len(timeline)
+    print(f"  {len(timeline)} meses exatos com {asc.requests + desc.requests} requisições"
+          + (f" ({missing} fora do alcance da paginação)" if missing else ""))
+    return timeline or None
 
 
 # ============================================================
 # 2. PROCESSAR DADOS
 # ============================================================
-def process_posts(raw_posts):
-    """Processa posts crus da API em formato limpo."""
-    posts = []
-    for p in raw_posts:
-        stats = p.get("stats", {}) or {}
-        email_stats = stats.get("email", {}) or {}
-        web_stats = stats.get("web", {}) or {}
-
-        # Tenta vários formatos de data
-        publish_date = p.get("publish_date") or p.get("displayed_date") or p.get("created_at")
-        if isinstance(publish_date, (int, float)):
-            # Unix timestamp
-            dt = datetime.fromtimestamp(publish_date, tz=timezone.utc)
-        elif isinstance(publish_date, str):
+# Caminhos alternativos (dentro de post["stats"]) de cada métrica, em ordem
+# de preferência — a API já devolveu formatos diferentes ao longo do tempo.
+POST_METRIC_PATHS = {
+    "recipients": [("email", "recipients"), ("email_recipients",), ("recipients",)],
+    "delivered": [("email", "delivered"), ("email_delivered",)],  # sem valor: usa recipients
+    "unique_opens": [("email", "unique_opens"), ("unique_opens",), ("opens", "unique")],
+    "total_opens": [("email", "total_opens"), ("total_opens",), ("opens", "total")],
+    "unique_clicks": [("email", "unique_clicks"), ("unique_clicks",), ("clicks", "unique")],
+    "total_clicks": [("email", "total_clicks"), ("total_clicks",), ("clicks", "total")],
+    "unsubscribes": [("email", "unsubscribes"), ("unsubscribes",)],
+    "spam_reports": [("email", "spam_reports"), ("spam_reports",)],
+    # Web stats (campos reais da API: "views" e "clicks")
+    "web_views": [("web", "views"), ("web", "unique_page_views")],
+    "web_clicks": [("web", "clicks"), ("web", "unique_clicks")],
+}
+POST_METRICS = list(POST_METRIC_PATHS)
+
+
+def _to_int(v):
+    """Força valor numérico (0 para ausente/inválido)."""
+    try:
+        return int(v) if v else 0
+    except (ValueError, TypeError):
+        return 0
+
+
+def _metric_value(v):
+    """Valor numérico de uma métrica; TypeError se o campo não for um número."""
+    if v is None or type(v) is int:
+        return v or 0
+    if isinstance(v, (float, str)) and not isinstance(v, bool):
+        return int(float(v))
+    raise TypeError(f"métrica não numérica: {type(v).__name__}")
+
+
+def _path_getter(path):
+    if len(path) == 1:
+        return itemgetter(path[0])
+    first, second = path
+    return lambda stats: stats[first][second]
+
+
+class PostStatsSchema:
+    """Resolve uma vez em qual caminho de `stats` está cada métrica.
+
+    O probe inspeciona o primeiro payload, escolhe para cada métrica o
+    primeiro caminho com valor numérico (preferindo valores não-zero) e
+    compila um getter por métrica. Os posts seguintes só aplicam os getters;
+    um payload que não se encaixa (caminho ausente ou valor não numérico)
+    dispara um novo probe, assim como uma métrica ausente no esquema atual
+    que aparece num payload posterior. Cada esquema diferente é logado uma
+    única vez.
+    """
+
+    def __init__(self):
+        self.paths = None
+        self.sample = None
+        self.probes = 0
+        self._getters = None
+        self._missing = []
+        self._logged = set()
+
+    def probe(self, stats):
+        paths = []
+        for metric in POST_METRICS:
+            found = None
+            for path in POST_METRIC_PATHS[metric]:
+                try:
+                    value = _metric_value(_path_getter(path)(stats))
+                except (KeyError, TypeError, IndexError, ValueError):
+                    continue
+                if value:
+                    found = path
+                    break
+                found = found or path
+            paths.append(found)
+
+        self.probes += 1
+        self.paths = paths
+        self._getters = [_path_getter(path) if path else None for path in paths]
+        self._missing = [_path_getter(path) for metric, found in zip(POST_METRICS, paths) if not found
+                         for path in POST_METRIC_PATHS[metric]]
+        if self.sample is None and DEBUG_RAW_STATS:
+            self.sample = stats
+        key = tuple(paths)
+        if key not in self._logged:
+            self._logged.add(key)
+            print(f"\n🔍 Esquema de stats dos posts{' (novo formato)' if len(self._logged) > 1 else ''}:")
+            for metric, path in zip(POST_METRICS, paths):
+                print(f"    {metric:<14} ← {'stats.' + '.'.join(path) if path else '(ausente)'}")
+
+    def _has_missing_metric(self, stats):
+        for get in self._missing:
             try:
-                dt = datetime.fromisoformat(publish_date.replace("Z", "+00:00"))
-            except:
-                dt = None
-        else:
-            dt = None
-
-        # Helper para extrair valor de campo que pode ser dict, list ou int
-        def safe_get(obj, key, default=0):
-            """Extrai valor seguro de um campo que pode ter formato variado."""
-            val = obj.get(key, default) if isinstance(obj, dict) else default
-            if isinstance(val, dict):
-                return val
-            if isinstance(val, list):
-                return {}  # lista não tem .get, retorna dict vazio
-            return val
-
-        # Extrai métricas com fallbacks robustos
-        recipients = (
-            safe_get(email_stats, "recipients", 0)
-            or safe_get(stats, "email_recipients", 0)
-            or safe_get(stats, "recipients", 0)
-            or 0
-        )
-        delivered = (
-            safe_get(email_stats, "delivered", 0)
-            or safe_get(stats, "email_delivered", 0)
-            or recipients
-        )
-
-        opens_field = safe_get(stats, "opens", {})
-        clicks_field = safe_get(stats, "clicks", {})
-
-        unique_opens = (
-            safe_get(email_stats, "unique_opens", 0)
-            or safe_get(stats, "unique_opens", 0)
-            or (opens_field.get("unique", 0) if isinstance(opens_field, dict) else 0)
-            or 0
-        )
-        total_opens = (
-            safe_get(email_stats, "total_opens", 0)
-            or safe_get(stats, "total_opens", 0)
-            or (opens_field.get("total", 0) if isinstance(opens_field, dict) else 0)
-            or 0
-        )
-        unique_clicks = (
-            safe_get(email_stats, "unique_clicks", 0)
-            or safe_get(stats, "unique_clicks", 0)
-            or (clicks_field.get("unique", 0) if isinstance(clicks_field, dict) else 0)
-            or 0
-        )
-        total_clicks = (
-            safe_get(email_stats, "total_clicks", 0)
-            or safe_get(stats, "total_clicks", 0)
-            or (clicks_field.get("total", 0) if isinstance(clicks_field, dict) else 0)
-            or 0
-        )
-        unsubscribes = (
-            safe_get(email_stats, "unsubscribes", 0)
-            or safe_get(stats, "unsubscribes", 0)
-            or 0
-        )
-        spam_reports = (
-            safe_get(email_stats, "spam_reports", 0)
-            or safe_get(stats, "spam_reports", 0)
-            or 0
-        )
-
-        # Web stats (campos reais da API: "views" e "clicks")
-        web_views = safe_get(web_stats, "views", 0) or safe_get(web_stats, "unique_page_views", 0) or 0
-        web_clicks = safe_get(web_stats, "clicks", 0) or safe_get(web_stats, "unique_clicks", 0) or 0
-
-        # Clicks detalhados por URL (stats.clicks é uma lista de links)
-        click_details = stats.get("clicks", [])
-        top_links = []
-        if isinstance(click_details, list):
-            for link in click_details[:10]:
-                if isinstance(link, dict):
-                    top_links.append({
-                        "url": link.get("base_url") or link.get("url", ""),
-                        "total_clicks": link.get("total_clicks", 0),
-                        "unique_clicks": link.get("total_unique_clicks", 0),
-                    })
-
-        # Força valores numéricos
-        def to_int(v):
-            try: return int(v) if v else 0
-            except (ValueError, TypeError): return 0
-
-        recipients = to_int(recipients)
-        delivered = to_int(delivered)
-        unique_opens = to_int(unique_opens)
-        total_opens = to_int(total_opens)
-        unique_clicks = to_int(unique_clicks)
-        total_clicks = to_int(total_clicks)
-        unsubscribes = to_int(unsubscribes)
-        spam_reports = to_int(spam_reports)
-        web_views = to_int(web_views)
-        web_clicks = to_int(web_clicks)
-
-        # Calcula rates
-        open_rate = (unique_opens / delivered * 100) if delivered > 0 else 0
-        click_rate = (unique_clicks / delivered * 100) if delivered > 0 else 0
-        cto_rate = (unique_clicks / unique_opens * 100) if unique_opens > 0 else 0
-        unsub_rate = (unsubscribes / delivered * 100) if delivered > 0 else 0
-
-        posts.append({
-            "id": p.get("id", ""),
-            "title": p.get("title", "Sem título") or p.get("subtitle", "Sem título"),
-            "date": dt.isoformat() if dt else None,
-            "date_label": dt.strftime("%d/%m/%Y") if dt else "N/A",
-            "day_of_week": dt.weekday() if dt else None,  # 0=Monday
-            "recipients": recipients,
-            "delivered": delivered,
-            "unique_opens": unique_opens,
-            "total_opens": total_opens,
-            "unique_clicks": unique_clicks,
-            "total_clicks": total_clicks,
-            "open_rate": round(open_rate, 1),
-            "click_rate": round(click_rate, 1),
-            "cto_rate": round(cto_rate, 1),
-            "unsubscribes": unsubscribes,
-            "unsub_rate": round(unsub_rate, 2),
-            "spam_reports": spam_reports,
-            "web_views": web_views,
-            "web_clicks": web_clicks,
-            "top_links": top_links,
-            "raw_stats": stats,  # preserva stats originais
-        })
-
-    # Filtra posts sem data
-    posts = [p for p in posts if p["date"]]
-    posts.sort(key=lambda x: x["date"])
+                if _metric_value(get(stats)):
+                    return True
+            except (KeyError, TypeError, IndexError, ValueError):
+                pass
+        return False
+
+    def extract(self, stats):
+        """Retorna a lista de métricas (na ordem de POST_METRICS) como inteiros."""
+        if not stats:
+            return [0] * len(POST_METRICS)
+        if self._getters is None or (self._missing and self._has_missing_metric(stats)):
+            self.probe(stats)
+        try:
+            return [_metric_value(get(stats)) if get else 0 for get in self._getters]
+        except (KeyError, TypeError, IndexError, ValueError):
+            self.probe(stats)
+        return [_to_int(get(stats)) if get else 0 for get in self._getters]
+
+
+class PostRecord:
+    """Post processado: registro compacto com __slots__ (sem dict por post).
+
+    A data fica só como epoch inteiro (`ts`, UTC), que também é a chave de
+    ordenação; `date` (ISO), `date_label` e `day_of_week` são derivados do
+    epoch quando alguém pede (payload do dashboard, histórico, dump).
+    """
+
+    __slots__ = ("id", "title", "ts", "recipients", "delivered", "unique_opens", "total_opens",
+                 "unique_clicks", "total_clicks", "open_rate", "click_rate", "cto_rate", "unsubscribes",
+                 "unsub_rate", "spam_reports", "web_views", "web_clicks", "links")
+
+    def __init__(self, id, title, ts, recipients, delivered, unique_opens, total_opens, unique_clicks,
+                 total_clicks, open_rate, click_rate, cto_rate, unsubscribes, unsub_rate, spam_reports,
+                 web_views, web_clicks, links):
+        self.id = id
+        self.title = title
+        self.ts = ts
+        self.recipients = recipients
+        self.delivered = delivered
+        self.unique_opens = unique_opens
+        self.total_opens = total_opens
+        self.unique_clicks = unique_clicks
+        self.total_clicks = total_clicks
+        self.open_rate = open_rate
+        self.click_rate = click_rate
+        self.cto_rate = cto_rate
+        self.unsubscribes = unsubscribes
+        self.unsub_rate = unsub_rate
+        self.spam_reports = spam_reports
+        self.web_views = web_views
+        self.web_clicks = web_clicks
+        self.links = links
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.ts, tz=timezone.utc).isoformat()
+
+    @property
+    def date_label(self):
+        return time.strftime("%d/%m/%Y", time.gmtime(self.ts))
+
+    @property
+    def month(self):
+        return time.strftime("%Y-%m", time.gmtime(self.ts))
+
+    @property
+    def day_of_week(self):
+        # 0=segunda; 01/01/1970 foi uma quinta-feira
+        return (self.ts // 86400 + 3) % 7
+
+    @property
+    def hour(self):
+        return self.ts // 3600 % 24  # hora de envio (UTC)
+
+    def to_dict(self):
+        """O registro como dicionário (formato do arquivo de dados)."""
+        data = {"id": self.id, "title": self.title, "date": self.date, "date_label": self.date_label,
+                "day_of_week": self.day_of_week}
+        data.update((name, getattr(self, name)) for name in self.__slots__[2:])
+        return data
+
+
+def normalize_post(p, schema):
+    """Converte um post cru da API no PostRecord usado pelo dashboard.
+
+    As métricas vêm do extrator compilado em `schema` (PostStatsSchema). O
+    payload original (incluindo stats) não é mantido no registro. Retorna
+    None para posts sem data de publicação.
+    """
+    ts = int(_publish_ts(p) or 0)
+    if not ts:
+        return None
+    stats = p.get("stats", {}) or {}
+
+    (recipients, delivered, unique_opens, total_opens, unique_clicks, total_clicks,
+     unsubscribes, spam_reports, web_views, web_clicks) = schema.extract(stats)
+    delivered = delivered or recipients
+
+    # Clicks detalhados por URL (stats.clicks é uma lista de links): todos os
+    # links, em forma compacta [url, total, únicos]; a normalização e o
+    # ranking entre edições ficam com o LinkIndex
+    click_details = stats.get("clicks", [])
+    links = []
+    if isinstance(click_details, list):
+        for link in click_details:
+            if isinstance(link, dict):
+                links.append([
+                    link.get("base_url") or link.get("url", ""),
+                    _to_int(link.get("total_clicks")),
+                    _to_int(link.get("total_unique_clicks")),
+                ])
+
+    # Calcula rates
+    open_rate = (unique_opens / delivered * 100) if delivered > 0 else 0
+    click_rate = (unique_clicks / delivered * 100) if delivered > 0 else 0
+    cto_rate = (unique_clicks / unique_opens * 100) if unique_opens > 0 else 0
+    unsub_rate = (unsubscribes / delivered * 100) if delivered > 0 else 0
+
+    return PostRecord(
+        id=p.get("id", ""),
+        title=p.get("title", "Sem título") or p.get("subtitle", "Sem título"),
+        ts=ts,
+        recipients=recipients,
+        delivered=delivered,
+        unique_opens=unique_opens,
+        total_opens=total_opens,
+        unique_clicks=unique_clicks,
+        total_clicks=total_clicks,
+        open_rate=round(open_rate, 1),
+        click_rate=round(click_rate, 1),
+        cto_rate=round(cto_rate, 1),
+        unsubscribes=unsubscribes,
+        unsub_rate=round(unsub_rate, 2),
+        spam_reports=spam_reports,
+        web_views=web_views,
+        web_clicks=web_clicks,
+        links=links,
+    )
+
+
+def process_posts(raw_posts, schema=None):
+    """Processa posts crus da API em formato limpo.
+
+    Aceita qualquer iterável (inclusive o gerador iter_posts): cada post é
+    normalizado assim que chega e o payload cru é descartado em seguida.
+    O esquema de stats é resolvido no primeiro post (ver PostStatsSchema).
+    """
+    schema = schema or PostStatsSchema()
+    posts = [rec for rec in (normalize_post(p, schema) for p in raw_posts) if rec is not None]
+    posts.sort(key=attrgetter("ts"))
     return posts
 
 
-def process_subscribers(sub_data, posts=None):
-    """Processa subscribers em formato limpo.
+# Parâmetros de tracking removidos das URLs antes de agrupar os links
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "_hsenc", "_hsmi",
+                   "ref", "ref_src", "_bhlid", "last_resource_guid"}
+TRACKING_PREFIXES = ("utm_",)
 
-    Usa amostra parcial + total da API + dados de delivered dos posts.
+
+@lru_cache(maxsize=65536)
+def normalize_link(url):
+    """Normaliza uma URL clicada: retorna (chave domínio+caminho, URL limpa).
+
+    A URL limpa perde só os parâmetros de tracking; a chave ignora esquema,
+    "www.", query, fragmento e barra final, para que variações do mesmo
+    link caiam juntas. Links repetem muito entre edições, daí o cache.
     """
-    raw_subs = sub_data.get("raw", [])
-    total_from_api = sub_data.get("total_from_api", 0)
+    parts = urllib.parse.urlsplit((url or "").strip())
+    host = (parts.hostname or "").lower()
+    if not host:
+        return None, url
+    query = [
+        (k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    clean = urllib.parse.urlunsplit(
+        (parts.scheme.lower() or "https", parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), "")
+    )
+    if host.startswith("www."):
+        host = host[4:]
+    key = host + parts.path.rstrip("/")
+    return key, clean
 
-    by_month = defaultdict(lambda: {"new": 0, "active": 0, "inactive": 0})
-    active_in_sample = 0
-    parsed_dates = 0
 
-    for s in raw_subs:
-        status = (s.get("status") or "").lower()
+class LinkIndex:
+    """Cliques por link entre edições, numa matriz esparsa (formato CSR).
 
-        # Tenta múltiplos campos de data
-        created = None
-        for field in ["created_at", "created", "subscribed_at", "joined_at", "utm_created_at"]:
-            if s.get(field):
-                created = s[field]
-                break
+    Cada link normalizado (ver normalize_link) recebe um id; para cada post
+    guardamos só os links que ele tem: `indptr[i]:indptr[i+1]` delimita em
+    `link_ids`/`total`/`unique` as entradas do post i. Como os posts estão
+    em ordem cronológica, o top-K de um período é a soma de uma fatia.
+    """
 
-        dt = None
-        if isinstance(created, (int, float)):
-            # Unix timestamp (pode ser em segundos ou milissegundos)
-            ts = created / 1000 if created > 1e12 else created
-            try:
-                dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-            except:
-                pass
-        elif isinstance(created, str):
-            # Tenta ISO format
-            for fmt_str in ["%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d"]:
-                try:
-                    dt = datetime.strptime(created.replace("Z", "+00:00").replace("+00:00", "+0000"), fmt_str)
-                    break
-                except:
-                    pass
-            if not dt:
-                try:
-                    dt = datetime.fromisoformat(created.replace("Z", "+00:00"))
-                except:
-                    pass
+    def __init__(self):
+        self.keys = []
+        self.urls = []  # URL exibida: a primeira vista para a chave, sem tracking
+        self._ids = {}
+        self.indptr = array("q", [0])
+        self.link_ids = array("q")
+        self.total = array("q")
+        self.unique = array("q")
+
+    @classmethod
+    def from_posts(cls, posts):
+        index = cls()
+        for p in posts:
+            index.add_post(p.links)
+        return index
+
+    def add_post(self, links):
+        counts = {}
+        for url, total, unique in links:
+            key, clean = normalize_link(url)
+            if not key:
+                continue
+            link_id = self._ids.get(key)
+            if link_id is None:
+                link_id = self._ids[key] = len(self.keys)
+                self.keys.append(key)
+                self.urls.append(clean)
+            t, u = counts.get(link_id, (0, 0))
+            counts[link_id] = (t + total, u + unique)
+        for link_id, (t, u) in counts.items():
+            self.link_ids.append(link_id)
+            self.total.append(t)
+            self.unique.append(u)
+        self.indptr.append(len(self.link_ids))
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def top(self, start=0, stop=None, k=15):
+        """Top-K links por cliques únicos nos posts [start, stop)."""
+        stop = len(self) if stop is None else stop
+        lo, hi = self.indptr[start], self.indptr[stop]
+        if lo == hi:
+            return []
+        if np is not None:
+            ids = np.frombuffer(self.link_ids, dtype=np.int64)[lo:hi]
+            n = len(self.keys)
+            unique = np.bincount(ids, weights=np.frombuffer(self.unique, dtype=np.int64)[lo:hi], minlength=n)
+            total = np.bincount(ids, weights=np.frombuffer(self.total, dtype=np.int64)[lo:hi], minlength=n)
+            present = np.unique(ids)
+            best = heapq.nlargest(k, present.tolist(), key=lambda i: (unique[i], total[i], -i))
+            totals = {i: (int(total[i]), int(unique[i])) for i in best}
+        else:
+            sums = defaultdict(lambda: [0, 0])
+            for j in range(lo, hi):
+                acc = sums[self.link_ids[j]]
+                acc[0] += self.total[j]
+                acc[1] += self.unique[j]
+            best = heapq.nlargest(k, sums, key=lambda i: (sums[i][1], sums[i][0], -i))
+            totals = {i: tuple(sums[i]) for i in best}
+        return [{"url": self.urls[i], "key": self.keys[i], "total": totals[i][0], "unique": totals[i][1]}
+                for i in best]
+
+
+def _id_key(value):
+    """Hash de 64 bits (com sinal) de um id de subscriber, para guardar em array('q')."""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
 
-        if dt:
-            parsed_dates += 1
-            month_key = dt.strftime("%Y-%m")
-            by_month[month_key]["new"] += 1
 
-        if status == "active":
-            active_in_sample += 1
+# Status como código pequeno (array('b')); 0 = desconhecido
+SUBSCRIBER_STATUS_CODES = {"active": 1, "inactive": 2, "validating": 3, "invalid": 4, "pending": 5}
 
-    print(f"  Datas parseadas: {parsed_dates}/{len(raw_subs)}")
 
-    # Estima taxa de ativos com base na amostra
-    sample_size = len(raw_subs)
-    active_rate = (active_in_sample / sample_size) if sample_size > 0 else 0.85
+class SubscriberColumns:
+    """Subscribers em colunas compactas em vez de uma lista de dicts.
+
+    Cada subscriber ocupa 17 bytes: created (epoch int64, 0 = sem data),
+    status (código int8) e key (hash int64 do id). As agregações usam NumPy
+    quando disponível e caem para operações do módulo array caso contrário.
+    """
+
+    def __init__(self):
+        self.created = array("q")
+        self.status = array("b")
+        self.key = array("q")
+
+    @classmethod
+    def from_records(cls, records):
+        """Monta as colunas a partir de um iterável de subscribers crus (streaming)."""
+        cols = cls()
+        dates = DateNormalizer(SUBSCRIBER_DATE_FIELDS)
+        status, key = cols.status.append, cols.key.append
+        codes = SUBSCRIBER_STATUS_CODES
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, 65536))
+            if not chunk:
+                return cols
+            cols.created.extend(dates.column(chunk))
+            for s in chunk:
+                status(codes.get((s.get("status") or "").lower(), 0))
+                key(_id_key(s.get("id", s.get("email", len(cols.key)))))
+
+    def __len__(self):
+        return len(self.key)
+
+    def _np(self, column):
+        return np.frombuffer(column, dtype=np.int64 if column.typecode == "q" else np.int8)
+
+    def dedupe(self):
+        """Remove ids repetidos, mantendo a primeira ocorrência."""
+        if np is not None:
+            _, first = np.unique(self._np(self.key), return_index=True)
+            keep = np.sort(first)
+            out = SubscriberColumns()
+            out.created.frombytes(self._np(self.created)[keep].tobytes())
+            out.status.frombytes(self._np(self.status)[keep].tobytes())
+            out.key.frombytes(self._np(self.key)[keep].tobytes())
+            return out
+        out, seen = SubscriberColumns(), set()
+        for i, k in enumerate(self.key):
+            if k not in seen:
+                seen.add(k)
+                out.created.append(self.created[i])
+                out.status.append(self.status[i])
+                out.key.append(k)
+        return out
+
+    def count_status(self, name):
+        return self.status.count(SUBSCRIBER_STATUS_CODES[name])
+
+    def dated_count(self):
+        return len(self.created) - self.created.count(0)
+
+    def month_counts(self):
+        """Novos subscribers por mês ("YYYY-MM"), em ordem cronológica."""
+        if np is not None:
+            created = self._np(self.created)
+            months = created[created != 0].astype("datetime64[s]").astype("datetime64[M]")
+            values, counts = np.unique(months, return_counts=True)
+            return [(str(m), int(c)) for m, c in zip(values, counts)]
+        # Sem NumPy: conta por dia (poucos valores distintos) e só então converte
+        by_day = Counter(ts // 86400 for ts in self.created if ts)
+        by_month = Counter()
+        for day, count in by_day.items():
+            by_month[datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime("%Y-%m")] += count
+        return sorted(by_month.items())
+
+
+def process_subscribers(sub_data, posts=None):
+    """Processa subscribers em formato limpo.
+
+    Usa amostra parcial + total da API + dados de delivered dos posts.
+    `sub_data["raw"]` pode ser uma lista ou um iterável em streaming (export
+    completo): é percorrido uma única vez e guardado em SubscriberColumns.
+    """
+    store = SubscriberColumns.from_records(sub_data.get("raw", []))
+    total_from_api = sub_data.get("total_from_api", 0)
+    if sub_data.get("is_full_export"):
+        # A paginação por cursor pode repetir registros se a base mudar durante o export:
+        # o total publicado é o da base deduplicada
+        store = store.dedupe()
+        total_from_api = len(store)
+        report = CURRENT_REPORT.get()
+        if report is not None:
+            report.extra["subscriber_export"] = {"records": sub_data.get("export_records"), "unique": total_from_api}
+
+    sample_size = len(store)
+    print(f"  Datas parseadas: {store.dated_count()}/{sample_size}")
+
+    # Taxa de ativos: amostragem estratificada (com IC) se houver; senão a amostra
+    status_sample = sub_data.get("status_sample")
+    if status_sample:
+        active_rate = status_sample["active_rate"]
+    else:
+        active_rate = (store.count_status("active") / sample_size) if sample_size > 0 else 0.85
     total = total_from_api if total_from_api > sample_size else sample_size
     estimated_active = int(total * active_rate)
 
     # Gera série temporal da amostra
-    sorted_months = sorted(by_month.keys())
-    cumulative = 0
-    timeline_from_subs = []
-    for m in sorted_months:
-        cumulative += by_month[m]["new"]
-        timeline_from_subs.append({
-            "month": m,
-            "new": by_month[m]["new"],
-            "cumulative": cumulative,
-        })
+    month_counts = store.month_counts()
+    timeline_from_subs = [
+        {"month": m, "new": new, "cumulative": cumulative}
+        for (m, new), cumulative in zip(month_counts, accumulate(c for _, c in month_counts))
+    ]
 
     # ALTERNATIVA: usa "delivered" dos posts como proxy de subscriber count ao longo do tempo
     # Isso é muito mais preciso que a amostra para bases grandes
@@ -481,9 +2063,9 @@ def process_subscribers(sub_data, posts=None):
     if posts:
         post_by_month = defaultdict(lambda: {"delivered": 0, "count": 0})
         for p in posts:
-            if p.get("delivered", 0) > 0 and p.get("date"):
-                month_key = p["date"][:7]
-                post_by_month[month_key]["delivered"] = max(post_by_month[month_key]["delivered"], p["delivered"])
+            if p.delivered > 0:
+                month_key = p.month
+                post_by_month[month_key]["delivered"] = max(post_by_month[month_key]["delivered"], p.delivered)
                 post_by_month[month_key]["count"] += 1
 
         for m in sorted(post_by_month.keys()):
@@ -493,8 +2075,13 @@ def process_subscribers(sub_data, posts=None):
                 "editions": post_by_month[m]["count"],
             })
 
-    # Usa a timeline dos posts se disponível (mais precisa)
-    use_posts_timeline = len(timeline_from_posts) > len(timeline_from_subs)
+    # Crescimento exato (BEEHIIV_EXACT_GROWTH) substitui a série da amostra
+    timeline_exact = bool(sub_data.get("growth_exact"))
+    if timeline_exact:
+        timeline_from_subs = sub_data["growth_exact"]
+
+    # Usa a timeline dos posts se disponível (mais precisa), a menos que haja a exata
+    use_posts_timeline = not timeline_exact and len(timeline_from_posts) > len(timeline_from_subs)
 
     return {
         "total": total,
@@ -506,115 +2093,719 @@ def process_subscribers(sub_data, posts=None):
         "timeline_subs": timeline_from_subs,
         "timeline_posts": timeline_from_posts,
         "use_posts_timeline": use_posts_timeline,
+        "timeline_exact": timeline_exact,
+        "active_rate_ci": [round(x, 1) for x in status_sample["ci"]] if status_sample else None,
+        "status_sample_pages": status_sample["pages"] if status_sample else 0,
+        "status_sample_coverage": int(status_sample["coverage"] * 100) if status_sample else None,
     }
 
 
+def period_label(period):
+    return PERIOD_LABELS.get(period) or f"Últimos {period} dias"
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0
+
+
+def _period_stats(posts, offset, links):
+    """Agregados de um recorte de posts (índices relativos à lista completa)."""
+    n = len(posts)
+    if not n:
+        return {"count": 0}
+    open_rates = [p.open_rate for p in posts]
+    click_rates = [p.click_rate for p in posts]
+
+    # Tendência: média da 2ª metade menos a da 1ª
+    mid = n // 2
+    open_delta = _mean(open_rates[mid:]) - _mean(open_rates[:mid]) if mid else 0
+    click_delta = _mean(click_rates[mid:]) - _mean(click_rates[:mid]) if mid else 0
+
+    day_sum, day_count = [0.0] * 7, [0] * 7
+    hist = [0] * 10
+    for p in posts:
+        dow = p.day_of_week
+        day_sum[dow] += p.open_rate
+        day_count[dow] += 1
+        idx = min(int(p.open_rate // 10), len(hist) - 1)
+        if idx >= 0:
+            hist[idx] += 1
+
+    # Melhor edição = primeira com maior open rate; pior = última com o menor
+    best = max(range(n), key=lambda i: (open_rates[i], -i))
+    worst = min(range(n), key=lambda i: (open_rates[i], -i))
+
+    return {
+        "count": n,
+        "avg_open": round(_mean(open_rates), 4),
+        "avg_click": round(_mean(click_rates), 4),
+        "avg_cto": round(_mean([p.cto_rate for p in posts]), 4),
+        "avg_unsub": round(_mean([p.unsub_rate for p in posts]), 4),
+        "open_delta": round(open_delta, 4),
+        "click_delta": round(click_delta, 4),
+        "total_sent": sum(p.delivered for p in posts),
+        "total_web_views": sum(p.web_views for p in posts),
+        "max_delivered": max(p.delivered for p in posts),
+        "latest_delivered": posts[-1].delivered,
+        "weekday_avg": [round(day_sum[d] / day_count[d], 4) if day_count[d] else 0 for d in range(7)],
+        "weekday_count": day_count,
+        "open_hist": hist,
+        "max_open_rate": open_rates[best],
+        "max_click_rate": max(click_rates),
+        "best": offset + best,
+        "worst": offset + worst,
+        "top_links": links.top(offset, offset + n, LINK_TOP_K),
+    }
+
+
+# Séries dos gráficos por edição que são reduzidas com LTTB
+CHART_SERIES_FIELDS = ["open_rate", "click_rate", "cto_rate", "unsub_rate"]
+
+
+def lttb(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets: índices dos pontos que representam a série.
+
+    Mantém o primeiro e o último ponto e, em cada um dos `threshold - 2`
+    baldes do meio, o ponto que forma o maior triângulo com o ponto escolhido
+    no balde anterior e a média do balde seguinte — picos e vales sobrevivem.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    picked = [0]
+    a = 0
+    for b in range(threshold - 2):
+        lo = int(b * every) + 1
+        hi = int((b + 1) * every) + 1
+        # Média do balde seguinte (o último "balde" é o ponto final)
+        nlo, nhi = hi, min(int((b + 2) * every) + 1, n)
+        if nlo >= nhi:
+            nlo, nhi = n - 1, n
+        avg_x = sum(xs[nlo:nhi]) / (nhi - nlo)
+        avg_y = sum(ys[nlo:nhi]) / (nhi - nlo)
+        ax, ay = xs[a], ys[a]
+        best, best_area = lo, -1.0
+        for i in range(lo, hi):
+            area = abs((ax - avg_x) * (ys[i] - ay) - (ax - xs[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return picked
+
+
+# ------------------------------------------------------------
+# Estatísticas de engajamento: os números dos insights vêm prontos do
+# gerador (o navegador só escolhe o texto). Medianas e percentis em vez de
+# médias, médias móveis de 7/28 edições, efeito do dia da semana e da hora
+# de envio com IC 95% e edições fora da curva.
+# ------------------------------------------------------------
+INSIGHT_METRICS = ["open_rate", "click_rate", "cto_rate", "unsub_rate"]
+INSIGHT_PERCENTILES = (10, 25, 50, 75, 90)
+ROLLING_WINDOWS = (7, 28)
+ROLLING_METRICS = ["open_rate", "click_rate"]
+# Fora da curva: open rate comparado à média das OUTLIER_BASELINE edições
+# anteriores; z robusto (mediana/MAD dos desvios) acima de OUTLIER_Z. O MAD
+# tem piso de OUTLIER_MIN_MAD pontos: numa série quase sem ruído, qualquer
+# oscilação pequena viraria "fora da curva"
+OUTLIER_BASELINE = 28
+OUTLIER_Z = 3.5
+OUTLIER_MIN_MAD = 1.0
+OUTLIER_EXAMPLES = 3
+# Mínimo de edições num dia/hora para disputar o "melhor dia/horário"
+EFFECT_MIN_EDITIONS = 3
+Z_95 = 1.96
+
+
+def _percentile(sorted_values, q):
+    """Percentil com interpolação linear (o método padrão do NumPy)."""
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def rolling_mean(values, window):
+    """Média móvel das últimas `window` edições (incluindo a atual)."""
+    if np is not None:
+        x = np.asarray(values, dtype=float)
+        csum = np.concatenate(([0.0], np.cumsum(x)))
+        idx = np.arange(1, len(x) + 1)
+        lo = np.maximum(0, idx - window)
+        return ((csum[idx] - csum[lo]) / (idx - lo)).tolist()
+    csum = [0.0, *accumulate(values)]
+    return [(csum[i] - csum[max(0, i - window)]) / min(i, window) for i in range(1, len(values) + 1)]
+
+
+def robust_outlier_z(values, baseline=OUTLIER_BASELINE):
+    """z robusto de cada edição contra a média das `baseline` anteriores.
+
+    O desvio de cada edição (valor - média das anteriores) é padronizado
+    pela mediana e pelo MAD dos desvios (com piso OUTLIER_MIN_MAD), que não
+    se deixam levar pelas próprias edições extremas. A primeira edição não
+    tem referência (z=0).
+    """
+    n = len(values)
+    if n < 3:
+        return [0.0] * n
+    if np is not None:
+        x = np.asarray(values, dtype=float)
+        csum = np.concatenate(([0.0], np.cumsum(x)))
+        idx = np.arange(1, n)
+        lo = np.maximum(0, idx - baseline)
+        resid = x[1:] - (csum[idx] - csum[lo]) / (idx - lo)
+        med = float(np.median(resid))
+        mad = max(float(np.median(np.abs(resid - med))), OUTLIER_MIN_MAD)
+        return [0.0] + (0.6745 * (resid - med) / mad).tolist()
+    csum = [0.0, *accumulate(values)]
+    resid = [values[i] - (csum[i] - csum[max(0, i - baseline)]) / min(i, baseline) for i in range(1, n)]
+    srt = sorted(resid)
+    med = _percentile(srt, 50)
+    mad = max(_percentile(sorted(abs(r - med) for r in resid), 50), OUTLIER_MIN_MAD)
+    return [0.0] + [0.6745 * (r - med) / mad for r in resid]
+
+
+class EngagementStats:
+    """Séries por edição calculadas uma vez; `summary` recorta um período.
+
+    No construtor (uma passada pelos posts) saem as colunas das métricas,
+    dia da semana e hora de envio, as médias móveis e o z de cada edição.
+    `summary(start)` resume o sufixo [start:] da lista: percentis, efeitos
+    de dia/hora e edições fora da curva. Com NumPy, vetorizado.
+    """
+
+    def __init__(self, email_posts):
+        self.n = len(email_posts)
+        self.columns = {m: [getattr(p, m) for p in email_posts] for m in INSIGHT_METRICS}
+        self.weekday = [p.day_of_week for p in email_posts]
+        self.hour = [p.hour for p in email_posts]
+        self.rolling = {m: {w: rolling_mean(self.columns[m], w) for w in ROLLING_WINDOWS} for m in ROLLING_METRICS}
+        self.outlier_z = robust_outlier_z(self.columns["open_rate"])
+
+    def summary(self, start=0):
+        stop = self.n
+        if start >= stop:
+            return {}
+        opens = self.columns["open_rate"][start:stop]
+        result = {
+            "percentiles": {m: self._percentiles(self.columns[m][start:stop]) for m in INSIGHT_METRICS},
+            "weekday": self._effects(self.weekday[start:stop], opens, 7),
+            "hour": self._effects(self.hour[start:stop], opens, 24),
+            "outliers": self._outliers(start, stop),
+        }
+        # Médias móveis na última edição, só com histórico suficiente para a janela maior
+        if stop >= max(ROLLING_WINDOWS):
+            result["rolling"] = {m: {str(w): round(series[w][stop - 1], 4) for w in ROLLING_WINDOWS}
+                                 for m, series in self.rolling.items()}
+        return result
+
+    @staticmethod
+    def _percentiles(values):
+        if np is not None:
+            qs = np.percentile(np.asarray(values, dtype=float), INSIGHT_PERCENTILES).tolist()
+        else:
+            srt = sorted(values)
+            qs = [_percentile(srt, q) for q in INSIGHT_PERCENTILES]
+        return {f"p{q}": round(v, 4) for q, v in zip(INSIGHT_PERCENTILES, qs)}
+
+    @staticmethod
+    def _effects(groups, values, size):
+        """Média, IC 95% e efeito (vs. média do período) de cada grupo.
+
+        `best` é o grupo de maior média entre os que têm ao menos
+        EFFECT_MIN_EDITIONS edições (se houver dois ou mais para comparar);
+        `significant` diz se o IC dele fica inteiro acima da média geral.
+        """
+        if np is not None:
+            g = np.asarray(groups, dtype=np.int64)
+            x = np.asarray(values, dtype=float)
+            count = np.bincount(g, minlength=size).tolist()
+            total = np.bincount(g, weights=x, minlength=size).tolist()
+            squares = np.bincount(g, weights=x * x, minlength=size).tolist()
+        else:
+            count, total, squares = [0] * size, [0.0] * size, [0.0] * size
+            for k, v in zip(groups, values):
+                count[k] += 1
+                total[k] += v
+                squares[k] += v * v
+        overall = sum(total) / len(values)
+        groups_out = []
+        for k in range(size):
+            n = count[k]
+            if not n:
+                groups_out.append({"n": 0})
+                continue
+            mean = total[k] / n
+            ci = Z_95 * (max(squares[k] - n * mean * mean, 0) / (n - 1) / n) ** 0.5 if n > 1 else None
+            groups_out.append({"n": n, "mean": round(mean, 4), "ci": None if ci is None else round(ci, 4),
+                               "effect": round(mean - overall, 4)})
+        ranked = [k for k in range(size) if count[k] >= EFFECT_MIN_EDITIONS]
+        best = None
+        if len(ranked) >= 2:
+            k = max(ranked, key=lambda k: (groups_out[k]["mean"], -k))
+            best = {"index": k, "significant": groups_out[k]["mean"] - groups_out[k]["ci"] > overall}
+        return {"groups": groups_out, "best": best}
+
+    def _outliers(self, start, stop):
+        z = self.outlier_z
+        high = [i for i in range(start, stop) if z[i] > OUTLIER_Z]
+        low = [i for i in range(start, stop) if z[i] < -OUTLIER_Z]
+        return {
+            "high_count": len(high),
+            "low_count": len(low),
+            "high": sorted(high, key=lambda i: -z[i])[:OUTLIER_EXAMPLES],
+            "low": sorted(low, key=lambda i: z[i])[:OUTLIER_EXAMPLES],
+        }
+
+
+def build_period_aggregates(email_posts, periods=None, now=None, links=None):
+    """Pré-calcula os agregados do dashboard para cada período do filtro.
+
+    `email_posts` está em ordem cronológica, então cada período é um sufixo
+    da lista: `start` é o índice da primeira edição dentro do período e o
+    navegador só precisa fatiar a lista e ler a tabela. `links` é o LinkIndex
+    montado sobre a mesma lista (criado aqui se não vier pronto).
+
+    Períodos com mais de CHART_MAX_POINTS edições levam também `series`: os
+    índices (LTTB) que cada gráfico por edição deve desenhar. `insights` traz
+    os números dos insights do período (ver EngagementStats).
+    """
+    periods = periods or PERIODS
+    now = now or time.time()
+    if links is None:
+        links = LinkIndex.from_posts(email_posts)
+    stamps = [p.ts for p in email_posts]
+    stats = EngagementStats(email_posts)
+    aggregates = {}
+    for period in periods:
+        start = 0 if period == "all" else bisect_left(stamps, now - int(period) * 86400)
+        window = email_posts[start:]
+        aggregates[period] = dict(start=start, **_period_stats(window, start, links))
+        if window:
+            aggregates[period]["insights"] = stats.summary(start)
+        if len(window) > CHART_MAX_POINTS:
+            aggregates[period]["series"] = {
+                field: [start + i for i in lttb(stamps[start:], [getattr(p, field) for p in window], CHART_MAX_POINTS)]
+                for field in CHART_SERIES_FIELDS
+            }
+    return aggregates
+
+
+# ============================================================
+# HISTÓRICO — snapshots diários em SQLite
+# ============================================================
+# A API só devolve o estado atual: as stats de um post mudam nos dias após o
+# envio e o total de subscribers muda todo dia, mas nada disso fica guardado.
+# Cada execução acrescenta um snapshot do dia; reexecutar no mesmo dia
+# substitui o snapshot daquele dia.
+SNAPSHOT_METRICS = [
+    "recipients", "delivered", "unique_opens", "total_opens", "unique_clicks", "total_clicks",
+    "unsubscribes", "spam_reports", "web_views", "web_clicks",
+]
+
+HISTORY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS post_snapshots (
+    post_id TEXT NOT NULL,
+    snapshot_date TEXT NOT NULL,
+    publish_date TEXT,
+    {", ".join(f"{m} INTEGER" for m in SNAPSHOT_METRICS)},
+    PRIMARY KEY (post_id, snapshot_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS post_snapshots_by_date ON post_snapshots (snapshot_date);
+CREATE TABLE IF NOT EXISTS subscriber_snapshots (
+    snapshot_date TEXT PRIMARY KEY,
+    total INTEGER,
+    active INTEGER,
+    inactive INTEGER,
+    is_sampled INTEGER
+);
+"""
+
+
+def open_history(path):
+    """Abre (e cria, se preciso) o banco de histórico."""
+    conn = sqlite3.connect(path)
+    conn.executescript(HISTORY_SCHEMA)
+    return conn
+
+
+def record_snapshot(posts, subscribers, path, day=None):
+    """Grava o snapshot do dia: stats de cada post e os totais de subscribers.
+
+    Sem total de subscribers (busca falhou), só os posts entram no snapshot.
+    """
+    day = day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    columns = ["post_id", "snapshot_date", "publish_date"] + SNAPSHOT_METRICS
+    sql = (f"INSERT OR REPLACE INTO post_snapshots ({', '.join(columns)}) "
+           f"VALUES ({', '.join('?' * len(columns))})")
+    rows = ([p.id, day, p.date] + [getattr(p, m) for m in SNAPSHOT_METRICS] for p in posts if p.id)
+    conn = open_history(path)
+    try:
+        with conn:
+            conn.executemany(sql, rows)
+            if subscribers.get("total") is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO subscriber_snapshots VALUES (?, ?, ?, ?, ?)",
+                    (day, subscribers["total"], subscribers.get("active", 0),
+                     subscribers.get("inactive", 0), int(bool(subscribers.get("is_sampled")))),
+                )
+        return conn.execute("SELECT COUNT(DISTINCT snapshot_date) FROM subscriber_snapshots").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _iso_week(day):
+    """Semana ISO ('YYYY-Www', ano ISO) de uma data 'YYYY-MM-DD'."""
+    year, week, _ = datetime.fromisoformat(day[:10]).isocalendar()
+    return f"{year:04d}-W{week:02d}"
+
+
+def compact_history(path, daily_days=None):
+    """Compacta o histórico sem perder as curvas.
+
+    1. Remove snapshots de post idênticos ao anterior do mesmo post (stats
+       congeladas depois de algumas semanas), mantendo o primeiro e o último.
+    2. Snapshots com mais de `daily_days` dias ficam só o último de cada
+       semana ISO (segunda a domingo, ano ISO: a semana da virada do ano
+       não se parte em duas) por post / para os subscribers.
+    Retorna quantas linhas foram removidas.
+    """
+    daily_days = HISTORY_DAILY_DAYS if daily_days is None else daily_days
+    cutoff = (datetime.now(timezone.utc).date().toordinal() - daily_days)
+    cutoff = datetime.fromordinal(cutoff).strftime("%Y-%m-%d")
+    same = " AND ".join(f"a.{m} IS b.{m}" for m in SNAPSHOT_METRICS)
+    conn = open_history(path)
+    conn.create_function("iso_week", 1, _iso_week, deterministic=True)
+    try:
+        with conn:
+            removed = conn.execute(f"""
+                DELETE FROM post_snapshots WHERE (post_id, snapshot_date) IN (
+                    SELECT b.post_id, b.snapshot_date FROM post_snapshots b
+                    JOIN post_snapshots a ON a.post_id = b.post_id AND a.snapshot_date = (
+                        SELECT MAX(snapshot_date) FROM post_snapshots
+                        WHERE post_id = b.post_id AND snapshot_date < b.snapshot_date)
+                    WHERE {same}
+                      AND b.snapshot_date < (SELECT MAX(snapshot_date) FROM post_snapshots WHERE post_id = b.post_id)
+                )""").rowcount
+            removed += conn.execute("""
+                DELETE FROM post_snapshots WHERE snapshot_date < ? AND snapshot_date NOT IN (
+                    SELECT MAX(snapshot_date) FROM post_snapshots p2
+                    WHERE p2.post_id = post_snapshots.post_id AND p2.snapshot_date < ?
+                    GROUP BY iso_week(p2.snapshot_date)
+                )""", (cutoff, cutoff)).rowcount
+            removed += conn.execute("""
+                DELETE FROM subscriber_snapshots WHERE snapshot_date < ? AND snapshot_date NOT IN (
+                    SELECT MAX(snapshot_date) FROM subscriber_snapshots WHERE snapshot_date < ?
+                    GROUP BY iso_week(snapshot_date)
+                )""", (cutoff, cutoff)).rowcount
+        conn.execute("VACUUM")
+        return removed
+    finally:
+        conn.close()
+
+
 # ============================================================
 # 3. GERAR DASHBOARD HTML
 # ============================================================
-def generate_dashboard(posts, subscribers, raw_stats_sample):
-    """Gera o dashboard HTML completo."""
+# Campos de cada post que os gráficos/tabela do dashboard usam
+DASHBOARD_POST_FIELDS = [
+    "title", "date", "date_label", "day_of_week", "delivered", "unique_opens", "unique_clicks",
+    "open_rate", "click_rate", "cto_rate", "unsubscribes", "unsub_rate", "web_views", "web_clicks",
+]
+
+
+# Colunas ordenáveis da tabela com ordem pré-calculada; "date"/"date_label"
+# não precisam, a lista já está em ordem cronológica
+TABLE_SORT_FIELDS = [
+    "title", "delivered", "unique_opens", "open_rate", "unique_clicks", "click_rate", "cto_rate",
+    "unsubscribes", "web_views",
+]
+
+
+def build_sort_orders(email_posts):
+    """Índices de `email_posts` em ordem crescente para cada coluna da tabela.
 
+    O navegador só percorre esses índices (de trás para frente quando a
+    ordem é decrescente) e descarta os que estão fora do período ou da
+    busca, sem reordenar nada a cada clique.
+    """
+    orders = {}
+    for field in TABLE_SORT_FIELDS:
+        if field == "title":
+            column = [(p.title or "").lower() for p in email_posts]
+        else:
+            column = [getattr(p, field) for p in email_posts]
+        orders[field] = sorted(range(len(email_posts)), key=column.__getitem__)
+    return orders
+
+
+def build_dashboard_payload(posts, subscribers, raw_stats_sample):
+    """Monta os dados do dashboard: só posts com email, só os campos usados.
+
+    Os posts vão em formato colunar ({columns, rows}) para não repetir as
+    chaves em cada edição; `periods` traz os agregados de cada filtro e
+    `order` a ordem de cada coluna da tabela.
+    """
     # Filtra posts: separa web-only (delivered=0) de email posts
-    email_posts = [p for p in posts if p.get("delivered", 0) > 0]
-    web_only_posts = [p for p in posts if p.get("delivered", 0) == 0]
+    email_posts = [p for p in posts if p.delivered > 0]
+    web_only = len(posts) - len(email_posts)
 
     print(f"  Posts com email data: {len(email_posts)}")
-    print(f"  Posts web-only (excluídos da análise de email): {len(web_only_posts)}")
+    print(f"  Posts web-only (excluídos da análise de email): {web_only}")
 
-    posts_json = json.dumps(email_posts, ensure_ascii=False, default=str)
-    all_posts_json = json.dumps(posts, ensure_ascii=False, default=str)
-    subs_json = json.dumps(subscribers, ensure_ascii=False, default=str)
+    row = attrgetter(*DASHBOARD_POST_FIELDS)
+    payload = {
+        "posts": {
+            "columns": DASHBOARD_POST_FIELDS,
+            "rows": [row(p) for p in email_posts],
+        },
+        "periods": build_period_aggregates(email_posts),
+        "order": build_sort_orders(email_posts),
+        "subs": subscribers,
+        "web_only_posts": web_only,
+    }
+    if DEBUG_RAW_STATS and raw_stats_sample:
+        payload["raw_stats"] = raw_stats_sample
+    return payload
+
+
+def dump_payload(payload, subs_json=None):
+    """Serializa o payload em JSON compacto, seguro para embutir em <script>.
+
+    Com `subs_json` (os subscribers já serializados, os mesmos bytes do
+    arquivo de dados), payload["subs"] não é codificado de novo.
+    """
+    if subs_json is None:
+        data = json_bytes(payload)
+    else:
+        data = json_bytes({k: v for k, v in payload.items() if k != "subs"})[:-1] + b',"subs":' + subs_json + b"}"
+    return data.decode("utf-8").replace("</", "<\\/")
 
-    html = f"""<!DOCTYPE html>
+
+def write_data_file(path, posts, subs_json):
+    """Grava o dump de dados brutos ({posts, subscribers}) em streaming.
+
+    Cada post é codificado uma vez e vai direto para o arquivo, um por
+    linha, sem montar a string do arquivo inteiro; os subscribers entram
+    já serializados. Grava num temporário e renomeia no fim.
+    """
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b'{"posts":[')
+        sep = b"\n"
+        for post in posts:
+            f.write(sep)
+            f.write(json_bytes(post.to_dict()))
+            sep = b",\n"
+        f.write(b'\n],"subscribers":')
+        f.write(subs_json)
+        f.write(b"}\n")
+    os.replace(tmp_path, path)
+
+
+def payload_version(payload_json):
+    """Hash curto do payload, usado na URL do shell (?v=) para invalidar caches."""
+    return hashlib.sha256(payload_json.encode("utf-8")).hexdigest()[:16]
+
+
+def write_payload_files(payload_json, path):
+    """Grava o payload do modo split: JSON puro + cópia gzip pré-comprimida.
+
+    Se o JSON não mudou, nenhum dos dois arquivos é regravado (nem o gzip
+    recomprimido). Retorna (tamanho, gravou?).
+    """
+    data = payload_json.encode("utf-8")
+    changed = write_if_changed(path, data) or not os.path.exists(path + ".gz")
+    if changed:
+        write_if_changed(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    return len(data), changed
+
+
+# ------------------------------------------------------------
+# Templates: o HTML é texto literal com slots @@nome@@. compile_template
+# separa os trechos fixos uma vez (cache pelo hash do conteúdo);
+# render_template só intercala os valores do dia.
+# ------------------------------------------------------------
+TEMPLATE_SLOT_RE = re.compile(r"@@(\w+)@@")
+# Slots que mudam a cada execução sem que o conteúdo mude (fora do hash)
+VOLATILE_SLOTS = {"generated_at"}
+CONTENT_HASH_RE = re.compile(rb'<meta name="content-hash" content="(\w+)">')
+_COMPILED_TEMPLATES = {}  # sha256(template + slots fixos) -> (trechos, slots, chave)
+
+
+def compile_template(source, **static):
+    """Pré-compila um template em trechos literais intercalados com slots.
+
+    Os slots de `static` (iguais em toda execução, como as opções de
+    período) já vão fundidos nos trechos. O resultado fica em cache pelo
+    hash do conteúdo: o template é varrido uma vez por processo, mesmo no
+    modo lote, e qualquer edição nele gera uma nova entrada.
+    """
+    key = hashlib.sha256(json.dumps([source, sorted(static.items())]).encode("utf-8")).hexdigest()
+    compiled = _COMPILED_TEMPLATES.get(key)
+    if compiled is None:
+        pieces = TEMPLATE_SLOT_RE.split(source)  # texto, slot, texto, slot, ..., texto
+        texts, slots = [pieces[0]], []
+        for name, text in zip(pieces[1::2], pieces[2::2]):
+            if name in static:
+                texts[-1] += static[name] + text
+            else:
+                slots.append(name)
+                texts.append(text)
+        compiled = _COMPILED_TEMPLATES[key] = (tuple(texts), tuple(slots), key)
+    return compiled
+
+
+def render_template(compiled, **values):
+    """Preenche os slots de um template compilado.
+
+    O slot "content_hash", se existir, recebe o hash do template e dos
+    valores, sem os VOLATILE_SLOTS: duas execuções com os mesmos dados
+    geram o mesmo hash, ainda que o horário no cabeçalho mude.
+    """
+    texts, slots, key = compiled
+    digest = hashlib.sha256(key.encode("ascii"))
+    for name in slots:
+        if name not in VOLATILE_SLOTS and name != "content_hash":
+            digest.update(b"\0" + name.encode("ascii") + b"=" + str(values[name]).encode("utf-8"))
+    values["content_hash"] = digest.hexdigest()
+    out = [texts[0]]
+    for name, text in zip(slots, texts[1:]):
+        out.append(values[name])
+        out.append(text)
+    return "".join(out)
+
+
+def write_if_changed(path, data, compare_hash=False):
+    """Grava `data` de forma atômica, a menos que o arquivo já tenha esse conteúdo.
+
+    Com `compare_hash`, compara o meta content-hash do HTML novo com o do
+    arquivo existente (ignora o horário de geração); sem ele, compara os
+    bytes. Retorna False quando nada foi gravado: o arquivo fica intocado
+    e o workflow não tem o que commitar.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if compare_hash:
+                new, old = CONTENT_HASH_RE.search(data[:4096]), CONTENT_HASH_RE.search(f.read(4096))
+                unchanged = bool(new and old) and new.group(1) == old.group(1)
+            else:
+                unchanged = f.read() == data
+    except OSError:
+        unchanged = False
+    if unchanged:
+        return False
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+# HTML/CSS/JS do dashboard. Texto literal (chaves simples, sem f-string);
+# os dados entram nos slots @@nome@@ via compile_template/render_template
+DASHBOARD_TEMPLATE = """<!DOCTYPE html>
 <html lang="pt-BR">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="content-hash" content="@@content_hash@@">
     <title>Newsletter Analytics — Beehiiv</title>
     <script src="https://cdn.jsdelivr.net/npm/chart.js@4.5.1"></script>
     <script src="https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns@3.0.0"></script>
     <style>
-        :root {{
+        :root {
             --bg: #f5f5f7; --card: #ffffff; --header-bg: linear-gradient(135deg, #1a1a2e 0%, #16213e 50%, #0f3460 100%);
             --text: #1d1d1f; --text2: #6e6e73; --text-light: #ffffff;
             --orange: #FF6719; --blue: #4C72B0; --green: #34c759; --red: #ff3b30;
             --teal: #55A868; --purple: #8172B3; --brown: #937860;
             --gap: 16px; --radius: 12px;
-        }}
-        * {{ margin:0; padding:0; box-sizing:border-box; }}
-        body {{ font-family:-apple-system,BlinkMacSystemFont,'SF Pro Display','Segoe UI',Roboto,sans-serif; background:var(--bg); color:var(--text); line-height:1.5; }}
-        .container {{ max-width:1440px; margin:0 auto; padding:var(--gap); }}
+        }
+        * { margin:0; padding:0; box-sizing:border-box; }
+        body { font-family:-apple-system,BlinkMacSystemFont,'SF Pro Display','Segoe UI',Roboto,sans-serif; background:var(--bg); color:var(--text); line-height:1.5; }
+        .container { max-width:1440px; margin:0 auto; padding:var(--gap); }
 
         /* Header */
-        .header {{ background:var(--header-bg); color:var(--text-light); padding:24px 28px; border-radius:var(--radius); margin-bottom:var(--gap); display:flex; justify-content:space-between; align-items:center; flex-wrap:wrap; gap:16px; }}
-        .header h1 {{ font-size:22px; font-weight:700; letter-spacing:-0.3px; }}
-        .header p {{ font-size:13px; color:rgba(255,255,255,0.6); margin-top:2px; }}
-        .filters {{ display:flex; gap:12px; align-items:center; flex-wrap:wrap; }}
-        .filters label {{ font-size:12px; color:rgba(255,255,255,0.6); text-transform:uppercase; letter-spacing:0.5px; }}
-        .filters select {{ padding:7px 12px; border:1px solid rgba(255,255,255,0.15); border-radius:6px; background:rgba(255,255,255,0.08); color:#fff; font-size:13px; cursor:pointer; }}
-        .filters select option {{ background:#1a1a2e; color:#fff; }}
+        .header { background:var(--header-bg); color:var(--text-light); padding:24px 28px; border-radius:var(--radius); margin-bottom:var(--gap); display:flex; justify-content:space-between; align-items:center; flex-wrap:wrap; gap:16px; }
+        .header h1 { font-size:22px; font-weight:700; letter-spacing:-0.3px; }
+        .header p { font-size:13px; color:rgba(255,255,255,0.6); margin-top:2px; }
+        .filters { display:flex; gap:12px; align-items:center; flex-wrap:wrap; }
+        .filters label { font-size:12px; color:rgba(255,255,255,0.6); text-transform:uppercase; letter-spacing:0.5px; }
+        .filters select { padding:7px 12px; border:1px solid rgba(255,255,255,0.15); border-radius:6px; background:rgba(255,255,255,0.08); color:#fff; font-size:13px; cursor:pointer; }
+        .filters select option { background:#1a1a2e; color:#fff; }
 
         /* KPI Cards */
-        .kpi-row {{ display:grid; grid-template-columns:repeat(auto-fit, minmax(170px,1fr)); gap:var(--gap); margin-bottom:var(--gap); }}
-        .kpi {{ background:var(--card); border-radius:var(--radius); padding:18px 22px; box-shadow:0 1px 3px rgba(0,0,0,0.06); transition:transform 0.15s; }}
-        .kpi:hover {{ transform:translateY(-2px); box-shadow:0 4px 12px rgba(0,0,0,0.1); }}
-        .kpi-label {{ font-size:11px; color:var(--text2); text-transform:uppercase; letter-spacing:0.5px; margin-bottom:6px; }}
-        .kpi-val {{ font-size:26px; font-weight:700; }}
-        .kpi-delta {{ font-size:12px; font-weight:500; margin-top:4px; }}
-        .kpi-delta.up {{ color:var(--green); }} .kpi-delta.down {{ color:var(--red); }}
-        .kpi-desc {{ font-size:11px; color:var(--text2); margin-top:6px; line-height:1.4; }}
-        .kpi-bench {{ font-size:10px; color:var(--purple); margin-top:3px; font-style:italic; }}
+        .kpi-row { display:grid; grid-template-columns:repeat(auto-fit, minmax(170px,1fr)); gap:var(--gap); margin-bottom:var(--gap); }
+        .kpi { background:var(--card); border-radius:var(--radius); padding:18px 22px; box-shadow:0 1px 3px rgba(0,0,0,0.06); transition:transform 0.15s; }
+        .kpi:hover { transform:translateY(-2px); box-shadow:0 4px 12px rgba(0,0,0,0.1); }
+        .kpi-label { font-size:11px; color:var(--text2); text-transform:uppercase; letter-spacing:0.5px; margin-bottom:6px; }
+        .kpi-val { font-size:26px; font-weight:700; }
+        .kpi-delta { font-size:12px; font-weight:500; margin-top:4px; }
+        .kpi-delta.up { color:var(--green); } .kpi-delta.down { color:var(--red); }
+        .kpi-desc { font-size:11px; color:var(--text2); margin-top:6px; line-height:1.4; }
+        .kpi-bench { font-size:10px; color:var(--purple); margin-top:3px; font-style:italic; }
 
         /* Insights */
-        .insights-box {{ background:var(--card); border-radius:var(--radius); padding:24px 28px; box-shadow:0 1px 3px rgba(0,0,0,0.06); margin-bottom:var(--gap); border-left:4px solid var(--orange); }}
-        .insights-box h3 {{ font-size:16px; font-weight:700; margin-bottom:16px; }}
-        .insight {{ padding:10px 0; border-bottom:1px solid #f2f2f7; font-size:13px; line-height:1.6; }}
-        .insight:last-child {{ border-bottom:none; }}
-        .insight-icon {{ margin-right:8px; }}
-        .insight-good {{ color:var(--green); }} .insight-warn {{ color:var(--orange); }} .insight-bad {{ color:var(--red); }} .insight-info {{ color:var(--blue); }}
-        .sampled-note {{ background:#fff8f0; border:1px solid #ffe0b2; border-radius:8px; padding:12px 16px; font-size:12px; color:#e65100; margin-bottom:var(--gap); }}
+        .insights-box { background:var(--card); border-radius:var(--radius); padding:24px 28px; box-shadow:0 1px 3px rgba(0,0,0,0.06); margin-bottom:var(--gap); border-left:4px solid var(--orange); }
+        .insights-box h3 { font-size:16px; font-weight:700; margin-bottom:16px; }
+        .insight { padding:10px 0; border-bottom:1px solid #f2f2f7; font-size:13px; line-height:1.6; }
+        .insight:last-child { border-bottom:none; }
+        .insight-icon { margin-right:8px; }
+        .insight-good { color:var(--green); } .insight-warn { color:var(--orange); } .insight-bad { color:var(--red); } .insight-info { color:var(--blue); }
+        .sampled-note { background:#fff8f0; border:1px solid #ffe0b2; border-radius:8px; padding:12px 16px; font-size:12px; color:#e65100; margin-bottom:var(--gap); }
 
         /* Charts */
-        .chart-grid {{ display:grid; grid-template-columns:repeat(auto-fit, minmax(420px,1fr)); gap:var(--gap); margin-bottom:var(--gap); }}
-        .chart-grid.full {{ grid-template-columns:1fr; }}
-        .chart-box {{ background:var(--card); border-radius:var(--radius); padding:20px 24px; box-shadow:0 1px 3px rgba(0,0,0,0.06); }}
-        .chart-box h3 {{ font-size:14px; font-weight:600; margin-bottom:16px; }}
-        .chart-box canvas {{ max-height:320px; }}
+        .chart-grid { display:grid; grid-template-columns:repeat(auto-fit, minmax(420px,1fr)); gap:var(--gap); margin-bottom:var(--gap); }
+        .chart-grid.full { grid-template-columns:1fr; }
+        .chart-box { background:var(--card); border-radius:var(--radius); padding:20px 24px; box-shadow:0 1px 3px rgba(0,0,0,0.06); }
+        .chart-box h3 { font-size:14px; font-weight:600; margin-bottom:16px; }
+        .chart-box canvas { max-height:320px; }
+        .chart-empty { color:var(--text2); padding:40px; text-align:center; }
 
         /* Table */
-        .table-box {{ background:var(--card); border-radius:var(--radius); padding:20px 24px; box-shadow:0 1px 3px rgba(0,0,0,0.06); overflow-x:auto; margin-bottom:var(--gap); }}
-        .table-box h3 {{ font-size:14px; font-weight:600; margin-bottom:16px; }}
-        table {{ width:100%; border-collapse:collapse; font-size:13px; }}
-        thead th {{ text-align:left; padding:10px 12px; border-bottom:2px solid #e5e5ea; color:var(--text2); font-size:11px; text-transform:uppercase; letter-spacing:0.5px; cursor:pointer; user-select:none; white-space:nowrap; }}
-        thead th:hover {{ color:var(--text); background:#f8f8fa; }}
-        tbody td {{ padding:10px 12px; border-bottom:1px solid #f2f2f7; }}
-        tbody tr:hover {{ background:#f8f8fa; }}
-        .bar {{ display:inline-block; height:6px; border-radius:3px; margin-right:6px; vertical-align:middle; }}
+        .table-box { background:var(--card); border-radius:var(--radius); padding:20px 24px; box-shadow:0 1px 3px rgba(0,0,0,0.06); overflow-x:auto; margin-bottom:var(--gap); }
+        .table-box h3 { font-size:14px; font-weight:600; margin-bottom:16px; }
+        table { width:100%; border-collapse:collapse; font-size:13px; }
+        thead th { text-align:left; padding:10px 12px; border-bottom:2px solid #e5e5ea; color:var(--text2); font-size:11px; text-transform:uppercase; letter-spacing:0.5px; cursor:pointer; user-select:none; white-space:nowrap; }
+        thead th:hover { color:var(--text); background:#f8f8fa; }
+        tbody td { padding:10px 12px; border-bottom:1px solid #f2f2f7; }
+        tbody tr:hover { background:#f8f8fa; }
+        .tbl-tools { display:flex; align-items:center; gap:12px; margin-bottom:12px; }
+        .tbl-tools input { flex:1; max-width:320px; padding:8px 12px; border:1px solid #e5e5ea; border-radius:8px; font-size:13px; }
+        .tbl-tools span { font-size:12px; color:var(--text2); }
+        .tbl-scroll { max-height:600px; overflow-y:auto; }
+        .tbl-scroll thead th { position:sticky; top:0; background:var(--card); z-index:1; }
+        .tbl-scroll tbody td { height:38px; padding:0 12px; white-space:nowrap; }
+        .tbl-scroll tbody td:first-child { max-width:340px; overflow:hidden; text-overflow:ellipsis; }
+        .bar { display:inline-block; height:6px; border-radius:3px; margin-right:6px; vertical-align:middle; }
 
         /* Tabs */
-        .tab-row {{ display:flex; gap:8px; margin-bottom:16px; }}
-        .tab {{ padding:8px 16px; border-radius:8px; font-size:13px; font-weight:500; cursor:pointer; border:1px solid #e5e5ea; background:#fff; color:var(--text2); transition:all 0.15s; }}
-        .tab.active {{ background:var(--orange); color:#fff; border-color:var(--orange); }}
-        .tab:hover:not(.active) {{ border-color:var(--orange); color:var(--orange); }}
+        .tab-row { display:flex; gap:8px; margin-bottom:16px; }
+        .tab { padding:8px 16px; border-radius:8px; font-size:13px; font-weight:500; cursor:pointer; border:1px solid #e5e5ea; background:#fff; color:var(--text2); transition:all 0.15s; }
+        .tab.active { background:var(--orange); color:#fff; border-color:var(--orange); }
+        .tab:hover:not(.active) { border-color:var(--orange); color:var(--orange); }
 
         /* Debug/Raw */
-        .raw-section {{ background:var(--card); border-radius:var(--radius); padding:20px 24px; box-shadow:0 1px 3px rgba(0,0,0,0.06); margin-bottom:var(--gap); }}
-        .raw-section summary {{ cursor:pointer; font-weight:600; font-size:14px; }}
-        .raw-section pre {{ margin-top:12px; background:#f5f5f7; padding:16px; border-radius:8px; overflow-x:auto; font-size:12px; max-height:400px; overflow-y:auto; }}
+        .raw-section { background:var(--card); border-radius:var(--radius); padding:20px 24px; box-shadow:0 1px 3px rgba(0,0,0,0.06); margin-bottom:var(--gap); }
+        .raw-section summary { cursor:pointer; font-weight:600; font-size:14px; }
+        .raw-section pre { margin-top:12px; background:#f5f5f7; padding:16px; border-radius:8px; overflow-x:auto; font-size:12px; max-height:400px; overflow-y:auto; }
 
         /* Footer */
-        footer {{ text-align:center; padding:16px; font-size:12px; color:var(--text2); }}
-
-        @media (max-width:768px) {{
-            .header {{ flex-direction:column; align-items:flex-start; }}
-            .kpi-row {{ grid-template-columns:repeat(2,1fr); }}
-            .chart-grid {{ grid-template-columns:1fr; }}
-        }}
-        @media print {{
-            body {{ background:#fff; }} .filters {{ display:none; }}
-            .chart-box,.kpi {{ box-shadow:none; border:1px solid #e5e5ea; break-inside:avoid; }}
-        }}
+        footer { text-align:center; padding:16px; font-size:12px; color:var(--text2); }
+
+        @media (max-width:768px) {
+            .header { flex-direction:column; align-items:flex-start; }
+            .kpi-row { grid-template-columns:repeat(2,1fr); }
+            .chart-grid { grid-template-columns:1fr; }
+        }
+        @media print {
+            body { background:#fff; } .filters { display:none; }
+            .chart-box,.kpi { box-shadow:none; border:1px solid #e5e5ea; break-inside:avoid; }
+        }
     </style>
 </head>
 <body>
@@ -622,16 +2813,12 @@ def generate_dashboard(posts, subscribers, raw_stats_sample):
     <header class="header">
         <div>
             <h1>Newsletter Analytics</h1>
-            <p>Dados atualizados em {datetime.now().strftime("%d/%m/%Y %H:%M")}</p>
+            <p>Dados atualizados em @@generated_at@@</p>
         </div>
         <div class="filters">
             <div><label>Período</label>
                 <select id="f-period" onchange="applyFilters()">
-                    <option value="all">Todo o período</option>
-                    <option value="30">Últimos 30 dias</option>
-                    <option value="90">Últimos 90 dias</option>
-                    <option value="180">Últimos 6 meses</option>
-                    <option value="365">Último ano</option>
+@@period_options@@
                 </select>
             </div>
         </div>
@@ -665,10 +2852,10 @@ def generate_dashboard(posts, subscribers, raw_stats_sample):
     <section class="chart-grid full"><div class="chart-box"><h3>Funil: Enviados → Abertos → Clicados</h3><canvas id="c-funnel"></canvas></div></section>
 
     <!-- Web vs Email -->
-    <section class="chart-grid full"><div class="chart-box"><h3>Email vs Web: Visualizações e Cliques</h3><canvas id="c-web"></canvas></div></section>
+    <section class="chart-grid full"><div class="chart-box"><h3>Email vs Web: Visualizações e Cliques</h3><canvas id="c-web"></canvas><p class="chart-empty" id="c-web-empty" hidden>Sem dados de web views nos posts.</p></div></section>
 
     <!-- Top Links -->
-    <section class="chart-grid full"><div class="chart-box"><h3>Top Links Mais Clicados (todas as edições)</h3><canvas id="c-toplinks"></canvas></div></section>
+    <section class="chart-grid full"><div class="chart-box"><h3>Top Links Mais Clicados (todas as edições)</h3><canvas id="c-toplinks"></canvas><p class="chart-empty" id="c-toplinks-empty" hidden>Sem dados de clicks por URL.</p></div></section>
 
     <!-- Insights -->
     <section class="insights-box" id="insights-section">
@@ -679,11 +2866,15 @@ def generate_dashboard(posts, subscribers, raw_stats_sample):
     <!-- Table -->
     <section class="table-box">
         <h3>Detalhamento por Edição <span style="font-weight:400;font-size:12px;color:var(--text2)">(clique no cabeçalho para ordenar)</span></h3>
-        <div id="tbl"></div>
+        <div class="tbl-tools">
+            <input id="tbl-search" type="search" placeholder="Buscar por título..." oninput="renderTable()">
+            <span id="tbl-count"></span>
+        </div>
+        <div id="tbl" class="tbl-scroll"></div>
     </section>
 
-    <!-- Raw Stats Debug -->
-    <section class="raw-section">
+    <!-- Raw Stats Debug (só com BEEHIIV_DEBUG_RAW_STATS=1) -->
+    <section class="raw-section" id="raw-section" hidden>
         <details>
             <summary>Ver campos brutos da API (debug)</summary>
             <pre id="raw-stats"></pre>
@@ -697,554 +2888,954 @@ def generate_dashboard(posts, subscribers, raw_stats_sample):
 const COLORS = ['#FF6719','#4C72B0','#55A868','#C44E52','#8172B3','#937860','#e6894a','#3d9970'];
 const DAYS = ['Seg','Ter','Qua','Qui','Sex','Sáb','Dom'];
 
-const POSTS_RAW = {posts_json};
-const ALL_POSTS = {all_posts_json};
-const SUBS = {subs_json};
+let POSTS_RAW = [];
+let SUBS = {};
+let PERIODS = {};
+let filteredPosts = [];
+let agg = {};
+let charts = {};
+
+// Posts chegam em formato colunar: {columns, rows}
+function unpackPosts(t) {
+    return t.rows.map(r => { const o = {}; t.columns.forEach((c,i) => o[c] = r[i]); return o; });
+}
 
-let filteredPosts = [...POSTS_RAW];
-let charts = {{}};
+async function loadData(url, version) {
+    // ?v=<hash do payload>: o navegador/CDN não serve um payload antigo com o shell novo
+    const query = version ? '?v=' + version : '';
+    if ('DecompressionStream' in window) {
+        try {
+            const res = await fetch(url + '.gz' + query);
+            if (res.ok) return await new Response(res.body.pipeThrough(new DecompressionStream('gzip'))).json();
+        } catch (e) { /* cai para o JSON sem compressão */ }
+    }
+    const res = await fetch(url + query);
+    return res.json();
+}
 
-function fmt(v, t) {{
+function fmt(v, t) {
     if (v == null || isNaN(v)) return '-';
     if (t === '%') return v.toFixed(1) + '%';
-    if (t === 'n') {{
+    if (t === 'n') {
         if (Math.abs(v)>=1e6) return (v/1e6).toFixed(1)+'M';
         if (Math.abs(v)>=1e3) return (v/1e3).toFixed(1)+'K';
         return v.toLocaleString('pt-BR');
-    }}
+    }
     return v.toString();
-}}
+}
 
-function applyFilters() {{
+// Os agregados de cada período vêm prontos do gerador: filtrar é só fatiar
+function applyFilters() {
     const period = document.getElementById('f-period').value;
-    if (period === 'all') {{
-        filteredPosts = [...POSTS_RAW];
-    }} else {{
-        const cutoff = new Date();
-        cutoff.setDate(cutoff.getDate() - parseInt(period));
-        filteredPosts = POSTS_RAW.filter(p => new Date(p.date) >= cutoff);
-    }}
+    agg = PERIODS[period] || PERIODS.all || {start:0, count:0};
+    filteredPosts = POSTS_RAW.slice(agg.start);
     renderAll();
-}}
+}
 
-function renderAll() {{
+function renderAll() {
     renderKPIs();
     renderCharts();
     renderInsights();
     renderTable();
-}}
+}
 
 // ── Insights ──
-function renderInsights() {{
+function renderInsights() {
     const p = filteredPosts;
     if (!p.length) return;
     const insights = [];
 
-    const avgOpen = p.reduce((a,x)=>a+x.open_rate,0)/p.length;
-    const avgClick = p.reduce((a,x)=>a+x.click_rate,0)/p.length;
-    const avgCTO = p.reduce((a,x)=>a+x.cto_rate,0)/p.length;
-    const avgUnsub = p.reduce((a,x)=>a+x.unsub_rate,0)/p.length;
-
-    // Open Rate analysis
-    if (avgOpen >= 35) {{
-        insights.push({{icon:'✅', cls:'insight-good', text:`Open Rate médio de ${{avgOpen.toFixed(1)}}% está muito acima da média do mercado (15-25%). Sua base é altamente engajada — isso sugere que seus subject lines são eficazes e sua lista é bem qualificada.`}});
-    }} else if (avgOpen >= 20) {{
-        insights.push({{icon:'✅', cls:'insight-good', text:`Open Rate de ${{avgOpen.toFixed(1)}}% está dentro da média do mercado (15-25%). Há espaço para melhorar com testes A/B de subject lines.`}});
-    }} else {{
-        insights.push({{icon:'⚠️', cls:'insight-warn', text:`Open Rate de ${{avgOpen.toFixed(1)}}% está abaixo da média (15-25%). Considere limpar subscribers inativos e testar horários de envio diferentes.`}});
-    }}
+    // Os números vêm prontos do gerador (agg.insights); aqui só se escolhe o texto
+    const ins = agg.insights || {};
+    const pct = ins.percentiles || {};
+    const open = pct.open_rate || {}, click = pct.click_rate || {};
+    const medOpen = open.p50 || 0, medClick = click.p50 || 0;
+    const avgCTO = agg.avg_cto, avgUnsub = agg.avg_unsub;
+    const spread = (q, d) => `metade das edições entre ${q.p25.toFixed(d)}% e ${q.p75.toFixed(d)}%`;
+    const editionRef = i => `"${POSTS_RAW[i].title}" (${POSTS_RAW[i].date_label}, ${POSTS_RAW[i].open_rate}%)`;
+
+    // Open Rate analysis (mediana: uma edição atípica não distorce)
+    if (medOpen >= 35) {
+        insights.push({icon:'✅', cls:'insight-good', text:`Open Rate mediano de ${medOpen.toFixed(1)}% (${spread(open, 1)}) está muito acima da média do mercado (15-25%). Sua base é altamente engajada — isso sugere que seus subject lines são eficazes e sua lista é bem qualificada.`});
+    } else if (medOpen >= 20) {
+        insights.push({icon:'✅', cls:'insight-good', text:`Open Rate mediano de ${medOpen.toFixed(1)}% (${spread(open, 1)}) está dentro da média do mercado (15-25%). Há espaço para melhorar com testes A/B de subject lines.`});
+    } else {
+        insights.push({icon:'⚠️', cls:'insight-warn', text:`Open Rate mediano de ${medOpen.toFixed(1)}% (${spread(open, 1)}) está abaixo da média (15-25%). Considere limpar subscribers inativos e testar horários de envio diferentes.`});
+    }
 
     // Click Rate analysis
-    if (avgClick >= 3) {{
-        insights.push({{icon:'✅', cls:'insight-good', text:`Click Rate de ${{avgClick.toFixed(1)}}% está acima do benchmark (1-3%). Seus CTAs e links estão performando bem.`}});
-    }} else if (avgClick >= 1) {{
-        insights.push({{icon:'💡', cls:'insight-info', text:`Click Rate de ${{avgClick.toFixed(1)}}% está na média (1-3%). Para melhorar: posicione CTAs mais acima no email, use botões em vez de links de texto, e reduza o número de links por edição.`}});
-    }} else {{
-        insights.push({{icon:'⚠️', cls:'insight-warn', text:`Click Rate de ${{avgClick.toFixed(2)}}% está abaixo do benchmark (1-3%). Reveja o posicionamento dos seus links e a clareza dos seus CTAs. Considere também se o conteúdo está alinhado com as expectativas da audiência.`}});
-    }}
+    if (medClick >= 3) {
+        insights.push({icon:'✅', cls:'insight-good', text:`Click Rate mediano de ${medClick.toFixed(1)}% está acima do benchmark (1-3%). Seus CTAs e links estão performando bem.`});
+    } else if (medClick >= 1) {
+        insights.push({icon:'💡', cls:'insight-info', text:`Click Rate mediano de ${medClick.toFixed(1)}% está na média (1-3%). Para melhorar: posicione CTAs mais acima no email, use botões em vez de links de texto, e reduza o número de links por edição.`});
+    } else {
+        insights.push({icon:'⚠️', cls:'insight-warn', text:`Click Rate mediano de ${medClick.toFixed(2)}% (${spread(click, 2)}) está abaixo do benchmark (1-3%). Reveja o posicionamento dos seus links e a clareza dos seus CTAs. Considere também se o conteúdo está alinhado com as expectativas da audiência.`});
+    }
 
     // CTOR analysis
-    if (avgCTO < 2) {{
-        insights.push({{icon:'⚠️', cls:'insight-warn', text:`CTOR (Click-to-Open) de apenas ${{avgCTO.toFixed(1)}}%: quem abre raramente clica. O conteúdo pode não estar entregando o que o subject line promete. Tente incluir links mais relevantes e chamadas à ação mais claras.`}});
-    }}
+    if (avgCTO < 2) {
+        insights.push({icon:'⚠️', cls:'insight-warn', text:`CTOR (Click-to-Open) de apenas ${avgCTO.toFixed(1)}%: quem abre raramente clica. O conteúdo pode não estar entregando o que o subject line promete. Tente incluir links mais relevantes e chamadas à ação mais claras.`});
+    }
 
     // Unsub analysis
-    if (avgUnsub > 1) {{
-        insights.push({{icon:'🚨', cls:'insight-bad', text:`Unsub Rate médio de ${{avgUnsub.toFixed(2)}}% está alto (ideal é abaixo de 0.5%). Investigue quais edições causam mais unsubscribes — pode indicar conteúdo desalinhado ou frequência excessiva.`}});
-    }} else if (avgUnsub < 0.2) {{
-        insights.push({{icon:'✅', cls:'insight-good', text:`Unsub Rate de ${{avgUnsub.toFixed(2)}}% é excelente — sua audiência está satisfeita com o conteúdo e a frequência.`}});
-    }}
+    if (avgUnsub > 1) {
+        insights.push({icon:'🚨', cls:'insight-bad', text:`Unsub Rate médio de ${avgUnsub.toFixed(2)}% está alto (ideal é abaixo de 0.5%). Investigue quais edições causam mais unsubscribes — pode indicar conteúdo desalinhado ou frequência excessiva.`});
+    } else if (avgUnsub < 0.2) {
+        insights.push({icon:'✅', cls:'insight-good', text:`Unsub Rate de ${avgUnsub.toFixed(2)}% é excelente — sua audiência está satisfeita com o conteúdo e a frequência.`});
+    }
 
     // Best / worst performing post
-    const sorted = [...p].sort((a,b) => b.open_rate - a.open_rate);
-    const best = sorted[0];
-    const worst = sorted[sorted.length-1];
-    if (best && worst && sorted.length > 3) {{
-        insights.push({{icon:'🏆', cls:'insight-good', text:`Melhor edição: "${{best.title}}" (${{best.date_label}}) com ${{best.open_rate}}% de abertura e ${{best.click_rate}}% de cliques. Analise o que funcionou nesse subject line e conteúdo.`}});
-        if (worst.open_rate < avgOpen * 0.7) {{
-            insights.push({{icon:'📉', cls:'insight-warn', text:`Pior edição: "${{worst.title}}" (${{worst.date_label}}) com apenas ${{worst.open_rate}}% de abertura. O subject line pode não ter ressoado com a audiência.`}});
-        }}
-    }}
-
-    // Day of week insight
-    const dayData = Array.from({{length:7}},()=>({{sum:0,count:0}}));
-    p.forEach(x => {{ if (x.day_of_week!=null) {{ dayData[x.day_of_week].sum+=x.open_rate; dayData[x.day_of_week].count++; }} }});
-    const dayAvg = dayData.map(d => d.count>0 ? d.sum/d.count : 0);
-    const bestDayIdx = dayAvg.indexOf(Math.max(...dayAvg));
-    const bestDayCount = dayData[bestDayIdx].count;
-    if (bestDayCount >= 2) {{
-        insights.push({{icon:'📅', cls:'insight-info', text:`Melhor dia para envio: ${{DAYS[bestDayIdx]}} com ${{dayAvg[bestDayIdx].toFixed(1)}}% de open rate médio (baseado em ${{bestDayCount}} edições). Considere concentrar envios nesse dia.`}});
-    }}
+    const best = POSTS_RAW[agg.best];
+    const worst = POSTS_RAW[agg.worst];
+    if (best && worst && agg.count > 3) {
+        insights.push({icon:'🏆', cls:'insight-good', text:`Melhor edição: "${best.title}" (${best.date_label}) com ${best.open_rate}% de abertura e ${best.click_rate}% de cliques. Analise o que funcionou nesse subject line e conteúdo.`});
+        if (worst.open_rate < medOpen * 0.7) {
+            insights.push({icon:'📉', cls:'insight-warn', text:`Pior edição: "${worst.title}" (${worst.date_label}) com apenas ${worst.open_rate}% de abertura. O subject line pode não ter ressoado com a audiência.`});
+        }
+    }
+
+    // Edições fora da curva (vs. as 28 anteriores)
+    const out = ins.outliers;
+    if (out && out.high_count) {
+        insights.push({icon:'⚡', cls:'insight-good', text:`${out.high_count} ${out.high_count > 1 ? 'edições' : 'edição'} com abertura fora da curva para cima em relação às edições anteriores: ${out.high.map(editionRef).join(', ')}. Vale entender o que elas tiveram de diferente.`});
+    }
+    if (out && out.low_count) {
+        insights.push({icon:'🔻', cls:'insight-warn', text:`${out.low_count} ${out.low_count > 1 ? 'edições' : 'edição'} com abertura fora da curva para baixo: ${out.low.map(editionRef).join(', ')}. Confira entregabilidade (spam, bounce) e o subject line.`});
+    }
+
+    // Tendência recente: média móvel das últimas 7 edições vs. 28
+    const roll = (ins.rolling || {}).open_rate;
+    if (roll && Math.abs(roll['7'] - roll['28']) >= 1) {
+        const up = roll['7'] > roll['28'];
+        insights.push({icon: up ? '📈' : '📉', cls: up ? 'insight-good' : 'insight-warn', text:`Open Rate das últimas 7 edições (${roll['7'].toFixed(1)}%) está ${up ? 'acima' : 'abaixo'} da média das últimas 28 (${roll['28'].toFixed(1)}%).`});
+    }
+
+    // Dia da semana / horário de envio, com IC 95%
+    const effectText = (label, g, eff) => `${label} com ${g.mean.toFixed(1)}% ± ${g.ci.toFixed(1)}pp de open rate (${g.n} edições, ${g.effect >= 0 ? '+' : ''}${g.effect.toFixed(1)}pp vs. a média do período). ` +
+        (eff.best.significant ? 'A diferença fica fora da margem de erro (IC 95%) — vale concentrar envios aí.' : 'A diferença ainda está dentro da margem de erro (IC 95%), então não é conclusiva.');
+    const wd = ins.weekday;
+    if (wd && wd.best) {
+        insights.push({icon:'📅', cls:'insight-info', text:'Melhor dia para envio: ' + effectText(DAYS[wd.best.index], wd.groups[wd.best.index], wd)});
+    }
+    const hr = ins.hour;
+    if (hr && hr.best) {
+        insights.push({icon:'🕐', cls:'insight-info', text:'Melhor horário de envio: ' + effectText(hr.best.index + 'h (UTC)', hr.groups[hr.best.index], hr)});
+    }
 
     // Growth trend
     const tl = SUBS.timeline_posts || [];
-    if (tl.length >= 3) {{
+    if (tl.length >= 3) {
         const recent = tl.slice(-3);
         const growing = recent[recent.length-1].subscribers_estimate > recent[0].subscribers_estimate;
-        if (growing) {{
-            insights.push({{icon:'📈', cls:'insight-good', text:`Base de subscribers crescendo nos últimos ${{recent.length}} meses — de ${{fmt(recent[0].subscribers_estimate,'n')}} para ${{fmt(recent[recent.length-1].subscribers_estimate,'n')}}.`}});
-        }} else {{
-            insights.push({{icon:'📉', cls:'insight-warn', text:`Base de subscribers encolhendo nos últimos meses — de ${{fmt(recent[0].subscribers_estimate,'n')}} para ${{fmt(recent[recent.length-1].subscribers_estimate,'n')}}. Revise estratégias de aquisição e retenção.`}});
-        }}
-    }}
+        if (growing) {
+            insights.push({icon:'📈', cls:'insight-good', text:`Base de subscribers crescendo nos últimos ${recent.length} meses — de ${fmt(recent[0].subscribers_estimate,'n')} para ${fmt(recent[recent.length-1].subscribers_estimate,'n')}.`});
+        } else {
+            insights.push({icon:'📉', cls:'insight-warn', text:`Base de subscribers encolhendo nos últimos meses — de ${fmt(recent[0].subscribers_estimate,'n')} para ${fmt(recent[recent.length-1].subscribers_estimate,'n')}. Revise estratégias de aquisição e retenção.`});
+        }
+    }
 
     // Web views
-    const totalWebViews = p.reduce((a,x)=>a+x.web_views,0);
-    if (totalWebViews > 0) {{
-        insights.push({{icon:'🌐', cls:'insight-info', text:`${{fmt(totalWebViews,'n')}} visualizações web no total. Posts publicados na web ampliam o alcance além da base de email.`}});
-    }}
+    const totalWebViews = agg.total_web_views;
+    if (totalWebViews > 0) {
+        insights.push({icon:'🌐', cls:'insight-info', text:`${fmt(totalWebViews,'n')} visualizações web no total. Posts publicados na web ampliam o alcance além da base de email.`});
+    }
 
     document.getElementById('insights-list').innerHTML = insights.map(i =>
-        `<div class="insight"><span class="insight-icon">${{i.icon}}</span><span class="${{i.cls}}">${{i.text}}</span></div>`
+        `<div class="insight"><span class="insight-icon">${i.icon}</span><span class="${i.cls}">${i.text}</span></div>`
     ).join('');
-}}
+}
 
 // ── KPIs ──
-function renderKPIs() {{
+function renderKPIs() {
     const p = filteredPosts;
     const s = SUBS;
     const kpis = [];
 
     // Usa o maior "delivered" como proxy de total real de subscribers
-    const maxDelivered = p.length > 0 ? Math.max(...p.map(x=>x.delivered)) : 0;
-    const latestDelivered = p.length > 0 ? p[p.length-1].delivered : 0;
+    const maxDelivered = agg.max_delivered || 0;
+    const latestDelivered = agg.latest_delivered || 0;
     const subTotal = latestDelivered || s.total || 0;
 
-    if (subTotal > 0) {{
-        kpis.push({{
+    if (subTotal > 0) {
+        kpis.push({
             label:'Total Subscribers (último envio)', val:fmt(subTotal,'n'),
             delta: maxDelivered !== latestDelivered ? 'Pico: '+fmt(maxDelivered,'n') : '',
             cls:'up',
             desc:'Número de emails entregues no envio mais recente. Representa sua base ativa real.',
             bench:'Benchmark: newsletters acima de 100K são consideradas de grande porte.'
-        }});
-    }}
-
-    if (p.length > 0) {{
-        const avgOpen = p.reduce((a,x)=>a+x.open_rate,0)/p.length;
-        const avgClick = p.reduce((a,x)=>a+x.click_rate,0)/p.length;
-        const avgCTO = p.reduce((a,x)=>a+x.cto_rate,0)/p.length;
-        const avgUnsub = p.reduce((a,x)=>a+x.unsub_rate,0)/p.length;
-        const totalSent = p.reduce((a,x)=>a+x.delivered,0);
-
-        const mid = Math.floor(p.length/2);
-        const h1 = p.slice(0,mid), h2 = p.slice(mid);
-        const openDelta = mid>0 ? (h2.reduce((a,x)=>a+x.open_rate,0)/h2.length) - (h1.reduce((a,x)=>a+x.open_rate,0)/h1.length) : 0;
-        const clickDelta = mid>0 ? (h2.reduce((a,x)=>a+x.click_rate,0)/h2.length) - (h1.reduce((a,x)=>a+x.click_rate,0)/h1.length) : 0;
-
-        kpis.push({{
+        });
+    }
+
+    // Ativos estimados por amostragem estratificada (com intervalo de confiança)
+    if (s.active_rate_ci) {
+        kpis.push({
+            label:'Subscribers Ativos (estimativa)', val:fmt(s.active,'n'),
+            delta:fmt(s.active_rate_sample,'%')+' (IC 95%: '+s.active_rate_ci[0].toFixed(1)+'–'+s.active_rate_ci[1].toFixed(1)+'%)',
+            cls:'up',
+            desc:'Taxa de ativos estimada por '+s.status_sample_pages+' páginas sorteadas '
+                + (s.status_sample_coverage < 100
+                    ? 'nos '+s.status_sample_coverage+'% da base ao alcance da API (o IC vale para essa parte)'
+                    : 'em toda a base')
+                + ' (amostragem estratificada).',
+            bench:''
+        });
+    }
+
+    if (p.length > 0) {
+        const avgOpen = agg.avg_open, avgClick = agg.avg_click, avgCTO = agg.avg_cto, avgUnsub = agg.avg_unsub;
+        const totalSent = agg.total_sent;
+        const openDelta = agg.open_delta, clickDelta = agg.click_delta;
+
+        kpis.push({
             label:'Avg Open Rate', val:fmt(avgOpen,'%'),
             delta:(openDelta>=0?'+':'')+openDelta.toFixed(1)+'pp tendência', cls:openDelta>=0?'up':'down',
             desc:'Percentual de destinatários que abriram o email. É a principal métrica de engajamento.',
             bench:'Benchmark: 15-25% é a média do mercado. Acima de 30% é excelente.'
-        }});
-        kpis.push({{
+        });
+        kpis.push({
             label:'Avg Click Rate', val:fmt(avgClick,'%'),
             delta:(clickDelta>=0?'+':'')+clickDelta.toFixed(1)+'pp tendência', cls:clickDelta>=0?'up':'down',
             desc:'Percentual de destinatários que clicaram em pelo menos um link.',
             bench:'Benchmark: 1-3% é a média. Acima de 3% é muito bom.'
-        }});
-        kpis.push({{
+        });
+        kpis.push({
             label:'Avg CTOR', val:fmt(avgCTO,'%'), delta:'click-to-open rate', cls:avgCTO>10?'up':'down',
             desc:'Click-to-Open Rate: dos que abriram, quantos clicaram. Mede a qualidade do conteúdo.',
             bench:'Benchmark: 8-15% é bom. Acima de 15% é excelente.'
-        }});
-        kpis.push({{
+        });
+        kpis.push({
             label:'Edições Analisadas', val:fmt(p.length,'n'),
             delta:fmt(totalSent,'n')+' emails enviados', cls:'up',
             desc:'Total de edições com dados de email no período selecionado.',
             bench:''
-        }});
-        kpis.push({{
+        });
+        kpis.push({
             label:'Avg Unsub Rate', val:fmt(avgUnsub,'%'), delta:'por edição', cls:avgUnsub<0.5?'up':'down',
             desc:'Percentual que cancela inscrição após cada envio. Monitore picos.',
             bench:'Benchmark: abaixo de 0.5% é saudável. Acima de 1% é sinal de alerta.'
-        }});
+        });
 
-        // Growth from posts timeline
+        // Growth: contagem exata do último mês fechado, se disponível; senão timeline dos posts
+        const te = s.timeline_exact ? s.timeline_subs : [];
         const tl = s.timeline_posts || [];
-        if (tl.length >= 2) {{
+        if (te.length >= 2) {
+            const m = te[te.length-2];
+            const base = m.cumulative - m.new;
+            const growthPct = base > 0 ? (m.new/base*100) : 0;
+            kpis.push({
+                label:'Crescimento Mensal', val:(m.new>=0?'+':'')+fmt(m.new,'n'),
+                delta:(growthPct>=0?'+':'')+growthPct.toFixed(2)+'% em '+m.month, cls:m.new>=0?'up':'down',
+                desc:'Novos subscribers no último mês fechado (contagem exata pela API).',
+                bench:'Benchmark: 2-5% de crescimento mensal é saudável.'
+            });
+        } else if (tl.length >= 2) {
             const last = tl[tl.length-1];
             const prev = tl[tl.length-2];
             const growth = last.subscribers_estimate - prev.subscribers_estimate;
             const growthPct = prev.subscribers_estimate > 0 ? (growth/prev.subscribers_estimate*100) : 0;
-            kpis.push({{
+            kpis.push({
                 label:'Crescimento Mensal', val:(growth>=0?'+':'')+fmt(growth,'n'),
                 delta:(growthPct>=0?'+':'')+growthPct.toFixed(2)+'% vs mês anterior', cls:growth>=0?'up':'down',
                 desc:'Variação do nº de destinatários entre os meses mais recentes.',
                 bench:'Benchmark: 2-5% de crescimento mensal é saudável.'
-            }});
-        }}
-    }}
+            });
+        }
+    }
 
     document.getElementById('kpis').innerHTML = kpis.map(k => `
         <div class="kpi">
-            <div class="kpi-label">${{k.label}}</div>
-            <div class="kpi-val">${{k.val}}</div>
-            <div class="kpi-delta ${{k.cls}}">${{k.delta}}</div>
-            <div class="kpi-desc">${{k.desc}}</div>
-            ${{k.bench ? '<div class="kpi-bench">'+k.bench+'</div>' : ''}}
+            <div class="kpi-label">${k.label}</div>
+            <div class="kpi-val">${k.val}</div>
+            <div class="kpi-delta ${k.cls}">${k.delta}</div>
+            <div class="kpi-desc">${k.desc}</div>
+            ${k.bench ? '<div class="kpi-bench">'+k.bench+'</div>' : ''}
         </div>`).join('');
-}}
+}
 
 // ── Charts ──
-function destroyCharts() {{ Object.values(charts).forEach(c => c.destroy()); charts = {{}}; }}
+// Gráficos são criados uma vez e depois só atualizados (sem destroy/recreate)
+function upsertChart(key, id, cfg) {
+    const canvas = document.getElementById(id);
+    canvas.style.display = '';
+    const empty = document.getElementById(id + '-empty');
+    if (empty) empty.hidden = true;
+    const c = charts[key];
+    if (!c) return charts[key] = new Chart(canvas, cfg);
+    c.data.labels = cfg.data.labels;
+    cfg.data.datasets.forEach((ds, i) => {
+        if (c.data.datasets[i]) Object.assign(c.data.datasets[i], ds); else c.data.datasets.push(ds);
+    });
+    c.data.datasets.length = cfg.data.datasets.length;
+    c.options = cfg.options;
+    c.update('none');
+    return c;
+}
 
-function renderCharts() {{
-    destroyCharts();
+function hideChart(key, id) {
+    if (charts[key]) { charts[key].destroy(); delete charts[key]; }
+    document.getElementById(id).style.display = 'none';
+    const empty = document.getElementById(id + '-empty');
+    if (empty) empty.hidden = false;
+}
+
+function renderCharts() {
     const p = filteredPosts;
     const s = SUBS;
     const dates = p.map(x => x.date_label);
     const titles = p.map(x => x.title.length > 30 ? x.title.slice(0,30)+'…' : x.title);
 
-    // 1. Subscriber Growth (usa delivered dos posts como proxy)
+    // 1. Subscriber Growth (contagem exata por mês ou delivered dos posts como proxy)
     const tl = s.timeline_posts || [];
-    if (tl.length > 0) {{
-        charts.growth = new Chart(document.getElementById('c-growth'), {{
-            data: {{
+    if (s.timeline_exact) {
+        const ts = s.timeline_subs;
+        upsertChart('growth', 'c-growth', {
+            data: {
+                labels: ts.map(d=>d.month),
+                datasets: [
+                    { type:'line', label:'Subscribers (total no fim do mês)', data:ts.map(d=>d.cumulative), borderColor:COLORS[0], backgroundColor:COLORS[0]+'15', fill:true, tension:0.3, borderWidth:2.5, pointRadius:4, yAxisID:'y' },
+                    { type:'bar', label:'Novos/mês', data:ts.map(d=>d.new), backgroundColor:COLORS[1]+'AA', borderColor:COLORS[1], borderWidth:1, borderRadius:4, yAxisID:'y1' }
+                ]
+            },
+            options: { responsive:true, maintainAspectRatio:false, interaction:{mode:'index',intersect:false},
+                plugins:{legend:{position:'top',labels:{usePointStyle:true,padding:20}}},
+                scales:{ y:{position:'left',beginAtZero:false,title:{display:true,text:'Subscribers'},grid:{color:'#f0f0f0'},ticks:{callback:(v)=>fmt(v,'n')}}, y1:{position:'right',beginAtZero:true,title:{display:true,text:'Novos'},grid:{display:false},ticks:{callback:(v)=>fmt(v,'n')}}, x:{grid:{display:false}} }
+            }
+        });
+    } else if (tl.length > 0) {
+        upsertChart('growth', 'c-growth', {
+            data: {
                 labels: tl.map(d=>d.month),
                 datasets: [
-                    {{ type:'line', label:'Subscribers (por max delivered)', data:tl.map(d=>d.subscribers_estimate), borderColor:COLORS[0], backgroundColor:COLORS[0]+'15', fill:true, tension:0.3, borderWidth:2.5, pointRadius:4, yAxisID:'y' }},
-                    {{ type:'bar', label:'Edições/mês', data:tl.map(d=>d.editions), backgroundColor:COLORS[1]+'AA', borderColor:COLORS[1], borderWidth:1, borderRadius:4, yAxisID:'y1' }}
+                    { type:'line', label:'Subscribers (por max delivered)', data:tl.map(d=>d.subscribers_estimate), borderColor:COLORS[0], backgroundColor:COLORS[0]+'15', fill:true, tension:0.3, borderWidth:2.5, pointRadius:4, yAxisID:'y' },
+                    { type:'bar', label:'Edições/mês', data:tl.map(d=>d.editions), backgroundColor:COLORS[1]+'AA', borderColor:COLORS[1], borderWidth:1, borderRadius:4, yAxisID:'y1' }
                 ]
-            }},
-            options: {{ responsive:true, maintainAspectRatio:false, interaction:{{mode:'index',intersect:false}},
-                plugins:{{legend:{{position:'top',labels:{{usePointStyle:true,padding:20}}}}}},
-                scales:{{ y:{{position:'left',beginAtZero:false,title:{{display:true,text:'Subscribers'}},grid:{{color:'#f0f0f0'}},ticks:{{callback:(v)=>fmt(v,'n')}}}}, y1:{{position:'right',beginAtZero:true,title:{{display:true,text:'Edições'}},grid:{{display:false}}}}, x:{{grid:{{display:false}}}} }}
-            }}
-        }});
-    }} else if (s.timeline_subs && s.timeline_subs.length > 0) {{
+            },
+            options: { responsive:true, maintainAspectRatio:false, interaction:{mode:'index',intersect:false},
+                plugins:{legend:{position:'top',labels:{usePointStyle:true,padding:20}}},
+                scales:{ y:{position:'left',beginAtZero:false,title:{display:true,text:'Subscribers'},grid:{color:'#f0f0f0'},ticks:{callback:(v)=>fmt(v,'n')}}, y1:{position:'right',beginAtZero:true,title:{display:true,text:'Edições'},grid:{display:false}}, x:{grid:{display:false}} }
+            }
+        });
+    } else if (s.timeline_subs && s.timeline_subs.length > 0) {
         const ts = s.timeline_subs;
-        charts.growth = new Chart(document.getElementById('c-growth'), {{
-            data: {{
+        upsertChart('growth', 'c-growth', {
+            data: {
                 labels: ts.map(d=>d.month),
                 datasets: [
-                    {{ type:'line', label:'Acumulado (amostra)', data:ts.map(d=>d.cumulative), borderColor:COLORS[0], backgroundColor:COLORS[0]+'15', fill:true, tension:0.3, borderWidth:2.5, pointRadius:4 }}
+                    { type:'line', label:'Acumulado (amostra)', data:ts.map(d=>d.cumulative), borderColor:COLORS[0], backgroundColor:COLORS[0]+'15', fill:true, tension:0.3, borderWidth:2.5, pointRadius:4 }
                 ]
-            }},
-            options: {{ responsive:true, maintainAspectRatio:false,
-                plugins:{{legend:{{position:'top',labels:{{usePointStyle:true}}}}}},
-                scales:{{ y:{{beginAtZero:false,ticks:{{callback:(v)=>fmt(v,'n')}}}}, x:{{grid:{{display:false}}}} }}
-            }}
-        }});
-    }}
-
-    if (p.length === 0) return;
-    const avgOpen = p.reduce((a,x)=>a+x.open_rate,0)/p.length;
-    const avgClick = p.reduce((a,x)=>a+x.click_rate,0)/p.length;
-    const avgCTO = p.reduce((a,x)=>a+x.cto_rate,0)/p.length;
+            },
+            options: { responsive:true, maintainAspectRatio:false,
+                plugins:{legend:{position:'top',labels:{usePointStyle:true}}},
+                scales:{ y:{beginAtZero:false,ticks:{callback:(v)=>fmt(v,'n')}}, x:{grid:{display:false}} }
+            }
+        });
+    }
 
+    if (p.length === 0) {
+        Object.keys(charts).filter(k => k !== 'growth').forEach(k => { charts[k].destroy(); delete charts[k]; });
+        return;
+    }
+    const avgOpen = agg.avg_open, avgClick = agg.avg_click, avgCTO = agg.avg_cto;
+
+    // Séries por edição: em períodos longos, só os pontos escolhidos por LTTB no gerador
+    const series = (f) => agg.series ? agg.series[f].map(i => POSTS_RAW[i]) : p;
     const tooltipTitle = (items) => p[items[0].dataIndex]?.title || '';
+    const titleOf = (pts) => (items) => pts[items[0].dataIndex]?.title || '';
     const pctLabel = (ctx) => ctx.dataset.label+': '+ctx.parsed.y.toFixed(1)+'%';
     const pctTick = (v) => v+'%';
-    const lineOpts = (color, avg) => ({{
+    const lineOpts = (pts) => ({
         responsive:true, maintainAspectRatio:false,
-        plugins:{{ legend:{{position:'top',labels:{{usePointStyle:true}}}}, tooltip:{{callbacks:{{title:tooltipTitle, label:pctLabel}}}} }},
-        scales:{{ y:{{beginAtZero:true, ticks:{{callback:pctTick}}}}, x:{{ticks:{{maxRotation:45,font:{{size:10}}}}}} }}
-    }});
+        plugins:{ legend:{position:'top',labels:{usePointStyle:true}}, tooltip:{callbacks:{title:titleOf(pts), label:pctLabel}} },
+        scales:{ y:{beginAtZero:true, ticks:{callback:pctTick}}, x:{ticks:{maxRotation:45,font:{size:10}}} }
+    });
 
     // 2. Open Rate
-    charts.open = new Chart(document.getElementById('c-open'), {{
+    const po = series('open_rate');
+    upsertChart('open', 'c-open', {
         type:'line',
-        data:{{ labels:dates, datasets:[
-            {{label:'Open Rate',data:p.map(x=>x.open_rate),borderColor:COLORS[2],backgroundColor:COLORS[2]+'20',fill:true,tension:0.3,borderWidth:2,pointRadius:3,pointHoverRadius:6}},
-            {{label:'Média ('+avgOpen.toFixed(1)+'%)',data:p.map(()=>avgOpen),borderColor:'#999',borderDash:[5,5],borderWidth:1,pointRadius:0}}
-        ]}},
-        options:lineOpts(COLORS[2], avgOpen)
-    }});
+        data:{ labels:po.map(x=>x.date_label), datasets:[
+            {label:'Open Rate',data:po.map(x=>x.open_rate),borderColor:COLORS[2],backgroundColor:COLORS[2]+'20',fill:true,tension:0.3,borderWidth:2,pointRadius:3,pointHoverRadius:6},
+            {label:'Média ('+avgOpen.toFixed(1)+'%)',data:po.map(()=>avgOpen),borderColor:'#999',borderDash:[5,5],borderWidth:1,pointRadius:0}
+        ]},
+        options:lineOpts(po)
+    });
 
     // 3. Click Rate
-    charts.click = new Chart(document.getElementById('c-click'), {{
+    const pc = series('click_rate');
+    upsertChart('click', 'c-click', {
         type:'line',
-        data:{{ labels:dates, datasets:[
-            {{label:'Click Rate',data:p.map(x=>x.click_rate),borderColor:COLORS[0],backgroundColor:COLORS[0]+'20',fill:true,tension:0.3,borderWidth:2,pointRadius:3,pointHoverRadius:6}},
-            {{label:'Média ('+avgClick.toFixed(1)+'%)',data:p.map(()=>avgClick),borderColor:'#999',borderDash:[5,5],borderWidth:1,pointRadius:0}}
-        ]}},
-        options:lineOpts(COLORS[0], avgClick)
-    }});
+        data:{ labels:pc.map(x=>x.date_label), datasets:[
+            {label:'Click Rate',data:pc.map(x=>x.click_rate),borderColor:COLORS[0],backgroundColor:COLORS[0]+'20',fill:true,tension:0.3,borderWidth:2,pointRadius:3,pointHoverRadius:6},
+            {label:'Média ('+avgClick.toFixed(1)+'%)',data:pc.map(()=>avgClick),borderColor:'#999',borderDash:[5,5],borderWidth:1,pointRadius:0}
+        ]},
+        options:lineOpts(pc)
+    });
 
     // 4. CTOR
-    charts.ctor = new Chart(document.getElementById('c-ctor'), {{
+    const pt = series('cto_rate');
+    upsertChart('ctor', 'c-ctor', {
         type:'line',
-        data:{{ labels:dates, datasets:[
-            {{label:'CTOR',data:p.map(x=>x.cto_rate),borderColor:COLORS[4],backgroundColor:COLORS[4]+'20',fill:true,tension:0.3,borderWidth:2,pointRadius:3,pointHoverRadius:6}},
-            {{label:'Média ('+avgCTO.toFixed(1)+'%)',data:p.map(()=>avgCTO),borderColor:'#999',borderDash:[5,5],borderWidth:1,pointRadius:0}}
-        ]}},
-        options:lineOpts(COLORS[4], avgCTO)
-    }});
+        data:{ labels:pt.map(x=>x.date_label), datasets:[
+            {label:'CTOR',data:pt.map(x=>x.cto_rate),borderColor:COLORS[4],backgroundColor:COLORS[4]+'20',fill:true,tension:0.3,borderWidth:2,pointRadius:3,pointHoverRadius:6},
+            {label:'Média ('+avgCTO.toFixed(1)+'%)',data:pt.map(()=>avgCTO),borderColor:'#999',borderDash:[5,5],borderWidth:1,pointRadius:0}
+        ]},
+        options:lineOpts(pt)
+    });
 
     // 5. Unsub Rate
-    charts.unsub = new Chart(document.getElementById('c-unsub'), {{
+    const pu = series('unsub_rate');
+    upsertChart('unsub', 'c-unsub', {
         type:'bar',
-        data:{{ labels:dates, datasets:[
-            {{label:'Unsub Rate',data:p.map(x=>x.unsub_rate),backgroundColor:p.map(x=>x.unsub_rate>1?COLORS[3]+'CC':COLORS[1]+'88'),borderRadius:3}}
-        ]}},
-        options:{{ responsive:true, maintainAspectRatio:false,
-            plugins:{{ legend:{{display:false}}, tooltip:{{callbacks:{{title:tooltipTitle, label:(ctx)=>'Unsub: '+ctx.parsed.y.toFixed(2)+'%'}}}} }},
-            scales:{{ y:{{beginAtZero:true,ticks:{{callback:pctTick}}}}, x:{{ticks:{{maxRotation:45,font:{{size:10}}}}}} }}
-        }}
-    }});
+        data:{ labels:pu.map(x=>x.date_label), datasets:[
+            {label:'Unsub Rate',data:pu.map(x=>x.unsub_rate),backgroundColor:pu.map(x=>x.unsub_rate>1?COLORS[3]+'CC':COLORS[1]+'88'),borderRadius:3}
+        ]},
+        options:{ responsive:true, maintainAspectRatio:false,
+            plugins:{ legend:{display:false}, tooltip:{callbacks:{title:titleOf(pu), label:(ctx)=>'Unsub: '+ctx.parsed.y.toFixed(2)+'%'}} },
+            scales:{ y:{beginAtZero:true,ticks:{callback:pctTick}}, x:{ticks:{maxRotation:45,font:{size:10}}} }
+        }
+    });
 
     // 6. Open Rate Distribution
     const bins = [0,10,20,30,40,50,60,70,80,90,100];
-    const hist = new Array(bins.length-1).fill(0);
-    p.forEach(x => {{ const idx = Math.min(Math.floor(x.open_rate/10), hist.length-1); if(idx>=0) hist[idx]++; }});
-    charts.openDist = new Chart(document.getElementById('c-open-dist'), {{
+    const hist = agg.open_hist;
+    upsertChart('openDist', 'c-open-dist', {
         type:'bar',
-        data:{{ labels:bins.slice(0,-1).map((b,i)=>b+'-'+bins[i+1]+'%'), datasets:[{{label:'Edições',data:hist,backgroundColor:COLORS[1]+'BB',borderColor:COLORS[1],borderWidth:1,borderRadius:4}}] }},
-        options:{{ responsive:true, maintainAspectRatio:false, plugins:{{legend:{{display:false}}}},
-            scales:{{ y:{{beginAtZero:true,title:{{display:true,text:'Nº de edições'}}}}, x:{{title:{{display:true,text:'Open Rate'}}}} }}
-        }}
-    }});
+        data:{ labels:bins.slice(0,-1).map((b,i)=>b+'-'+bins[i+1]+'%'), datasets:[{label:'Edições',data:hist,backgroundColor:COLORS[1]+'BB',borderColor:COLORS[1],borderWidth:1,borderRadius:4}] },
+        options:{ responsive:true, maintainAspectRatio:false, plugins:{legend:{display:false}},
+            scales:{ y:{beginAtZero:true,title:{display:true,text:'Nº de edições'}}, x:{title:{display:true,text:'Open Rate'}} }
+        }
+    });
 
     // 7. Best Day of Week
-    const dayData = Array.from({{length:7}},()=>({{sum:0,count:0}}));
-    p.forEach(x => {{ if (x.day_of_week!=null) {{ dayData[x.day_of_week].sum+=x.open_rate; dayData[x.day_of_week].count++; }} }});
-    const dayAvg = dayData.map(d => d.count>0 ? d.sum/d.count : 0);
+    const dayAvg = agg.weekday_avg;
     const maxDay = Math.max(...dayAvg);
-    charts.weekday = new Chart(document.getElementById('c-weekday'), {{
+    upsertChart('weekday', 'c-weekday', {
         type:'bar',
-        data:{{ labels:DAYS, datasets:[{{label:'Avg Open Rate',data:dayAvg,backgroundColor:dayAvg.map(v=>v===maxDay?COLORS[0]+'CC':COLORS[1]+'88'),borderRadius:6}}] }},
-        options:{{ responsive:true, maintainAspectRatio:false,
-            plugins:{{ legend:{{display:false}}, tooltip:{{callbacks:{{label:(ctx)=>'Open Rate: '+ctx.parsed.y.toFixed(1)+'% ('+dayData[ctx.dataIndex].count+' edições)'}}}} }},
-            scales:{{ y:{{beginAtZero:true,ticks:{{callback:pctTick}}}} }}
-        }}
-    }});
+        data:{ labels:DAYS, datasets:[{label:'Avg Open Rate',data:dayAvg,backgroundColor:dayAvg.map(v=>v===maxDay?COLORS[0]+'CC':COLORS[1]+'88'),borderRadius:6}] },
+        options:{ responsive:true, maintainAspectRatio:false,
+            plugins:{ legend:{display:false}, tooltip:{callbacks:{label:(ctx)=>'Open Rate: '+ctx.parsed.y.toFixed(1)+'% ('+agg.weekday_count[ctx.dataIndex]+' edições)'}} },
+            scales:{ y:{beginAtZero:true,ticks:{callback:pctTick}} }
+        }
+    });
 
     // 8. Funnel
-    charts.funnel = new Chart(document.getElementById('c-funnel'), {{
+    upsertChart('funnel', 'c-funnel', {
         type:'bar',
-        data:{{ labels:dates, datasets:[
-            {{label:'Enviados',data:p.map(x=>x.delivered),backgroundColor:COLORS[1]+'66',borderColor:COLORS[1],borderWidth:1,borderRadius:2}},
-            {{label:'Abertos',data:p.map(x=>x.unique_opens),backgroundColor:COLORS[2]+'88',borderColor:COLORS[2],borderWidth:1,borderRadius:2}},
-            {{label:'Clicados',data:p.map(x=>x.unique_clicks),backgroundColor:COLORS[0]+'AA',borderColor:COLORS[0],borderWidth:1,borderRadius:2}}
-        ]}},
-        options:{{ responsive:true, maintainAspectRatio:false, interaction:{{mode:'index',intersect:false}},
-            plugins:{{ legend:{{position:'top',labels:{{usePointStyle:true}}}}, tooltip:{{callbacks:{{title:tooltipTitle}}}} }},
-            scales:{{ y:{{beginAtZero:true,ticks:{{callback:(v)=>fmt(v,'n')}}}}, x:{{ticks:{{maxRotation:45,font:{{size:10}}}}}} }}
-        }}
-    }});
+        data:{ labels:dates, datasets:[
+            {label:'Enviados',data:p.map(x=>x.delivered),backgroundColor:COLORS[1]+'66',borderColor:COLORS[1],borderWidth:1,borderRadius:2},
+            {label:'Abertos',data:p.map(x=>x.unique_opens),backgroundColor:COLORS[2]+'88',borderColor:COLORS[2],borderWidth:1,borderRadius:2},
+            {label:'Clicados',data:p.map(x=>x.unique_clicks),backgroundColor:COLORS[0]+'AA',borderColor:COLORS[0],borderWidth:1,borderRadius:2}
+        ]},
+        options:{ responsive:true, maintainAspectRatio:false, interaction:{mode:'index',intersect:false},
+            plugins:{ legend:{position:'top',labels:{usePointStyle:true}}, tooltip:{callbacks:{title:tooltipTitle}} },
+            scales:{ y:{beginAtZero:true,ticks:{callback:(v)=>fmt(v,'n')}}, x:{ticks:{maxRotation:45,font:{size:10}}} }
+        }
+    });
 
     // 9. Web vs Email
     const hasWeb = p.some(x => x.web_views > 0);
-    if (hasWeb) {{
-        charts.web = new Chart(document.getElementById('c-web'), {{
+    if (hasWeb) {
+        upsertChart('web', 'c-web', {
             type:'bar',
-            data:{{ labels:dates, datasets:[
-                {{label:'Email Opens',data:p.map(x=>x.unique_opens),backgroundColor:COLORS[1]+'88',borderRadius:3}},
-                {{label:'Web Views',data:p.map(x=>x.web_views),backgroundColor:COLORS[2]+'88',borderRadius:3}},
-                {{label:'Email Clicks',data:p.map(x=>x.unique_clicks),backgroundColor:COLORS[0]+'88',borderRadius:3}},
-                {{label:'Web Clicks',data:p.map(x=>x.web_clicks),backgroundColor:COLORS[4]+'88',borderRadius:3}}
-            ]}},
-            options:{{ responsive:true, maintainAspectRatio:false, interaction:{{mode:'index',intersect:false}},
-                plugins:{{ legend:{{position:'top',labels:{{usePointStyle:true}}}}, tooltip:{{callbacks:{{title:tooltipTitle}}}} }},
-                scales:{{ y:{{beginAtZero:true,ticks:{{callback:(v)=>fmt(v,'n')}}}}, x:{{ticks:{{maxRotation:45,font:{{size:10}}}}}} }}
-            }}
-        }});
-    }} else {{
-        document.getElementById('c-web').parentElement.parentElement.innerHTML = '<div class="chart-box"><h3>Email vs Web</h3><p style="color:var(--text2);padding:40px;text-align:center">Sem dados de web views nos posts.</p></div>';
-    }}
-
-    // 10. Top Links (agregado de todos os posts)
-    const linkMap = {{}};
-    p.forEach(x => {{
-        (x.top_links || []).forEach(lnk => {{
-            const url = lnk.url || '';
-            if (!url) return;
-            if (!linkMap[url]) linkMap[url] = {{url, total:0, unique:0}};
-            linkMap[url].total += lnk.total_clicks || 0;
-            linkMap[url].unique += lnk.unique_clicks || 0;
-        }});
-    }});
-    const topLinks = Object.values(linkMap).sort((a,b) => b.unique - a.unique).slice(0, 15);
-    if (topLinks.length > 0) {{
-        const shortUrls = topLinks.map(l => {{
-            try {{ const u = new URL(l.url); return u.hostname + u.pathname.slice(0,30); }} catch {{ return l.url.slice(0,40); }}
-        }});
-        charts.toplinks = new Chart(document.getElementById('c-toplinks'), {{
+            data:{ labels:dates, datasets:[
+                {label:'Email Opens',data:p.map(x=>x.unique_opens),backgroundColor:COLORS[1]+'88',borderRadius:3},
+                {label:'Web Views',data:p.map(x=>x.web_views),backgroundColor:COLORS[2]+'88',borderRadius:3},
+                {label:'Email Clicks',data:p.map(x=>x.unique_clicks),backgroundColor:COLORS[0]+'88',borderRadius:3},
+                {label:'Web Clicks',data:p.map(x=>x.web_clicks),backgroundColor:COLORS[4]+'88',borderRadius:3}
+            ]},
+            options:{ responsive:true, maintainAspectRatio:false, interaction:{mode:'index',intersect:false},
+                plugins:{ legend:{position:'top',labels:{usePointStyle:true}}, tooltip:{callbacks:{title:tooltipTitle}} },
+                scales:{ y:{beginAtZero:true,ticks:{callback:(v)=>fmt(v,'n')}}, x:{ticks:{maxRotation:45,font:{size:10}}} }
+            }
+        });
+    } else {
+        hideChart('web', 'c-web');
+    }
+
+    // 10. Top Links (agregado de todos os posts do período, pré-calculado)
+    const topLinks = agg.top_links || [];
+    if (topLinks.length > 0) {
+        // `key` já vem normalizada (domínio + caminho)
+        const shortUrls = topLinks.map(l => l.key.length > 45 ? l.key.slice(0,45)+'…' : l.key);
+        upsertChart('toplinks', 'c-toplinks', {
             type:'bar',
-            data:{{ labels:shortUrls, datasets:[
-                {{label:'Cliques Únicos',data:topLinks.map(l=>l.unique),backgroundColor:COLORS[0]+'AA',borderRadius:4}},
-                {{label:'Cliques Totais',data:topLinks.map(l=>l.total),backgroundColor:COLORS[1]+'66',borderRadius:4}}
-            ]}},
-            options:{{ responsive:true, maintainAspectRatio:false, indexAxis:'y',
-                plugins:{{ legend:{{position:'top',labels:{{usePointStyle:true}}}},
-                    tooltip:{{callbacks:{{afterLabel:(ctx)=>topLinks[ctx.dataIndex].url}}}} }},
-                scales:{{ x:{{beginAtZero:true,ticks:{{callback:(v)=>fmt(v,'n')}}}}, y:{{ticks:{{font:{{size:10}}}}}} }}
-            }}
-        }});
-    }} else {{
-        document.getElementById('c-toplinks').parentElement.parentElement.innerHTML = '<div class="chart-box"><h3>Top Links</h3><p style="color:var(--text2);padding:40px;text-align:center">Sem dados de clicks por URL.</p></div>';
-    }}
-}}
+            data:{ labels:shortUrls, datasets:[
+                {label:'Cliques Únicos',data:topLinks.map(l=>l.unique),backgroundColor:COLORS[0]+'AA',borderRadius:4},
+                {label:'Cliques Totais',data:topLinks.map(l=>l.total),backgroundColor:COLORS[1]+'66',borderRadius:4}
+            ]},
+            options:{ responsive:true, maintainAspectRatio:false, indexAxis:'y',
+                plugins:{ legend:{position:'top',labels:{usePointStyle:true}},
+                    tooltip:{callbacks:{afterLabel:(ctx)=>topLinks[ctx.dataIndex].url}} },
+                scales:{ x:{beginAtZero:true,ticks:{callback:(v)=>fmt(v,'n')}}, y:{ticks:{font:{size:10}}} }
+            }
+        });
+    } else {
+        hideChart('toplinks', 'c-toplinks');
+    }
+}
 
 // ── Table ──
-function renderTable() {{
-    const p = filteredPosts;
-    if (!p.length) {{ document.getElementById('tbl').innerHTML = '<p style="color:var(--text2)">Nenhum post no período.</p>'; return; }}
-
-    const cols = [
-        {{f:'title',l:'Edição',fmt:null}},
-        {{f:'date_label',l:'Data',fmt:null}},
-        {{f:'delivered',l:'Enviados',fmt:'n'}},
-        {{f:'unique_opens',l:'Abertos',fmt:'n'}},
-        {{f:'open_rate',l:'Open Rate',fmt:'bar-green'}},
-        {{f:'unique_clicks',l:'Cliques',fmt:'n'}},
-        {{f:'click_rate',l:'Click Rate',fmt:'bar-orange'}},
-        {{f:'cto_rate',l:'CTOR',fmt:'%'}},
-        {{f:'unsubscribes',l:'Unsubs',fmt:'n'}},
-        {{f:'web_views',l:'Web Views',fmt:'n'}},
-    ];
-
-    let sortCol = 'date', sortDir = 'desc';
-    const maxOpen = Math.max(...p.map(x=>x.open_rate));
-    const maxClick = Math.max(...p.map(x=>x.click_rate));
-
-    function render(sorted) {{
-        let h = '<table><thead><tr>';
-        cols.forEach(c => {{
-            const arrow = sortCol===c.f ? (sortDir==='asc'?' ▲':' ▼') : '';
-            h += '<th data-col="'+c.f+'">'+c.l+arrow+'</th>';
-        }});
-        h += '</tr></thead><tbody>';
-        sorted.forEach(r => {{
-            h += '<tr>';
-            cols.forEach(c => {{
-                let v = r[c.f];
-                if (c.fmt==='n') v = fmt(v,'n');
-                else if (c.fmt==='%') v = fmt(v,'%');
-                else if (c.fmt==='bar-green') {{
-                    const w = maxOpen>0 ? (v/maxOpen*60) : 0;
-                    v = '<span class="bar" style="width:'+w+'px;background:var(--teal)"></span>'+v.toFixed(1)+'%';
-                }} else if (c.fmt==='bar-orange') {{
-                    const w = maxClick>0 ? (v/maxClick*60) : 0;
-                    v = '<span class="bar" style="width:'+w+'px;background:var(--orange)"></span>'+v.toFixed(1)+'%';
-                }}
-                h += '<td>'+v+'</td>';
-            }});
-            h += '</tr>';
-        }});
-        h += '</tbody></table>';
-        document.getElementById('tbl').innerHTML = h;
-
-        document.querySelectorAll('#tbl th').forEach(th => {{
-            th.addEventListener('click', () => {{
-                const col = th.dataset.col;
-                if (sortCol===col) sortDir = sortDir==='asc'?'desc':'asc';
-                else {{ sortCol=col; sortDir='desc'; }}
-                doSort();
-            }});
-        }});
-    }}
-
-    function doSort() {{
-        const sorted = [...p].sort((a,b) => {{
-            let av=a[sortCol], bv=b[sortCol];
-            if (typeof av==='string') {{ av=av.toLowerCase(); bv=bv.toLowerCase(); }}
-            const cmp = av<bv?-1:av>bv?1:0;
-            return sortDir==='asc'?cmp:-cmp;
-        }});
-        render(sorted);
-    }}
-    doSort();
-}}
-
-// Raw stats debug
-if (POSTS_RAW.length > 0 && POSTS_RAW[0].raw_stats) {{
-    document.getElementById('raw-stats').textContent = JSON.stringify(POSTS_RAW[0].raw_stats, null, 2);
-}}
+// Tabela virtualizada: só as linhas visíveis vão para o DOM. A ordem de cada
+// coluna vem pronta do gerador (ORDER), então ordenar, filtrar por período e
+// buscar por título é só percorrer uma lista de índices.
+const TABLE_COLS = [
+    {f:'title',l:'Edição',fmt:null},
+    {f:'date_label',l:'Data',fmt:null},
+    {f:'delivered',l:'Enviados',fmt:'n'},
+    {f:'unique_opens',l:'Abertos',fmt:'n'},
+    {f:'open_rate',l:'Open Rate',fmt:'bar-green'},
+    {f:'unique_clicks',l:'Cliques',fmt:'n'},
+    {f:'click_rate',l:'Click Rate',fmt:'bar-orange'},
+    {f:'cto_rate',l:'CTOR',fmt:'%'},
+    {f:'unsubscribes',l:'Unsubs',fmt:'n'},
+    {f:'web_views',l:'Web Views',fmt:'n'},
+];
+const ROW_H = 38, OVERSCAN = 10;
+let ORDER = {};
+let TITLES_LC = [];
+let tblSort = {col:'date', dir:'desc'};
+let tblRows = [];
+
+function tableRows() {
+    const ord = ORDER[tblSort.col];
+    const q = document.getElementById('tbl-search').value.trim().toLowerCase();
+    const start = agg.start || 0;
+    const rows = [];
+    for (let k = 0; k < POSTS_RAW.length; k++) {
+        const i = ord ? ord[k] : k;
+        if (i >= start && (!q || TITLES_LC[i].includes(q))) rows.push(i);
+    }
+    if (tblSort.dir === 'desc') rows.reverse();
+    return rows;
+}
+
+function tableRow(r) {
+    let h = '<tr>';
+    TABLE_COLS.forEach(c => {
+        let v = r[c.f];
+        if (c.fmt==='n') v = fmt(v,'n');
+        else if (c.fmt==='%') v = fmt(v,'%');
+        else if (c.fmt==='bar-green') {
+            const w = agg.max_open_rate>0 ? (v/agg.max_open_rate*60) : 0;
+            v = '<span class="bar" style="width:'+w+'px;background:var(--teal)"></span>'+v.toFixed(1)+'%';
+        } else if (c.fmt==='bar-orange') {
+            const w = agg.max_click_rate>0 ? (v/agg.max_click_rate*60) : 0;
+            v = '<span class="bar" style="width:'+w+'px;background:var(--orange)"></span>'+v.toFixed(1)+'%';
+        }
+        h += c.f==='title' ? '<td title="'+String(v).replace(/"/g,'&quot;')+'">'+v+'</td>' : '<td>'+v+'</td>';
+    });
+    return h + '</tr>';
+}
+
+// Desenha só a janela visível (+ folga), com espaçadores no lugar do resto
+function renderRows() {
+    const box = document.getElementById('tbl');
+    const first = Math.max(0, Math.floor(box.scrollTop / ROW_H) - OVERSCAN);
+    const last = Math.min(tblRows.length, Math.ceil((box.scrollTop + (box.clientHeight || 600)) / ROW_H) + OVERSCAN);
+    let h = '<tr style="height:'+(first*ROW_H)+'px"></tr>';
+    for (let k = first; k < last; k++) h += tableRow(POSTS_RAW[tblRows[k]]);
+    h += '<tr style="height:'+((tblRows.length-last)*ROW_H)+'px"></tr>';
+    box.querySelector('tbody').innerHTML = h;
+}
+
+function renderTable() {
+    const box = document.getElementById('tbl');
+    if (!filteredPosts.length) {
+        box.innerHTML = '<p style="color:var(--text2)">Nenhum post no período.</p>';
+        box.dataset.ready = '';
+        document.getElementById('tbl-count').textContent = '';
+        return;
+    }
+    if (!box.dataset.ready) {
+        box.innerHTML = '<table><thead><tr></tr></thead><tbody></tbody></table>';
+        box.dataset.ready = '1';
+        box.onscroll = () => requestAnimationFrame(renderRows);
+        box.querySelector('thead').addEventListener('click', e => {
+            const col = e.target.dataset && e.target.dataset.col;
+            if (!col) return;
+            if (tblSort.col===col) tblSort.dir = tblSort.dir==='asc'?'desc':'asc';
+            else tblSort = {col, dir:'desc'};
+            renderTable();
+        });
+    }
+    box.querySelector('thead tr').innerHTML = TABLE_COLS.map(c => {
+        const arrow = (tblSort.col===c.f || (tblSort.col==='date' && c.f==='date_label')) ? (tblSort.dir==='asc'?' ▲':' ▼') : '';
+        return '<th data-col="'+(c.f==='date_label'?'date':c.f)+'">'+c.l+arrow+'</th>';
+    }).join('');
+
+    tblRows = tableRows();
+    document.getElementById('tbl-count').textContent = fmt(tblRows.length,'n')+' de '+fmt(filteredPosts.length,'n')+' edições';
+    box.scrollTop = 0;
+    renderRows();
+}
 
 // Init
-applyFilters();
+function boot(data) {
+    POSTS_RAW = unpackPosts(data.posts);
+    SUBS = data.subs;
+    PERIODS = data.periods || {};
+    ORDER = data.order || {};
+    TITLES_LC = POSTS_RAW.map(p => (p.title || '').toLowerCase());
+    // Raw stats debug
+    if (data.raw_stats && Object.keys(data.raw_stats).length > 0) {
+        document.getElementById('raw-stats').textContent = JSON.stringify(data.raw_stats, null, 2);
+        document.getElementById('raw-section').hidden = false;
+    }
+    applyFilters();
+}
+@@data_script@@
 </script>
 </body>
 </html>"""
 
-    return html
+
+def generate_dashboard(posts, subscribers, raw_stats_sample, data_url=None, data_version=None, payload_json=None):
+    """Gera o dashboard HTML completo a partir do DASHBOARD_TEMPLATE.
+
+    Sem `data_url`, os dados vão embutidos no HTML (`payload_json`, se já
+    serializado por quem chama, ou montados aqui). Com `data_url`, o HTML é
+    só o shell estático e busca o payload (preferindo a versão .gz, que o
+    navegador descomprime com DecompressionStream); `data_version` (hash do
+    payload) entra na URL, então o shell muda exatamente quando os dados mudam.
+    """
+    period_options = "\n".join(
+        f'                    <option value="{p}">{period_label(p)}</option>' for p in PERIODS
+    )
+    template = compile_template(DASHBOARD_TEMPLATE, period_options=period_options)
+    if data_url:
+        data_script = f"loadData({json.dumps(data_url)}, {json.dumps(data_version)}).then(boot);"
+    else:
+        if payload_json is None:
+            payload_json = dump_payload(build_dashboard_payload(posts, subscribers, raw_stats_sample))
+        data_script = f"boot({payload_json});"
+    return render_template(template, generated_at=datetime.now().strftime("%d/%m/%Y %H:%M"),
+                           data_script=data_script)
+
+
+def generate_overview(summaries):
+    """Gera a visão geral do portfólio (modo lote): uma linha por publicação.
+
+    Publicações sem total de subscribers (None) aparecem com "—" e ficam
+    fora das somas.
+    """
+    now = datetime.now().strftime("%d/%m/%Y %H:%M")
+    known = [s for s in summaries if s["subscribers"] is not None]
+    max_subs = max([s["subscribers"] for s in known] or [0]) or 1
+    total_subs = sum(s["subscribers"] for s in known)
+    total_active = sum(s["active"] for s in known)
+    count = lambda n: "—" if n is None else f"{n:,}"
+    weighted = lambda key: (sum(s[key] * s["latest_delivered"] for s in summaries)
+                            / (sum(s["latest_delivered"] for s in summaries) or 1))
+    rows = "\n".join(
+        f"""            <tr>
+                <td><a href="{escape(s['dashboard'])}">{escape(s['name'])}</a></td>
+                <td><span class="bar" style="width:{(s['subscribers'] or 0) / max_subs * 80:.0f}px"></span>{count(s['subscribers'])}</td>
+                <td>{count(s['active'])}</td>
+                <td>{s['posts']:,}</td>
+                <td>{s['avg_open']:.1f}%</td>
+                <td>{s['avg_click']:.1f}%</td>
+                <td>{s['avg_unsub']:.2f}%</td>
+                <td>{escape(s['last_post'] or '-')}</td>
+            </tr>"""
+        for s in sorted(summaries, key=lambda s: s["subscribers"] or 0, reverse=True)
+    )
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Portfólio de Newsletters — Beehiiv</title>
+    <style>
+        :root {{ --bg:#f5f5f7; --card:#fff; --text:#1d1d1f; --text2:#6e6e73; --orange:#FF6719; --radius:12px; }}
+        * {{ margin:0; padding:0; box-sizing:border-box; }}
+        body {{ font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',Roboto,sans-serif; background:var(--bg); color:var(--text); padding:16px; }}
+        .header {{ background:linear-gradient(135deg,#1a1a2e 0%,#16213e 50%,#0f3460 100%); color:#fff; padding:24px 28px; border-radius:var(--radius); margin-bottom:16px; }}
+        .header h1 {{ font-size:22px; }}
+        .header p {{ font-size:13px; color:rgba(255,255,255,0.6); }}
+        .kpis {{ display:flex; gap:16px; margin-bottom:16px; flex-wrap:wrap; }}
+        .kpi {{ background:var(--card); border-radius:var(--radius); padding:16px 20px; flex:1; min-width:180px; }}
+        .kpi-label {{ font-size:11px; text-transform:uppercase; color:var(--text2); }}
+        .kpi-val {{ font-size:26px; font-weight:700; }}
+        .table-box {{ background:var(--card); border-radius:var(--radius); padding:20px 24px; overflow-x:auto; }}
+        table {{ width:100%; border-collapse:collapse; font-size:13px; }}
+        th {{ text-align:left; padding:10px 12px; border-bottom:2px solid #e5e5ea; color:var(--text2); font-size:11px; text-transform:uppercase; }}
+        td {{ padding:10px 12px; border-bottom:1px solid #f2f2f7; white-space:nowrap; }}
+        a {{ color:var(--orange); text-decoration:none; font-weight:600; }}
+        .bar {{ display:inline-block; height:6px; border-radius:3px; margin-right:6px; vertical-align:middle; background:var(--orange); }}
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>Portfólio de Newsletters</h1>
+        <p>{len(summaries)} publicações · Atualizado em {now}</p>
+    </div>
+    <div class="kpis">
+        <div class="kpi"><div class="kpi-label">Subscribers (total)</div><div class="kpi-val">{total_subs:,}</div></div>
+        <div class="kpi"><div class="kpi-label">Ativos (estimativa)</div><div class="kpi-val">{total_active:,}</div></div>
+        <div class="kpi"><div class="kpi-label">Open Rate (ponderado)</div><div class="kpi-val">{weighted("avg_open"):.1f}%</div></div>
+        <div class="kpi"><div class="kpi-label">Click Rate (ponderado)</div><div class="kpi-val">{weighted("avg_click"):.1f}%</div></div>
+    </div>
+    <div class="table-box">
+        <table>
+            <thead><tr><th>Publicação</th><th>Subscribers</th><th>Ativos</th><th>Edições</th><th>Avg Open</th><th>Avg Click</th><th>Avg Unsub</th><th>Último envio</th></tr></thead>
+            <tbody>
+{rows}
+            </tbody>
+        </table>
+    </div>
+</body>
+</html>"""
 
 
 # ============================================================
 # MAIN
 # ============================================================
-def main():
+def _profile_top(profiler, limit=25):
+    """As `limit` funções com maior tempo acumulado no cProfile."""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:limit]
+    return [
+        {"function": f"{func} ({os.path.basename(filename)}:{line})", "calls": nc,
+         "tottime": round(tt, 4), "cumtime": round(ct, 4)}
+        for (filename, line, func), (cc, nc, tt, ct, callers) in rows
+    ]
+
+
+def run_publication(report):
+    """Busca, processa e gera o dashboard da publicação atual (CURRENT_PUB).
+
+    Registra as etapas em `report` e retorna o resumo usado na visão geral
+    do portfólio, ou None se a API não devolveu nada.
+    """
+    pub_id = _pub_id()
+    output_path = _data_path(OUTPUT_FILE)
     print("=" * 60)
     print("  Beehiiv Newsletter Analytics")
     print("=" * 60)
-    print(f"  Publication: {PUB_ID}")
-    print(f"  Output: {OUTPUT_FILE}")
+    print(f"  Publication: {pub_id}")
+    print(f"  Output: {output_path}")
 
-    # Fetch data
-    raw_posts = fetch_posts()
-    raw_subs = fetch_subscribers()
+    # Fetch + process: cada página de posts é normalizada assim que chega
+    schema = PostStatsSchema()
+    with report.stage("fetch_process_posts"):
+        posts = process_posts(iter_posts(), schema)
+    with report.stage("fetch_subscribers"):
+        raw_subs = fetch_subscribers()
 
-    if not raw_posts and not raw_subs.get("raw"):
-        print("\n❌ Nenhum dado encontrado. Verifique seu API key e Publication ID.")
-        sys.exit(1)
-
-    # Debug: mostra estrutura do primeiro post
-    if raw_posts:
-        first = raw_posts[0]
-        print("\n🔍 Estrutura do primeiro post (stats):")
-        stats = first.get("stats", {})
-        if isinstance(stats, dict):
-            for k, v in stats.items():
-                print(f"    {k}: {type(v).__name__} = {repr(v)[:120]}")
-        else:
-            print(f"    stats é {type(stats).__name__}: {repr(stats)[:200]}")
+    if not posts and not raw_subs.get("raw"):
+        print(f"\n❌ Nenhum dado encontrado para {pub_id}. Verifique seu API key e Publication ID.")
+        return None
 
     # Process
     print("\n⚙️  Processando dados...")
-    posts = process_posts(raw_posts) if raw_posts else []
-    subscribers = process_subscribers(raw_subs, posts) if raw_subs else {"total": 0, "active": 0, "inactive": 0, "timeline_subs": [], "timeline_posts": []}
+    with report.stage("process_subscribers"):
+        if raw_subs.get("unavailable"):
+            # Total desconhecido: None (e não 0) no dashboard, no histórico e no portfólio
+            subscribers = {"total": None, "active": None, "inactive": None, "unavailable": True,
+                           "timeline_subs": [], "timeline_posts": []}
+        else:
+            subscribers = process_subscribers(raw_subs, posts)
 
     print(f"  Posts processados: {len(posts)}")
-    if subscribers.get("is_sampled"):
+    if subscribers.get("unavailable"):
+        print("  Subscribers: indisponíveis nesta execução (falha ao buscar a primeira página)")
+    elif subscribers.get("is_sampled"):
         print(f"  Subscribers: ~{subscribers['total']:,} total (amostra de {subscribers['sample_size']:,}, ~{subscribers['active_rate_sample']}% ativos)")
     else:
         print(f"  Subscribers: {subscribers['total']:,} (ativos: {subscribers['active']:,})")
 
-    # Grab a raw stats sample for debug
-    raw_sample = raw_posts[0].get("stats", {}) if raw_posts else {}
+    # Snapshot do dia no histórico (+ compactação opcional)
+    if HISTORY_DB:
+        with report.stage("history"):
+            history_path = _data_path(HISTORY_DB)
+            days = record_snapshot(posts, subscribers, history_path)
+            print(f"  Histórico: snapshot gravado ({days} dias em {HISTORY_DB})")
+            if HISTORY_COMPACT:
+                removed = compact_history(history_path)
+                print(f"  Histórico compactado: {removed} snapshots removidos")
 
     # Generate dashboard
     print("\n🎨 Gerando dashboard...")
-    html = generate_dashboard(posts, subscribers, raw_sample)
+    payload_path = output_path.replace(".html", "_payload.json")
+    with report.stage("generate_dashboard"):
+        # Subscribers serializados uma vez: vão no payload e no arquivo de dados
+        subs_json = json_bytes(subscribers)
+        payload_json = dump_payload(build_dashboard_payload(posts, subscribers, schema.sample), subs_json)
+        if OUTPUT_MODE == "split":
+            html = generate_dashboard(posts, subscribers, schema.sample, data_url=os.path.basename(payload_path),
+                                      data_version=payload_version(payload_json))
+        else:
+            html = generate_dashboard(posts, subscribers, schema.sample, payload_json=payload_json)
 
-    # Save
-    output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), OUTPUT_FILE)
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    # Save (arquivos sem mudança de conteúdo não são regravados)
+    with report.stage("write"):
+        if not write_if_changed(output_path, html, compare_hash=True):
+            print(f"   Dashboard sem mudanças desde a última execução (arquivo mantido)")
+        if OUTPUT_MODE == "split":
+            size, changed = write_payload_files(payload_json, payload_path)
+            print(f"   Payload: {payload_path} ({size / 1024:.0f} KB, + .gz){'' if changed else ' — sem mudanças'}")
+
+        # Also save raw JSON for reference
+        json_path = output_path.replace(".html", "_data.json")
+        write_data_file(json_path, posts, subs_json)
 
     print(f"\n✅ Dashboard gerado: {output_path}")
     print(f"   Abra no navegador para visualizar!")
-
-    # Also save raw JSON for reference
-    json_path = output_path.replace(".html", "_data.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump({"posts": posts, "subscribers": subscribers}, f, ensure_ascii=False, indent=2, default=str)
     print(f"   Dados brutos: {json_path}")
 
+    email_posts = [p for p in posts if p.delivered > 0]
+    report.extra["counts"] = {"posts": len(posts), "subscriber_sample": subscribers.get("sample_size", 0)}
+    return {
+        "id": pub_id,
+        "name": (CURRENT_PUB.get() or {}).get("name") or pub_id,
+        "dashboard": output_path,
+        "posts": len(email_posts),
+        "subscribers": subscribers.get("total"),
+        "active": subscribers.get("active"),
+        "latest_delivered": email_posts[-1].delivered if email_posts else 0,
+        "last_post": email_posts[-1].date_label if email_posts else None,
+        "avg_open": round(_mean([p.open_rate for p in email_posts]), 2),
+        "avg_click": round(_mean([p.click_rate for p in email_posts]), 2),
+        "avg_unsub": round(_mean([p.unsub_rate for p in email_posts]), 3),
+    }
+
+
+def _finish_report(report, output_path, profiler=None):
+    """Grava o relatório da execução (e o profiling, se ativado) ao lado do dashboard."""
+    if profiler:
+        profiler.disable()
+        prof_path = output_path.replace(".html", "_run.prof")
+        profiler.dump_stats(prof_path)
+        report.extra["cprofile"] = {"file": os.path.basename(prof_path), "top": _profile_top(profiler)}
+    report_path = output_path.replace(".html", "_run.json")
+    report.write(report_path)
+    report.print_summary()
+    print(f"   Relatório: {report_path}")
+
+
+def _run_in_context(pub):
+    """Roda uma publicação do lote com seu próprio relatório de execução."""
+    os.makedirs(pub["dir"], exist_ok=True)
+    CURRENT_PUB.set(pub)
+    # cProfile não vale no lote (ver run_batch): o relatório não o anuncia
+    report = RunReport("" if PROFILE_MODE == "cprofile" else PROFILE_MODE)
+    CURRENT_REPORT.set(report)
+    t0 = time.perf_counter()
+    try:
+        summary = run_publication(report)
+    except Exception as e:  # uma publicação com erro não derruba o lote
+        print(f"\n❌ {pub['id']}: {e!r}")
+        summary = None
+    finally:
+        _finish_report(report, _data_path(OUTPUT_FILE))
+    if summary:
+        summary["seconds"] = round(time.perf_counter() - t0, 1)
+        summary["requests"] = report.totals["requests"]
+    return summary
+
+
+def load_publications(pubs=None, config=None):
+    """Lista de publicações do lote: ids separados por vírgula e/ou arquivo JSON.
+
+    O arquivo pode ser uma lista de ids ou de objetos {"id": ..., "name": ...}.
+    """
+    entries = []
+    if config:
+        with open(config, encoding="utf-8") as f:
+            data = json.load(f)
+        for item in data.get("publications", []) if isinstance(data, dict) else data:
+            entries.append(item if isinstance(item, dict) else {"id": item})
+    if pubs:
+        entries.extend({"id": p.strip()} for p in pubs.split(",") if p.strip())
+    seen, out = set(), []
+    for entry in entries:
+        if entry.get("id") and entry["id"] not in seen:
+            seen.add(entry["id"])
+            out.append({"id": entry["id"], "name": entry.get("name") or entry["id"]})
+    return out
+
+
+def run_batch(publications, out_dir, workers=None):
+    """Processa várias publicações em paralelo e gera a visão geral do portfólio.
+
+    Threads em vez de processos: o trabalho é quase todo espera de rede, e
+    só dentro de um mesmo processo as publicações dividem o HTTP_POOL e o
+    RATE_LIMITER (o limite da API é por chave, não por publicação). Cada
+    thread roda num contexto próprio (CURRENT_PUB/CURRENT_REPORT), com
+    dashboard e arquivos de dados em out_dir/<pub_id>/.
+
+    BEEHIIV_PROFILE=cprofile não é suportado aqui: o cProfile só mede a
+    thread em que foi ativado. Para perfilar, rode uma publicação por vez.
+    """
+    if PROFILE_MODE == "cprofile":
+        print("⚠️  BEEHIIV_PROFILE=cprofile é ignorado no modo lote — rode uma publicação por vez para perfilar")
+    out_dir = os.path.abspath(out_dir)
+    for pub in publications:
+        pub["dir"] = os.path.join(out_dir, re.sub(r"[^\w.-]", "_", pub["id"]))
+    workers = max(1, workers or len(publications))
+    print(f"📚 Modo lote: {len(publications)} publicações, {workers} em paralelo → {out_dir}")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _run_in_context, pub) for pub in publications]
+        summaries = [f.result() for f in futures]
+
+    done = [s for s in summaries if s]
+    for summary in done:
+        summary["dashboard"] = os.path.relpath(summary["dashboard"], out_dir)
+    overview_path = os.path.join(out_dir, "index.html")
+    write_if_changed(overview_path, generate_overview(done))
+    _write_json_atomic(os.path.join(out_dir, "portfolio.json"), {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "seconds": round(time.perf_counter() - t0, 1),
+        "publications": done,
+        "failed": [p["id"] for p, s in zip(publications, summaries) if not s],
+    })
+    print(f"\n✅ Portfólio: {len(done)}/{len(publications)} publicações em {time.perf_counter() - t0:.1f}s")
+    print(f"   Visão geral: {overview_path}")
+    return len(done) == len(publications)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dashboard de analytics de newsletters do Beehiiv.")
+    parser.add_argument("--pubs", help="ids de publicações separados por vírgula (modo lote)")
+    parser.add_argument("--config", help="arquivo JSON com a lista de publicações (modo lote)")
+    parser.add_argument("--out-dir", default="dashboards", help="pasta de saída do modo lote (padrão: dashboards)")
+    parser.add_argument("--workers", type=int, help="publicações processadas em paralelo (padrão: todas)")
+    args = parser.parse_args(argv)
+
+    if PROFILE_MODE == "tracemalloc":
+        tracemalloc.start()
+    try:
+        if args.pubs or args.config:
+            publications = load_publications(args.pubs, args.config)
+            if not publications:
+                parser.error("nenhuma publicação em --pubs/--config")
+            ok = run_batch(publications, args.out_dir, args.workers)
+        else:
+            report = RunReport(PROFILE_MODE)
+            CURRENT_REPORT.set(report)
+            profiler = cProfile.Profile() if PROFILE_MODE == "cprofile" else None
+            if profiler:
+                profiler.enable()
+            try:
+                summary = run_publication(report)
+            finally:
+                # Relatório (e .prof) também quando a execução falha ou é interrompida
+                _finish_report(report, _data_path(OUTPUT_FILE), profiler)
+            if summary is None:
+                sys.exit(1)
+            ok = True
+        if RESPONSE_CACHE:
+            evicted = RESPONSE_CACHE.evict()
+            if evicted:
+                print(f"  Cache HTTP: {evicted} respostas antigas removidas")
+    finally:
+        if PROFILE_MODE == "tracemalloc":
+            tracemalloc.stop()
     print("\n" + "=" * 60)
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Beehiiv Analytics — Benchmarks offline
+Sobe um servidor local que imita a API v2 do Beehiiv e mede o
+beehiiv_analytics.py sem depender da API real nem da API key.
+
+Uso:
+    python benchmark.py            # todos os cenários
+    python benchmark.py pool       # handshakes: urllib (1 por requisição) vs pool keep-alive
+    python benchmark.py dates      # parser de datas: cadeia antiga vs DateNormalizer (1M registros)
+    python benchmark.py stages     # tempo de cada etapa do pipeline contra o servidor local
+
+Opções do cenário stages (e do servidor local):
+    --posts 5000 --subs 1000000    # tamanho da base simulada
+    --latency 0.02                 # segundos por resposta
+    --throttle 0.02 --errors 0.01  # fração de respostas 429 / 5xx injetadas
+    --json resultados.json         # grava os resultados (para comparar execuções)
+    --compare base.json            # compara com uma execução anterior e aponta regressões
+
+Requisitos:
+    - Python 3.7+
+    - Nenhuma dependência externa (usa apenas bibliotecas padrão)
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PUB_ID = "pub_benchmark"
+
+
+# ============================================================
+# SERVIDOR LOCAL (stand-in da API do Beehiiv)
+# ============================================================
+class MockBeehiivServer:
+    """Servidor HTTP/1.1 local com keep-alive que responde como a API v2.
+
+    Conta quantas conexões TCP foram aceitas (`connections`), ou seja,
+    quantos handshakes o cliente pagou, e quantas requisições recebeu.
+    Pode injetar latência e respostas 429 (com Retry-After) e 5xx numa
+    fração das requisições, de forma reprodutível (`seed`).
+    """
+
+    # A API v2 só pagina por offset até a página 100 (além dela, lista
+    # vazia); a partir da 99 a resposta traz next_cursor para o cliente
+    # continuar por cursor
+    PAGE_CAP = 100
+    CURSOR_FROM_PAGE = 99
+
+    def __init__(self, posts=200, subscriptions=5000, latency=0.0, throttle=0.0, errors=0.0, seed=1):
+        # Mais novo primeiro; até 10 anos de histórico (vários posts/dia em bases grandes)
+        today = int(time.time()) // 86_400 * 86_400
+        step = min(86_400, 10 * 365 * 86_400 // max(posts, 1))
+        self.posts = [self._make_post(i, today - i * step) for i in range(posts)]
+        self.subscriptions = subscriptions
+        self.sub_step = max(1, 10 * 365 * 86_400 // max(subscriptions, 1))
+        self.sub_start = today - subscriptions * self.sub_step
+        self.latency = latency
+        self.throttle = throttle
+        self.errors = errors
+        self.connections = 0
+        self.requests = 0
+        self.injected = {"429": 0, "5xx": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    @staticmethod
+    def _make_post(i, publish_date=None):
+        return {
+            "id": f"post_{i:06d}",
+            "title": f"Edição {i}",
+            "publish_date": 1_700_000_000 - i * 86_400 if publish_date is None else publish_date,
+            "stats": {
+                "email": {
+                    "recipients": 100_000, "delivered": 99_000 - i, "unique_opens": 40_000 + (i * 37) % 9_000,
+                    "total_opens": 60_000, "unique_clicks": 2_000 + (i * 13) % 900, "total_clicks": 3_500,
+                    "unsubscribes": 40 + i % 30, "spam_reports": i % 3,
+                },
+                "web": {"views": 500 + i % 200, "clicks": 20 + i % 10},
+                "clicks": [
+                    {"url": f"https://example.com/{i % 40}/{j}?utm_source=beehiiv",
+                     "base_url": f"https://example.com/{i % 40}/{j}",
+                     "total_clicks": 100 - j * 7, "total_unique_clicks": 80 - j * 6}
+                    for j in range(12)
+                ],
+            },
+        }
+
+    def _make_subscription(self, idx):
+        return {
+            "id": f"sub_{idx:09d}",
+            "status": "active" if (idx * 7919) % 10 < 8 else "inactive",
+            "created": self.sub_start + idx * self.sub_step,
+        }
+
+    def _page(self, path, query):
+        limit = int(query.get("limit", "10"))
+        if path.endswith("/posts"):
+            total = len(self.posts)
+            items = self.posts if query.get("direction", "desc") == "desc" else self.posts[::-1]
+            get = items.__getitem__
+        elif path.endswith("/subscriptions"):
+            total = self.subscriptions
+            if query.get("direction") == "desc":
+                get = lambda i: self._make_subscription(total - 1 - i)
+            else:
+                get = self._make_subscription
+        else:
+            return None
+        # Cursor (= offset) quando pedido; sem page nem cursor em subscriptions, o export completo
+        if "cursor" in query or ("page" not in query and path.endswith("/subscriptions")):
+            start = int(query.get("cursor") or 0)
+            page = None
+        else:
+            page = int(query.get("page", "1"))
+            start = (page - 1) * limit if page <= self.PAGE_CAP else total
+        stop = min(start + limit, total)
+        payload = {"data": [get(i) for i in range(start, stop)], "limit": limit, "total_results": total,
+                   "total_pages": -(-total // limit)}
+        if page is not None:
+            payload["page"] = page
+        if stop < total and (page is None or page >= self.CURSOR_FROM_PAGE):
+            payload["next_cursor"] = str(stop)
+            payload["has_more"] = True
+        return payload
+
+    def _fault(self):
+        """Sorteia uma falha injetada para esta requisição (None = responde normal)."""
+        with self._lock:
+            roll = self._random.random()
+            if roll < self.throttle:
+                self.injected["429"] += 1
+                return 429
+            if roll < self.throttle + self.errors:
+                self.injected["5xx"] += 1
+                return self._random.choice((500, 502, 503))
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                fault = server._fault()
+                if fault:
+                    self.send_response(fault)
+                    if fault == 429:
+                        self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                url = urllib.parse.urlsplit(self.path)
+                payload = server._page(url.path, dict(urllib.parse.parse_qsl(url.query)))
+                if payload is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    body = gzip.compress(body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def load_analytics(base_url):
+    """Importa beehiiv_analytics apontando para o servidor local.
+
+    O módulo só lê BEEHIIV_BASE_URL no primeiro import; nos cenários
+    seguintes (cada um com seu servidor) BASE_URL, o pool de conexões e o
+    rate limiter são refeitos para o servidor novo, sem reaproveitar
+    conexões keep-alive do servidor anterior.
+    """
+    os.environ["BEEHIIV_BASE_URL"] = base_url
+    os.environ["BEEHIIV_PUB_ID"] = PUB_ID
+    # O servidor local não impõe limite: mede o cliente, não o rate limiter
+    os.environ.setdefault("BEEHIIV_RATE_LIMIT", "1000000")
+    os.environ.setdefault("BEEHIIV_MAX_REQUESTS", "0")
+    # Mede a rede de verdade: sem cache de respostas nem histórico em disco
+    os.environ.setdefault("BEEHIIV_HTTP_CACHE", "")
+    os.environ.setdefault("BEEHIIV_HISTORY_DB", "")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import beehiiv_analytics as ba
+    if ba.BASE_URL != base_url:
+        ba.HTTP_POOL.close()
+        ba.BASE_URL = base_url
+        ba.HTTP_POOL = ba.HTTPConnectionPool(base_url, max_idle=max(ba.FETCH_WORKERS, 4))
+    ba.RATE_LIMITER = ba.RateLimiter(ba.RATE_LIMIT_PER_MINUTE, burst=max(ba.FETCH_WORKERS, 10),
+                                     budget=ba.MAX_REQUESTS_PER_RUN)
+    return ba
+
+
+# ============================================================
+# CENÁRIOS
+# ============================================================
+def bench_pool(requests=200, workers=4):
+    """Compara handshakes/tempo: urlopen por requisição vs HTTPConnectionPool."""
+    server = MockBeehiivServer().start()
+    ba = load_analytics(server.base_url)
+    endpoint = f"/publications/{PUB_ID}/subscriptions"
+    pages = [1 + i % 50 for i in range(requests)]
+
+    def legacy(page):
+        url = f"{server.base_url}{endpoint}?limit=100&page={page}"
+        with urllib.request.urlopen(urllib.request.Request(url, headers=ba.HEADERS), timeout=60) as resp:
+            return json.loads(resp.read())
+
+    def pooled(page):
+        return ba.api_get(endpoint, {"limit": "100", "page": str(page)})
+
+    results = {}
+    for name, fn in (("urllib", legacy), ("pool", pooled)):
+        server.connections = 0
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            ok = sum(1 for r in ex.map(fn, pages) if r and r.get("data"))
+        results[name] = {
+            "requests": requests,
+            "ok": ok,
+            "handshakes": server.connections,
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        print(f"  {name:>6}: {ok}/{requests} ok, {server.connections} handshakes, "
+              f"{results[name]['seconds']}s")
+
+    server.stop()
+    # O pool nunca deve abrir mais conexões do que requisições simultâneas
+    if results["pool"]["handshakes"] > workers or results["pool"]["ok"] != requests:
+        print("  ❌ Pool abriu conexões demais ou falhou requisições")
+        sys.exit(1)
+    return results
+
+
+def legacy_subscriber_month(s):
+    """Cadeia de parsing de datas de subscriber como era antes do DateNormalizer."""
+    created = None
+    for field in ["created_at", "created", "subscribed_at", "joined_at", "utm_created_at"]:
+        if s.get(field):
+            created = s[field]
+            break
+    dt = None
+    if isinstance(created, (int, float)):
+        ts = created / 1000 if created > 1e12 else created
+        try:
+            dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+        except Exception:
+            pass
+    elif isinstance(created, str):
+        for fmt_str in ["%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d"]:
+            try:
+                dt = datetime.strptime(created.replace("Z", "+00:00").replace("+00:00", "+0000"), fmt_str)
+                break
+            except Exception:
+                pass
+        if not dt:
+            try:
+                dt = datetime.fromisoformat(created.replace("Z", "+00:00"))
+            except Exception:
+                pass
+    return dt.strftime("%Y-%m") if dt else None
+
+
+def bench_dates(records=1_000_000):
+    """Compara a cadeia antiga de parsing de datas com o DateNormalizer."""
+    ba = load_analytics(os.environ.get("BEEHIIV_BASE_URL", "http://127.0.0.1:9/v2"))
+    formats = {
+        "epoch_s": lambda i: 1_600_000_000 + i * 37,
+        "epoch_ms": lambda i: (1_600_000_000 + i * 37) * 1000,
+        "iso_z": lambda i: datetime.fromtimestamp(1_600_000_000 + i * 37, tz=timezone.utc)
+                           .strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "iso_offset": lambda i: datetime.fromtimestamp(1_600_000_000 + i * 37, tz=timezone.utc)
+                                .strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+    }
+    results = {}
+    for name, make in formats.items():
+        # Os registros trazem o campo "created" (o 2º da lista), como a API
+        rows = [{"id": i, "created": make(i)} for i in range(records)]
+
+        t0 = time.perf_counter()
+        legacy = [legacy_subscriber_month(r) for r in rows]
+        legacy_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        epochs = ba.DateNormalizer(ba.SUBSCRIBER_DATE_FIELDS).column(rows)
+        new_s = time.perf_counter() - t0
+
+        # Confere o resultado numa amostra
+        for i in range(0, records, max(records // 1000, 1)):
+            month = datetime.fromtimestamp(epochs[i], tz=timezone.utc).strftime("%Y-%m")
+            if month != legacy[i]:
+                print(f"  ❌ {name}: divergência no registro {i}: {month} != {legacy[i]}")
+                sys.exit(1)
+
+        results[name] = {"records": records, "legacy_s": round(legacy_s, 3), "new_s": round(new_s, 3),
+                         "speedup": round(legacy_s / new_s, 1) if new_s else None}
+        print(f"  {name:>10}: antigo {legacy_s:.2f}s, novo {new_s:.2f}s ({results[name]['speedup']}x)")
+
+    # Formas de borda do parser rápido: o epoch tem de bater com datetime.fromisoformat
+    # (0 quando ele rejeita a data)
+    for text in ["2024-03-05T10:15:30+05", "2024-03-05T10:15:30+05:30", "2024-03-05T10:15:30-0330",
+                 "2024-03-05T10:15:30.123456Z", "2024-03-05T10:15:30+05:30:15", "2024-03-05",
+                 "2024-02-29T12:00:00Z", "2024-02-31T12:00:00Z", "2023-02-29", "2024-04-31"]:
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+            expected = int((dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp())
+        except ValueError:
+            expected = 0
+        got = ba.DateNormalizer(ba.SUBSCRIBER_DATE_FIELDS)({"created": text})
+        if got != expected:
+            print(f"  ❌ {text}: {got} != {expected} (fromisoformat)")
+            sys.exit(1)
+    return results
+
+
+def bench_stages(n_posts=5000, subs=200_000, latency=0.0, throttle=0.0, errors=0.0):
+    """Mede cada etapa do pipeline separadamente contra o servidor local.
+
+    Roda numa pasta temporária (sem cache de posts/export de execuções
+    anteriores) e usa o RunReport do próprio script para contar requisições,
+    bytes e retries de cada etapa.
+    """
+    server = MockBeehiivServer(n_posts, subs, latency=latency, throttle=throttle, errors=errors).start()
+    ba = load_analytics(server.base_url)
+    work_dir = tempfile.mkdtemp(prefix="beehiiv_bench_")
+    ba.CURRENT_PUB.set({"id": PUB_ID, "name": PUB_ID, "dir": work_dir})
+    report = ba.RunReport()
+    ba.CURRENT_REPORT.set(report)
+    try:
+        with report.stage("fetch_posts"):
+            raw_posts = ba.fetch_posts()
+        with report.stage("fetch_subscribers"):
+            raw_subs = ba.fetch_subscribers()
+        schema = ba.PostStatsSchema()
+        with report.stage("process_posts"):
+            posts = ba.process_posts(raw_posts, schema)
+        with report.stage("process_subscribers"):
+            subscribers = ba.process_subscribers(raw_subs, posts)
+        with report.stage("generate_dashboard"):
+            html = ba.generate_dashboard(posts, subscribers, schema.sample)
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "config": {"posts": n_posts, "subs": subs, "latency": latency,
+                   "throttle": throttle, "errors": errors},
+        "stages": {s["stage"]: {k: s[k] for k in ("seconds", "requests", "bytes", "retries", "errors")}
+                   for s in report.stages},
+        "server": {"requests": server.requests, "connections": server.connections, "injected": server.injected},
+        "output": {"posts": len(posts), "html_bytes": len(html.encode("utf-8"))},
+    }
+    print()
+    for name, st in results["stages"].items():
+        print(f"  {name:>20}: {st['seconds']:>7.3f}s {st['requests']:>6} req {st['retries']:>4} retries")
+    print(f"  {'servidor':>20}: {server.requests} req, {server.connections} conexões, injetados {server.injected}")
+    return results
+
+
+SCENARIOS = {
+    "pool": bench_pool,
+    "dates": bench_dates,
+    "stages": bench_stages,
+}
+
+
+def _stage_seconds(results):
+    """{cenário.etapa: segundos} de um arquivo de resultados, para comparação."""
+    flat = {}
+    for scenario, data in results.get("scenarios", {}).items():
+        for stage, st in (data or {}).get("stages", {}).items():
+            flat[f"{scenario}.{stage}"] = st["seconds"]
+        for name, st in (data or {}).items():
+            # pool mede "seconds"; dates mede o parser novo em "new_s"
+            seconds = st.get("seconds", st.get("new_s")) if isinstance(st, dict) else None
+            if seconds is not None and name != "stages":
+                flat[f"{scenario}.{name}"] = seconds
+    return flat
+
+
+def compare(current, baseline_path, tolerance=0.10):
+    """Compara com uma execução anterior; retorna as etapas que pioraram além da tolerância."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = _stage_seconds(json.load(f))
+    regressions = []
+    print(f"\n📊 Comparação com {baseline_path} (tolerância {tolerance:.0%}):")
+    for key, seconds in _stage_seconds(current).items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        change = (seconds - before) / before if before else 0
+        flag = "  ❌" if change > tolerance and seconds - before > 0.01 else ""
+        if flag:
+            regressions.append(key)
+        print(f"  {key:<32} {before:>8.3f}s → {seconds:>8.3f}s ({change:+.0%}){flag}")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks offline do beehiiv_analytics.py")
+    parser.add_argument("scenarios", nargs="*", help=f"cenários ({', '.join(SCENARIOS)}); padrão: todos")
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--subs", type=int, default=200_000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--throttle", type=float, default=0.0, help="fração de respostas 429")
+    parser.add_argument("--errors", type=float, default=0.0, help="fração de respostas 5xx")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--compare", help="resultados anteriores para comparar (sai com 1 se houver regressão)")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            print(f"Cenário desconhecido: {name} (disponíveis: {', '.join(SCENARIOS)})")
+            sys.exit(2)
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"\n⏱️  {name}")
+        if name == "stages":
+            results["scenarios"][name] = bench_stages(args.posts, args.subs, args.latency, args.throttle, args.errors)
+        else:
+            results["scenarios"][name] = SCENARIOS[name]()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados: {args.json}")
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])